@@ -0,0 +1,194 @@
+"""
+Unused-permission analysis from AWS service-last-accessed data.
+
+IAM builds the report asynchronously: `generate_service_last_accessed_details`
+starts a job for one principal, and `get_service_last_accessed_details`
+returns IN_PROGRESS until it is ready. `collect` keeps up to MAX_IN_FLIGHT
+jobs running at once. Every round it polls all of them, then backs off
+exponentially while none has finished, so a large account costs a few
+rounds of polling instead of one blocking wait per principal.
+
+The report lists every service the principal's policies grant, with when
+it was last used (None if not in the tracking period). A service that is
+granted but not used for UNUSED_DAYS is an unused-permission finding. See
+`unused_services`.
+
+Runs as a low-priority Celery task after each AWS sync (see
+`analyze_service_access` in core/tasks.py), at most once per MIN_INTERVAL.
+IAM only reports on principals of the account it is asked in, so the
+principals of an Organization's member accounts (core/targets.py) are
+collected per member account, each with that account's client.
+"""
+import logging
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, Q
+from django.utils import timezone
+
+from .models import IAMEntity, ServiceLastAccessed
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'UNUSED_DAYS': 90,
+    'MAX_IN_FLIGHT': 50,        # Jobs running at once per account
+    'THREADS': 8,               # Concurrent submit/poll requests
+    'POLL_INITIAL': 1.0,        # Seconds between polling rounds, doubled while nothing finishes
+    'POLL_MAX': 20.0,
+    'TIMEOUT': 1800,            # Give up on jobs still running after this long
+    'MIN_INTERVAL': 86400,      # AWS refreshes the data a few times a day; don't re-run on every sync
+    'PRIORITY': 9,              # Celery priority of the follow-up task (9 = lowest)
+    'CHUNK_SIZE': 200,          # Entities stored per transaction
+}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'SERVICE_ACCESS', {})}
+
+
+def _submit(iam, arn):
+    try:
+        return iam.generate_service_last_accessed_details(Arn=arn, Granularity='SERVICE_LEVEL')['JobId']
+    except Exception:
+        logger.warning("Service access job failed to start for %s", arn, exc_info=True)
+        return None
+
+
+def _poll(iam, job_id):
+    """(status, services) of one job; services are only read once the job has completed."""
+    try:
+        response = iam.get_service_last_accessed_details(JobId=job_id)
+        if response['JobStatus'] != 'COMPLETED':
+            return response['JobStatus'], None
+
+        services = list(response['ServicesLastAccessed'])
+        while response.get('IsTruncated'):
+            response = iam.get_service_last_accessed_details(JobId=job_id, Marker=response['Marker'])
+            services.extend(response['ServicesLastAccessed'])
+        return 'COMPLETED', services
+    except Exception:
+        # Also a later page: the job's report is incomplete, so it counts as failed
+        logger.warning("Service access job %s could not be read", job_id, exc_info=True)
+        return 'FAILED', None
+
+
+def collect(iam, arns, config=None, sleep=time.sleep):
+    """Yields (arn, services) as jobs finish; services is None when the job failed or timed out."""
+    config = config or get_config()
+    pending = deque(arns)
+    in_flight = {}  # job id -> arn
+    deadline = time.monotonic() + config['TIMEOUT']
+    delay = config['POLL_INITIAL']
+
+    with ThreadPoolExecutor(max_workers=config['THREADS']) as pool:
+        while pending or in_flight:
+            # 1. Keep the window of running jobs full
+            batch = [pending.popleft() for _ in range(min(len(pending), config['MAX_IN_FLIGHT'] - len(in_flight)))]
+            for arn, job_id in zip(batch, pool.map(lambda arn: _submit(iam, arn), batch)):
+                if job_id is None:
+                    yield arn, None
+                else:
+                    in_flight[job_id] = arn
+
+            if not in_flight:
+                continue
+
+            # 2. Wait before polling; the wait doubles while no job finishes
+            sleep(delay)
+
+            # 3. One polling round over every running job
+            job_ids = list(in_flight)
+            finished = 0
+            for job_id, (status, services) in zip(job_ids, pool.map(lambda job_id: _poll(iam, job_id), job_ids)):
+                if status == 'IN_PROGRESS':
+                    continue
+                finished += 1
+                yield in_flight.pop(job_id), services
+            delay = config['POLL_INITIAL'] if finished else min(delay * 2, config['POLL_MAX'])
+
+            if time.monotonic() > deadline:
+                for arn in [*in_flight.values(), *pending]:
+                    yield arn, None
+                return
+
+
+def _store(reports, analyzed_at):
+    """Replaces the service rows of the entities in `reports` (entity id -> services) and updates last_used."""
+    rows, last_used = [], []
+    for entity_id, services in reports.items():
+        used = [s['LastAuthenticated'] for s in services if s.get('LastAuthenticated')]
+        last_used.append(IAMEntity(id=entity_id, last_used=max(used) if used else None))
+        rows.extend(ServiceLastAccessed(
+            entity_id=entity_id,
+            service_namespace=s['ServiceNamespace'],
+            service_name=s.get('ServiceName', s['ServiceNamespace']),
+            last_authenticated=s.get('LastAuthenticated'),
+            last_authenticated_entity=s.get('LastAuthenticatedEntity') or '',
+            last_authenticated_region=s.get('LastAuthenticatedRegion') or '',
+            total_authenticated_entities=s.get('TotalAuthenticatedEntities') or 0,
+            analyzed_at=analyzed_at,
+        ) for s in services)
+
+    with transaction.atomic():
+        ServiceLastAccessed.objects.filter(entity_id__in=list(reports)).delete()
+        ServiceLastAccessed.objects.bulk_create(rows, batch_size=1000)
+        IAMEntity.objects.bulk_update(last_used, ['last_used'], batch_size=1000)
+
+
+def is_due(account, now=None, config=None):
+    config = config or get_config()
+    last = ServiceLastAccessed.objects.filter(entity__cloud_account=account).aggregate(last=Max('analyzed_at'))['last']
+    return last is None or last <= (now or timezone.now()) - timedelta(seconds=config['MIN_INTERVAL'])
+
+
+def refresh_service_access(account, iam_for, config=None, sleep=time.sleep):
+    """
+    Fetches the report for every user and role of an AWS account. Returns
+    (analyzed, failed). `iam_for(target_id)` gives the IAM client of a member
+    account, or of the account itself for None.
+    """
+    config = config or get_config()
+    now = timezone.now()
+    entities = IAMEntity.objects.filter(cloud_account=account, entity_type__in=['user', 'role']).filter(
+        Q(target__isnull=True) | Q(target__is_active=True)
+    )
+    by_target = defaultdict(dict)  # member account id (None for the account itself) -> arn -> entity id
+    for arn, entity_id, target_id in entities.values_list('arn_or_id', 'id', 'target__target_id'):
+        by_target[target_id][arn] = entity_id
+
+    analyzed = failed = 0
+    reports = {}
+    for target_id, entity_ids in by_target.items():
+        try:
+            iam = iam_for(target_id)
+        except Exception:
+            logger.warning("No IAM client for %s of %s; skipping its %d principals", target_id, account.name, len(entity_ids), exc_info=True)
+            failed += len(entity_ids)
+            continue
+        for arn, services in collect(iam, list(entity_ids), config, sleep):
+            if services is None:
+                failed += 1
+                continue
+            reports[entity_ids[arn]] = services
+            analyzed += 1
+            if len(reports) >= config['CHUNK_SIZE']:
+                _store(reports, now)
+                reports = {}
+    if reports:
+        _store(reports, now)
+    return analyzed, failed
+
+
+def unused_services(days=None, cloud_account_ids=None):
+    """ServiceLastAccessed rows for services granted but not used in the last `days` days."""
+    days = days if days is not None else get_config()['UNUSED_DAYS']
+    cutoff = timezone.now() - timedelta(days=days)
+    rows = ServiceLastAccessed.objects.filter(Q(last_authenticated__isnull=True) | Q(last_authenticated__lt=cutoff))
+    if cloud_account_ids is not None:
+        rows = rows.filter(entity__cloud_account_id__in=cloud_account_ids)
+    return rows
@@ -0,0 +1,90 @@
+"""
+API encoding benchmark.
+
+Builds a `/api/policies/` list payload, either generated (the shape
+IAMPolicySerializer returns, with documents from core/generators.py and
+their real scan findings) or serialized from the database, and reports:
+
+- encode time and size with DRF's stdlib JSON renderer and FastJSONRenderer
+- size on the wire and compression time for gzip and brotli at the
+  configured levels (core/compression.py)
+
+Nothing is compared against a baseline: the numbers depend on the payload
+and the machine, and are meant for before/after comparisons.
+"""
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+from rest_framework.renderers import JSONRenderer
+
+from .. import compression, renderers
+from ..documents import document_hash, scan_document
+from ..generators import aws_policy_document, azure_role_document, gcp_binding_document
+
+PLATFORMS = [('aws', 0.6), ('azure', 0.25), ('gcp', 0.15)]
+
+
+def generated_rows(count, seed=42):
+    """Rows shaped like IAMPolicySerializer output."""
+    rng = random.Random(seed)
+    start = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    platforms, weights = zip(*PLATFORMS)
+    rows = []
+    for i in range(1, count + 1):
+        platform = rng.choices(platforms, weights)[0]
+        if platform == 'aws':
+            document = aws_policy_document(rng)
+        elif platform == 'azure':
+            document = azure_role_document(rng)
+        else:
+            document = gcp_binding_document(rng, f"principal-{i}@example.iam.gserviceaccount.com")
+        score, findings, _ = scan_document(document, platform)
+        rows.append({
+            'id': i,
+            'entity_name': f"principal-{rng.randint(1, count // 3 + 1)}",
+            'platform': platform,
+            'name': f"policy-{i}",
+            'document': document,
+            'risk_score': score,
+            'is_vulnerable': score > 50,
+            'finding_details': {'issues': findings},
+            'document_hash': document_hash(document, platform),
+            'updated_at': (start + timedelta(seconds=rng.randint(0, 3600 * 24 * 365))).isoformat().replace('+00:00', 'Z'),
+        })
+    return rows
+
+
+def database_rows(count):
+    from ..models import IAMPolicy
+    from ..serializers import IAMPolicySerializer
+    policies = IAMPolicy.objects.select_related('entity__cloud_account', 'policy_document').order_by('id')[:count]
+    return IAMPolicySerializer(policies, many=True).data
+
+
+def _timed(fn, repeat):
+    """(fastest seconds, result) over `repeat` runs."""
+    best, result = None, None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def run(rows, repeat=3):
+    results = {'rows': len(rows), 'orjson': renderers.orjson is not None, 'brotli': compression.brotli is not None}
+
+    seconds, stdlib = _timed(lambda: JSONRenderer().render(rows), repeat)
+    results['encode'] = {'stdlib': {'seconds': round(seconds, 3), 'bytes': len(stdlib)}}
+    seconds, fast = _timed(lambda: renderers.FastJSONRenderer().render(rows), repeat)
+    results['encode']['fast'] = {'seconds': round(seconds, 3), 'bytes': len(fast)}
+
+    results['wire'] = {'identity': {'seconds': 0.0, 'bytes': len(fast)}}
+    for encoding in ('gzip', 'br'):
+        if encoding == 'br' and compression.brotli is None:
+            continue
+        seconds, compressed = _timed(lambda: compression.compress(fast, encoding), repeat)
+        results['wire'][encoding] = {'seconds': round(seconds, 3), 'bytes': len(compressed)}
+    return results
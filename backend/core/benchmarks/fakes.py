@@ -0,0 +1,326 @@
+"""
+In-process stand-ins for the AWS IAM, Azure Authorization and GCP IAM
+clients. They expose just the surface the fetchers use and serve a
+generated organization, with optional latency and throttling injected.
+
+Throttling is retried inside the fake, the way the real SDKs retry
+internally. Each throttle is reported to the active SyncRecorder, so the
+numbers match what an instrumented real client would report. Requests wait
+for the recorder's rate limiter like instrumented clients do.
+
+AWS orgs with more than one account are served as an Organization
+(`FakeOrganizationsClient`) whose member accounts share the same layout.
+"""
+import itertools
+import random
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+from ..generators import aws_policy_document, azure_role_document
+from ..metrics import get_recorder
+
+
+@dataclass
+class OrgSpec:
+    principals: int = 200
+    policies: int = 100              # Distinct policy documents in the org
+    policies_per_principal: int = 3
+    sharing_ratio: float = 0.8       # Share of attachments that point at a common (managed) policy
+    throttle_rate: float = 0.0       # Probability that any call is throttled before succeeding
+    latency_ms: float = 0.0          # Added to every call
+    groups: int = 10                 # AWS only: each principal joins up to two groups
+    inline_ratio: float = 0.2        # AWS only: share of principals with an inline policy
+    roles: int = 20                  # AWS only: roles, trusted by the account, some users or another role
+    accounts: int = 1                # AWS only: more than one syncs an Organization of that many identical accounts
+    page_size: int = 100
+    seed: int = 42
+
+
+class FakeOrg:
+    """Deterministic org: principals and which policy documents each one has attached."""
+
+    def __init__(self, spec):
+        self.spec = spec
+        rng = random.Random(spec.seed)
+        shared = max(1, int(spec.policies * spec.sharing_ratio))
+
+        self.documents = [aws_policy_document(rng) for _ in range(spec.policies)]
+        self.azure_documents = [azure_role_document(rng) for _ in range(spec.policies)]
+        self.attachments = []
+        for i in range(spec.principals):
+            picked = set()
+            for _ in range(spec.policies_per_principal):
+                if rng.random() < spec.sharing_ratio:
+                    picked.add(rng.randrange(shared))
+                else:
+                    picked.add(rng.randrange(shared, spec.policies) if spec.policies > shared else rng.randrange(spec.policies))
+            self.attachments.append(sorted(picked))
+
+        self.memberships = [sorted(set(rng.sample(range(spec.groups), min(spec.groups, rng.randint(0, 2))))) for _ in range(spec.principals)]
+        self.group_attachments = [[rng.randrange(spec.policies)] for _ in range(spec.groups)]
+        self.inline = [aws_policy_document(rng) if rng.random() < spec.inline_ratio else None for _ in range(spec.principals)]
+
+        self.role_attachments = [sorted(set(rng.randrange(spec.policies) for _ in range(rng.randint(1, 2)))) for _ in range(spec.roles)]
+        self.role_inline = [aws_policy_document(rng) if rng.random() < spec.inline_ratio else None for _ in range(spec.roles)]
+        self.role_trust = []
+        for r in range(spec.roles):
+            roll = rng.random()
+            if roll < 0.4 or not spec.principals:
+                principals = ['arn:aws:iam::123456789012:root']
+            elif roll < 0.8 or r == 0:
+                principals = [f"arn:aws:iam::123456789012:user/bench-user-{rng.randrange(spec.principals)}" for _ in range(rng.randint(1, 2))]
+            else:
+                principals = [f"arn:aws:iam::123456789012:role/bench-role-{rng.randrange(r)}"]
+            self.role_trust.append({
+                'Version': '2012-10-17',
+                'Statement': [{'Effect': 'Allow', 'Principal': {'AWS': principals}, 'Action': 'sts:AssumeRole'}],
+            })
+
+
+class _FakeClientBase:
+    # The AWS fetcher relies on botocore events to count calls, which the fake
+    # doesn't have, so it records them itself. The Azure/GCP fetchers already
+    # count calls through recorder.call/timed_iter.
+    records_calls = False
+
+    def __init__(self, org):
+        self.org = org
+        self.spec = org.spec
+        self.rng = random.Random(self.spec.seed + 1)
+
+    def _call(self, operation):
+        """Simulates one request, including latency and SDK-style retries on throttling."""
+        recorder = get_recorder()
+        recorder.pace()
+        start = time.perf_counter()
+        attempt = 0
+        while self.spec.throttle_rate and self.rng.random() < self.spec.throttle_rate and attempt < 5:
+            attempt += 1
+            recorder.record_retries(throttles=1, retries=1)
+            time.sleep(min(0.001 * 2 ** attempt, 0.05))
+        if self.spec.latency_ms:
+            time.sleep(self.spec.latency_ms / 1000)
+        if self.records_calls:
+            recorder.record_call(operation, time.perf_counter() - start)
+
+
+# --- AWS ---
+
+class _FakePaginator:
+    def __init__(self, client, operation, key, count, build):
+        self.client, self.operation, self.key, self.count, self.build = client, operation, key, count, build
+
+    def paginate(self):
+        size = self.client.spec.page_size
+        for offset in range(0, self.count, size):
+            self.client._call(self.operation)
+            yield {self.key: [self.build(i) for i in range(offset, min(offset + size, self.count))]}
+
+
+class FakeIAMClient(_FakeClientBase):
+    """boto3 `iam` client stand-in."""
+
+    records_calls = True
+    created = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+    def __init__(self, org, account_id='123456789012'):
+        super().__init__(org)
+        self.account_id = account_id
+        self.jobs = {}  # job id -> [arn, polls left before it completes]
+        self.job_ids = itertools.count()
+
+    def _user(self, i):
+        return {'UserName': f"bench-user-{i}", 'Arn': f"arn:aws:iam::{self.account_id}:user/bench-user-{i}", 'CreateDate': self.created}
+
+    def _policy_arn(self, index):
+        return f"arn:aws:iam::{self.account_id}:policy/bench-policy-{index}"
+
+    def _role(self, i):
+        return {
+            'RoleName': f"bench-role-{i}", 'Arn': f"arn:aws:iam::{self.account_id}:role/bench-role-{i}",
+            'CreateDate': self.created, 'AssumeRolePolicyDocument': self.org.role_trust[i],
+        }
+
+    def get_paginator(self, name):
+        if name == 'list_users':
+            return _FakePaginator(self, 'iam.ListUsers', 'Users', self.spec.principals, self._user)
+        assert name == 'list_roles', f"FakeIAMClient has no paginator for {name}"
+        return _FakePaginator(self, 'iam.ListRoles', 'Roles', self.spec.roles, self._role)
+
+    def list_attached_user_policies(self, UserName):
+        self._call('iam.ListAttachedUserPolicies')
+        i = int(UserName.rsplit('-', 1)[1])
+        return {'AttachedPolicies': [
+            {'PolicyName': f"bench-policy-{p}", 'PolicyArn': self._policy_arn(p)} for p in self.org.attachments[i]
+        ]}
+
+    def list_user_policies(self, UserName):
+        self._call('iam.ListUserPolicies')
+        i = int(UserName.rsplit('-', 1)[1])
+        return {'PolicyNames': ['bench-inline'] if self.org.inline[i] else []}
+
+    def get_user_policy(self, UserName, PolicyName):
+        self._call('iam.GetUserPolicy')
+        i = int(UserName.rsplit('-', 1)[1])
+        return {'UserName': UserName, 'PolicyName': PolicyName, 'PolicyDocument': self.org.inline[i]}
+
+    def list_groups_for_user(self, UserName):
+        self._call('iam.ListGroupsForUser')
+        i = int(UserName.rsplit('-', 1)[1])
+        return {'Groups': [
+            {'GroupName': f"bench-group-{g}", 'Arn': f"arn:aws:iam::{self.account_id}:group/bench-group-{g}", 'CreateDate': self.created}
+            for g in self.org.memberships[i]
+        ]}
+
+    def list_attached_group_policies(self, GroupName):
+        self._call('iam.ListAttachedGroupPolicies')
+        g = int(GroupName.rsplit('-', 1)[1])
+        return {'AttachedPolicies': [
+            {'PolicyName': f"bench-policy-{p}", 'PolicyArn': self._policy_arn(p)} for p in self.org.group_attachments[g]
+        ]}
+
+    def list_attached_role_policies(self, RoleName):
+        self._call('iam.ListAttachedRolePolicies')
+        r = int(RoleName.rsplit('-', 1)[1])
+        return {'AttachedPolicies': [
+            {'PolicyName': f"bench-policy-{p}", 'PolicyArn': self._policy_arn(p)} for p in self.org.role_attachments[r]
+        ]}
+
+    def list_role_policies(self, RoleName):
+        self._call('iam.ListRolePolicies')
+        r = int(RoleName.rsplit('-', 1)[1])
+        return {'PolicyNames': ['bench-inline'] if self.org.role_inline[r] else []}
+
+    def get_role_policy(self, RoleName, PolicyName):
+        self._call('iam.GetRolePolicy')
+        r = int(RoleName.rsplit('-', 1)[1])
+        return {'RoleName': RoleName, 'PolicyName': PolicyName, 'PolicyDocument': self.org.role_inline[r]}
+
+    def get_policy(self, PolicyArn):
+        self._call('iam.GetPolicy')
+        return {'Policy': {'Arn': PolicyArn, 'DefaultVersionId': 'v1'}}
+
+    def get_policy_version(self, PolicyArn, VersionId):
+        self._call('iam.GetPolicyVersion')
+        index = int(PolicyArn.rsplit('-', 1)[1])
+        return {'PolicyVersion': {'VersionId': VersionId, 'Document': self.org.documents[index]}}
+
+
+    # Service last-accessed jobs finish after a few polls, like the real asynchronous API
+    services = ['s3', 'ec2', 'iam', 'lambda', 'dynamodb', 'kms', 'sts', 'logs', 'sqs', 'sns']
+
+    def generate_service_last_accessed_details(self, Arn, Granularity='SERVICE_LEVEL'):
+        self._call('iam.GenerateServiceLastAccessedDetails')
+        if f":{self.account_id}:" not in Arn:
+            raise ValueError(f"NoSuchEntity: {Arn} is not in account {self.account_id}")
+        job_id = f"job-{next(self.job_ids)}"
+        self.jobs[job_id] = [Arn, random.Random(Arn).randint(0, 3)]
+        return {'JobId': job_id}
+
+    def get_service_last_accessed_details(self, JobId, Marker=None):
+        self._call('iam.GetServiceLastAccessedDetails')
+        job = self.jobs[JobId]
+        if job[1] > 0:
+            job[1] -= 1
+            return {'JobStatus': 'IN_PROGRESS'}
+
+        rng = random.Random(job[0])
+        report = []
+        for namespace in rng.sample(self.services, rng.randint(2, len(self.services))):
+            used = rng.random() < 0.6
+            report.append({
+                'ServiceName': namespace.upper(),
+                'ServiceNamespace': namespace,
+                'LastAuthenticated': datetime(2026, 1, 1, tzinfo=timezone.utc) + timedelta(days=rng.randint(0, 290)) if used else None,
+                'LastAuthenticatedEntity': job[0] if used else None,
+                'TotalAuthenticatedEntities': 1 if used else 0,
+            })
+        return {'JobStatus': 'COMPLETED', 'ServicesLastAccessed': report, 'IsTruncated': False}
+
+
+class FakeOrganizationsClient(_FakeClientBase):
+    """boto3 `organizations` client stand-in, listing `spec.accounts` member accounts."""
+
+    records_calls = True
+
+    def account_ids(self):
+        return [f"{100000000000 + i:012d}" for i in range(self.spec.accounts)]
+
+    def get_paginator(self, name):
+        assert name == 'list_accounts', f"FakeOrganizationsClient has no paginator for {name}"
+        ids = self.account_ids()
+        return _FakePaginator(self, 'organizations.ListAccounts', 'Accounts', len(ids), lambda i: {
+            'Id': ids[i], 'Name': f"bench-account-{i}", 'Status': 'ACTIVE',
+        })
+
+    def clients(self):
+        """The `clients` argument of core.targets.sync_targets: this client and an IAM client per member account."""
+        return {'targets': self, **{account_id: FakeIAMClient(self.org, account_id) for account_id in self.account_ids()}}
+
+
+# --- AZURE ---
+
+class _FakeItemPaged:
+    def __init__(self, client, operation, items):
+        self.client, self.operation, self.items = client, operation, items
+
+    def by_page(self):
+        size = self.client.spec.page_size
+        for offset in range(0, len(self.items), size):
+            self.client._call(self.operation)
+            yield iter(self.items[offset:offset + size])
+
+    def __iter__(self):
+        for page in self.by_page():
+            yield from page
+
+
+class FakeAuthorizationClient(_FakeClientBase):
+    """azure.mgmt.authorization `AuthorizationManagementClient` stand-in."""
+
+    def __init__(self, org):
+        super().__init__(org)
+        self.role_assignments = SimpleNamespace(list_for_subscription=self._list_assignments)
+        self.role_definitions = SimpleNamespace(get_by_id=self._get_definition)
+
+    def _list_assignments(self):
+        assignments = [
+            SimpleNamespace(principal_id=f"{i:08d}-0000-0000-0000-000000000000", role_definition_id=f"/roleDefinitions/{p}")
+            for i, attached in enumerate(self.org.attachments) for p in attached
+        ]
+        return _FakeItemPaged(self, 'authorization.role_assignments.list_for_subscription', assignments)
+
+    def _get_definition(self, role_definition_id):
+        self._call('authorization.role_definitions.get_by_id')
+        index = int(role_definition_id.rsplit('/', 1)[1])
+        actions = self.org.azure_documents[index]['actions']
+        return SimpleNamespace(role_name=f"bench-role-{index}", permissions=[SimpleNamespace(actions=actions)])
+
+
+# --- GCP ---
+
+class FakeGCPIAMClient(_FakeClientBase):
+    """google.cloud IAM client stand-in (service account listing)."""
+
+    def list_service_accounts(self, name):
+        accounts = [
+            SimpleNamespace(email=f"bench-sa-{i}@bench-project.iam.gserviceaccount.com", unique_id=str(10 ** 20 + i))
+            for i in range(self.spec.principals)
+        ]
+        size = self.spec.page_size
+
+        def pages():
+            for offset in range(0, len(accounts), size):
+                self._call('iam.list_service_accounts')
+                yield SimpleNamespace(accounts=accounts[offset:offset + size])
+
+        return SimpleNamespace(pages=pages())
+
+
+FAKE_CLIENTS = {
+    'aws': FakeIAMClient,
+    'azure': FakeAuthorizationClient,
+    'gcp': FakeGCPIAMClient,
+}
@@ -0,0 +1,172 @@
+"""
+Offline sync benchmark.
+
+Each scenario builds a fake organization and runs the real fetcher against
+it (for AWS orgs of several accounts, the multi-target sync of
+core/targets.py), or for the -snapshot scenarios ingests a dump of it
+written by core/benchmarks/snapshots.py, plus the index refresh that
+follows, inside a transaction that is rolled back afterwards. It reports end-to-end time, API
+calls, DB writes and the sync pipeline's stages (core/pipeline.py). Results
+are compared against the stored baseline in `baseline.json`. Call and write
+counts are deterministic, so any increase is flagged; wall time is flagged
+past a tolerance. Wall time depends on the machine and database, so record
+the baseline (`bench_sync --update-baseline`) where the comparison will run.
+"""
+import json
+import tempfile
+import time
+import tracemalloc
+from dataclasses import asdict
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.test import override_settings
+
+from ..metrics import SyncRecorder
+from ..models import CloudAccount, User
+from .. import tasks
+from ..snapshots import Snapshot
+from .fakes import FAKE_CLIENTS, FakeOrg, FakeOrganizationsClient, OrgSpec
+from .snapshots import SNAPSHOT_WRITERS
+
+BASELINE_PATH = Path(__file__).with_name('baseline.json')
+
+SCENARIOS = {
+    'aws-small': ('aws', OrgSpec(principals=200, policies=60)),
+    'aws-shared': ('aws', OrgSpec(principals=1000, policies=50, sharing_ratio=0.95)),
+    'aws-throttled': ('aws', OrgSpec(principals=300, policies=100, throttle_rate=0.1)),
+    'azure-small': ('azure', OrgSpec(principals=300, policies=40)),
+    'gcp-small': ('gcp', OrgSpec(principals=500, policies=1, policies_per_principal=1)),
+    'aws-org': ('aws', OrgSpec(principals=50, policies=60, roles=5, accounts=8, latency_ms=2)),
+    'aws-snapshot': ('aws', OrgSpec(principals=500, policies=100)),
+    'azure-snapshot': ('azure', OrgSpec(principals=500, policies=40)),
+}
+
+SNAPSHOT_SCENARIOS = {'aws-snapshot', 'azure-snapshot'}
+
+# Multi-target scenarios measure the crawl, not the request rate configured for real APIs
+UNPACED = {**getattr(settings, 'SYNC_TARGETS', {}), 'RATE': None}
+
+# Metrics compared against the baseline, and whether they are exact counts
+COMPARED = {
+    'api_calls': True,
+    'db_writes': True,
+    'db_queries': True,
+    'seconds': False,
+}
+
+
+class _Rollback(Exception):
+    pass
+
+
+class _QueryCounter:
+    def __init__(self):
+        self.queries = 0
+        self.writes = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries += 1
+        if sql.lstrip()[:6].upper() in ('INSERT', 'UPDATE', 'DELETE'):
+            self.writes += 1
+        return execute(sql, params, many, context)
+
+
+def run_scenario(platform, spec, trace_memory=False, snapshot=False):
+    """
+    `trace_memory` also reports the peak of Python allocations during the
+    sync (slower; not compared). `snapshot` ingests a dump of the org
+    instead of calling the fake API.
+    """
+    org = FakeOrg(spec)
+    client = FAKE_CLIENTS[platform](org)
+    if spec.accounts > 1:
+        client = FakeOrganizationsClient(org).clients()
+    if snapshot:
+        dump = tempfile.NamedTemporaryFile('w', suffix='.json')
+        SNAPSHOT_WRITERS[platform](org, dump)
+        dump.flush()
+    recorder = SyncRecorder()
+    counter = _QueryCounter()
+    result = {}
+
+    try:
+        with transaction.atomic():
+            user = User.objects.create_user(email=f"bench-{time.time_ns()}@sentinel.local")
+            account = CloudAccount.objects.create(
+                user=user, name=f"Benchmark {platform.upper()}", platform=platform, enumerate_targets=spec.accounts > 1,
+                extra_config={'service_account_json': {'project_id': 'bench-project'}},
+            )
+            connection = connections['default']
+            if trace_memory:
+                tracemalloc.start()
+            with connection.execute_wrapper(counter), recorder.activate(), override_settings(SYNC_TARGETS=UNPACED):
+                start = time.perf_counter()
+                if snapshot:
+                    tasks.sync_account(account, snapshot=Snapshot(dump.name))
+                else:
+                    tasks.sync_account(account, client)
+                seconds = time.perf_counter() - start
+            if trace_memory:
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+
+            result = {
+                'platform': platform,
+                'spec': asdict(spec),
+                'seconds': round(seconds, 3),
+                'principals_per_second': round(spec.principals * spec.accounts / seconds, 1) if seconds else None,
+                'api_calls': sum(stats['count'] for stats in recorder.api_calls.values()),
+                'api_calls_by_operation': {op: stats['count'] for op, stats in sorted(recorder.api_calls.items())},
+                'throttles': recorder.throttles,
+                'db_queries': counter.queries,
+                'db_writes': counter.writes,
+                'rows_written': recorder.rows_written,
+                'rows_skipped': recorder.rows_skipped,
+                'phase_ms': {name: round(s * 1000, 1) for name, s in recorder.phase_seconds.items()},
+                'pipeline': recorder.stages,
+                'targets': recorder.targets,
+            }
+            if trace_memory:
+                result['peak_traced_kb'] = peak // 1024
+            raise _Rollback
+    except _Rollback:
+        pass
+    finally:
+        if snapshot:
+            dump.close()
+
+    return result
+
+
+def load_baseline(path=BASELINE_PATH):
+    if not Path(path).exists():
+        return {}
+    return json.loads(Path(path).read_text())
+
+
+def save_baseline(results, path=BASELINE_PATH):
+    baseline = load_baseline(path)
+    for name, result in results.items():
+        baseline[name] = {key: result[key] for key in ('spec', *COMPARED)}
+    Path(path).write_text(json.dumps(baseline, indent=2, sort_keys=True) + '\n')
+
+
+def compare(name, result, baseline, tolerance):
+    """Returns human-readable regressions for one scenario (empty list if none)."""
+    expected = baseline.get(name)
+    if not expected:
+        return []
+    if expected.get('spec') != result['spec']:
+        return [f"{name}: scenario changed since the baseline was recorded, re-run with --update-baseline"]
+
+    regressions = []
+    for metric, exact in COMPARED.items():
+        old, new = expected.get(metric), result[metric]
+        if old is None:
+            continue
+        limit = old if exact else old * (1 + tolerance)
+        if new > limit:
+            regressions.append(f"{name}: {metric} went from {old} to {new}")
+    return regressions
@@ -0,0 +1,67 @@
+"""
+Startup benchmark.
+
+Each scenario starts a fresh interpreter, runs django.setup() and imports
+the modules a process of that kind loads, then reports the import time and
+the resident memory they add (read from /proc, so Linux only). `web` and
+`worker` must not load any SDK; the provider scenarios show what each cloud
+SDK costs the first time a sync for that platform runs. `eager` imports every SDK up
+front, which is what every process paid before they were loaded lazily.
+"""
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+from django.conf import settings
+
+BACKEND_DIR = Path(__file__).resolve().parents[2]
+
+SCENARIOS = {
+    'django': [],
+    'web': ['core.views', 'iam_backend.urls'],
+    'worker': ['core.tasks'],
+    'aws': ['core.tasks', 'core.providers.aws'],
+    'azure': ['core.tasks', 'core.providers.azure'],
+    'gcp': ['core.tasks', 'core.providers.gcp'],
+    'eager': ['core.tasks', 'core.providers.aws', 'core.providers.azure', 'core.providers.gcp'],
+}
+
+# Runs in the child; prints "<seconds> <peak RSS KiB> <RSS added by the imports KiB> <SDKs loaded>"
+CHILD = """
+import importlib, os, resource, sys, time
+import django
+
+def rss():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') // 1024
+
+django.setup()
+base = rss()
+start = time.perf_counter()
+for name in sys.argv[1:]:
+    importlib.import_module(name)
+seconds = time.perf_counter() - start
+from core.providers import SDK_MODULES
+sdks = [platform for platform, modules in SDK_MODULES.items() if any(m in sys.modules for m in modules)]
+print(round(seconds, 3), resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, rss() - base, ','.join(sdks) or '-')
+"""
+
+
+def run_scenario(modules):
+    env = {
+        **os.environ,
+        'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', settings.SETTINGS_MODULE),
+        'PYTHONPATH': os.pathsep.join(filter(None, [str(BACKEND_DIR), os.environ.get('PYTHONPATH')])),
+    }
+    output = subprocess.run(
+        [sys.executable, '-c', CHILD, *modules], env=env, cwd=BACKEND_DIR,
+        capture_output=True, text=True, check=True,
+    ).stdout.split()
+    seconds, maxrss, added, sdks = output[-4:]
+    return {
+        'import_seconds': float(seconds),
+        'maxrss_mb': round(int(maxrss) / 1024, 1),
+        'import_mb': round(int(added) / 1024, 1),
+        'sdks': [] if sdks == '-' else sdks.split(','),
+    }
@@ -0,0 +1,110 @@
+"""
+Snapshot fixtures for the bench_sync snapshot scenarios.
+
+Writes the fake organization of core/benchmarks/fakes.py in the formats
+core/snapshots.py ingests, item by item, so fixtures of any size can be
+generated. Names and documents come from the fake clients, so ingesting a
+fixture leaves the same entities and policies as an API sync of the same
+org. Only groups with members are written, as the API fetcher only sees
+those.
+"""
+import json
+
+from .fakes import FakeAuthorizationClient, FakeIAMClient
+
+
+def _default(value):
+    return value.isoformat()  # CreateDate
+
+
+def _write_array(f, items):
+    f.write('[')
+    for i, item in enumerate(items):
+        if i:
+            f.write(',')
+        f.write(json.dumps(item, default=_default))
+    f.write(']')
+
+
+def _write_object(f, sections):
+    f.write('{')
+    for i, (key, items) in enumerate(sections):
+        if i:
+            f.write(',')
+        f.write(f'{json.dumps(key)}:')
+        _write_array(f, items)
+    f.write('}')
+
+
+def write_aws_snapshot(org, f):
+    """An `aws iam get-account-authorization-details` dump of `org`."""
+    client = FakeIAMClient(org)
+
+    def users():
+        for i in range(org.spec.principals):
+            user = client._user(i)
+            yield {
+                **user,
+                'UserPolicyList': [{'PolicyName': 'bench-inline', 'PolicyDocument': org.inline[i]}] if org.inline[i] else [],
+                'GroupList': [f"bench-group-{g}" for g in org.memberships[i]],
+                'AttachedManagedPolicies': client.list_attached_user_policies(UserName=user['UserName'])['AttachedPolicies'],
+            }
+
+    def groups():
+        for g in sorted(set().union(*org.memberships)):
+            name = f"bench-group-{g}"
+            yield {
+                'GroupName': name, 'Arn': f"arn:aws:iam::123456789012:group/{name}", 'CreateDate': client.created,
+                'GroupPolicyList': [],
+                'AttachedManagedPolicies': client.list_attached_group_policies(GroupName=name)['AttachedPolicies'],
+            }
+
+    def roles():
+        for r in range(org.spec.roles):
+            role = client._role(r)
+            yield {
+                **role,
+                'RolePolicyList': [{'PolicyName': 'bench-inline', 'PolicyDocument': org.role_inline[r]}] if org.role_inline[r] else [],
+                'AttachedManagedPolicies': client.list_attached_role_policies(RoleName=role['RoleName'])['AttachedPolicies'],
+            }
+
+    def policies():
+        for index, document in enumerate(org.documents):
+            yield {
+                'PolicyName': f"bench-policy-{index}", 'Arn': client._policy_arn(index), 'DefaultVersionId': 'v1',
+                'PolicyVersionList': [{'Document': document, 'VersionId': 'v1', 'IsDefaultVersion': True}],
+            }
+
+    _write_object(f, [('UserDetailList', users()), ('GroupDetailList', groups()), ('RoleDetailList', roles()), ('Policies', policies())])
+
+
+def write_azure_snapshot(org, f):
+    """Role assignments and definitions of `org`, in one file."""
+    client = FakeAuthorizationClient(org)
+    prefix = '/subscriptions/bench/providers/Microsoft.Authorization/roleDefinitions'
+
+    def assignments():
+        for assignment in client.role_assignments.list_for_subscription():
+            index = assignment.role_definition_id.rsplit('/', 1)[1]
+            yield {
+                'principalId': assignment.principal_id,
+                'principalName': f"Azure-Principal-{assignment.principal_id[:8]}",
+                'principalType': 'User',
+                'roleDefinitionId': f"{prefix}/{index}",
+                'roleDefinitionName': f"bench-role-{index}",
+            }
+
+    def definitions():
+        for index, document in enumerate(org.azure_documents):
+            yield {
+                'id': f"{prefix}/{index}", 'name': str(index), 'roleName': f"bench-role-{index}",
+                'permissions': [{'actions': document['actions']}],
+            }
+
+    _write_object(f, [('roleAssignments', assignments()), ('roleDefinitions', definitions())])
+
+
+SNAPSHOT_WRITERS = {
+    'aws': write_aws_snapshot,
+    'azure': write_azure_snapshot,
+}
@@ -0,0 +1,142 @@
+"""
+Document storage benchmark.
+
+Takes PolicyDocument bodies (document, finding_details, statement_results),
+either generated (documents from core/generators.py with their real scan
+results) or read from the database, and reports for each way of storing
+them (core/storage.py):
+
+- json: UTF-8 JSON, what MODE 'json' stores
+- zstd: zstd at the configured level, one value at a time
+- zstd+dict: the same with a dictionary trained on a separate sample, as
+  `compress_documents --train` does
+
+the bytes stored, the ratio to JSON and the time to encode and decode one
+value. With --from-db it also times loading documents from the database with
+and without reading their bodies (loading alone doesn't decompress them) and,
+on PostgreSQL, reports the columns' size on disk.
+
+Like bench_api, nothing is compared against a baseline.
+"""
+import json
+import random
+import time
+
+from django.db import connection
+
+from .. import storage
+from ..generators import aws_policy_document, azure_role_document, gcp_binding_document
+from ..scanner import scan_document
+
+PLATFORMS = [('aws', 0.6), ('azure', 0.25), ('gcp', 0.15)]
+FIELDS = ('document', 'finding_details', 'statement_results')
+
+
+def generated_bodies(count, seed=42):
+    """Lists of [document, finding_details, statement_results] values."""
+    rng = random.Random(seed)
+    platforms, weights = zip(*PLATFORMS)
+    bodies = []
+    for i in range(count):
+        platform = rng.choices(platforms, weights)[0]
+        if platform == 'aws':
+            document = aws_policy_document(rng)
+        elif platform == 'azure':
+            document = azure_role_document(rng)
+        else:
+            document = gcp_binding_document(rng, f"principal-{i}@example.iam.gserviceaccount.com")
+        _, findings, statement_results = scan_document(document, platform)
+        bodies.append([document, {'issues': findings}, statement_results])
+    return bodies
+
+
+def database_bodies(count, offset=0):
+    from ..models import PolicyDocument
+    rows = PolicyDocument.objects.order_by('hash').values_list(*FIELDS)[offset:offset + count]
+    return [[storage.decode(value) for value in row] for row in rows]
+
+
+def _timed(fn, repeat):
+    """Fastest seconds over `repeat` runs, and the result."""
+    best, result = None, None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def _codecs(training, config):
+    """name -> (encode, decode) of JSON values, matching what storage.encode and storage.decode do."""
+    codecs = {'json': (storage._dumps, json.loads)}
+    if storage.zstandard is None:
+        return codecs
+    zstd = storage.zstandard
+    plain = zstd.ZstdCompressor(level=config['LEVEL']), zstd.ZstdDecompressor()
+    codecs['zstd'] = _zstd_codec(*plain, config)
+    samples = [storage._dumps(value) for body in training for value in body if value]
+    try:
+        dictionary = zstd.train_dictionary(config['DICT_SIZE'], samples)
+    except zstd.ZstdError:
+        return codecs  # Too few samples to train on
+    codecs['zstd+dict'] = _zstd_codec(zstd.ZstdCompressor(level=config['LEVEL'], dict_data=dictionary), zstd.ZstdDecompressor(dict_data=dictionary), config)
+    return codecs
+
+
+def _zstd_codec(compressor, decompressor, config):
+    def encode(value):
+        raw = storage._dumps(value)
+        if len(raw) < config['MIN_SIZE']:
+            return raw
+        compressed = compressor.compress(raw)
+        return compressed if len(compressed) < len(raw) else raw
+
+    def decode(data):
+        return json.loads(decompressor.decompress(data) if data[:4] == storage.ZSTD_MAGIC else data)
+    return encode, decode
+
+
+def run(bodies, training, repeat=3, config=None):
+    """Sizes and codec times for `bodies`; `training` is the disjoint sample the dictionary is trained on."""
+    config = config or storage.get_config()
+    values = [value for body in bodies for value in body]
+    raw_size = sum(len(storage._dumps(value)) for value in values)
+    results = {'values': len(values), 'documents': len(bodies), 'zstandard': storage.zstandard is not None, 'modes': {}}
+    for name, (encode, decode) in _codecs(training, config).items():
+        encode_seconds, stored = _timed(lambda: [encode(value) for value in values], repeat)
+        decode_seconds, _ = _timed(lambda: [decode(value) for value in stored], repeat)
+        size = sum(len(value) for value in stored)
+        results['modes'][name] = {
+            'bytes': size,
+            'ratio': round(size / max(raw_size, 1), 3),
+            'encode_us': round(encode_seconds / max(len(values), 1) * 1e6, 2),
+            'decode_us': round(decode_seconds / max(len(values), 1) * 1e6, 2),
+        }
+    return results
+
+
+def database_reads(count, repeat=3):
+    """Seconds to load `count` PolicyDocuments, without and with reading their bodies; column sizes on PostgreSQL."""
+    from ..models import PolicyDocument
+
+    def load(read):
+        for document in PolicyDocument.objects.order_by('hash')[:count]:
+            if read:
+                for field in FIELDS:
+                    getattr(document, field)
+
+    results = {
+        'documents': min(count, PolicyDocument.objects.count()),
+        'load_seconds': round(_timed(lambda: load(False), repeat)[0], 3),
+        'load_and_read_seconds': round(_timed(lambda: load(True), repeat)[0], 3),
+    }
+    if connection.vendor == 'postgresql':
+        # pg_column_size is the stored size, after TOAST's own compression if any
+        sizes = ', '.join(f"sum(pg_column_size({field}))" for field in FIELDS)
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT {sizes}, pg_total_relation_size('core_policydocument') FROM core_policydocument")
+            *columns, table = cursor.fetchone()
+        results['column_bytes'] = dict(zip(FIELDS, (int(size or 0) for size in columns)))
+        results['table_bytes'] = table
+    return results
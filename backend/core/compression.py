@@ -0,0 +1,121 @@
+"""
+Response compression for the API.
+
+`CompressionMiddleware` compresses JSON and text responses of at least
+MIN_SIZE bytes with the best encoding the client accepts: brotli if the
+`brotli` package is installed and the client sends `br`, otherwise gzip.
+Policy lists are mostly repetitive nested JSON and shrink to a few percent
+of their size, which matters far more on the wire than the CPU it costs.
+
+Gzip uses Django's own helpers, including the random padding that
+GZipMiddleware adds against BREACH. Replaces django.middleware.gzip, so
+don't enable both.
+"""
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_sequence, compress_string
+
+try:
+    import brotli
+except ImportError:  # Optional: `pip install brotli`
+    brotli = None
+
+DEFAULTS = {
+    'MIN_SIZE': 1024,                # Smaller responses aren't worth it
+    'BROTLI_QUALITY': 5,             # 0-11; 4-6 is the usual range for dynamic content
+    'CONTENT_TYPES': ('application/json', 'text/'),
+}
+
+GZIP_RANDOM_BYTES = 100  # As in GZipMiddleware
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'API_COMPRESSION', {})}
+
+
+def accepted_encodings(header):
+    """{coding: q} from an Accept-Encoding header."""
+    accepted = {}
+    for item in header.split(','):
+        coding, _, params = item.strip().partition(';')
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(';'):
+            name, _, value = param.strip().partition('=')
+            if name == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding.strip().lower()] = q
+    return accepted
+
+
+def choose_encoding(header):
+    """'br', 'gzip' or None for an Accept-Encoding header; brotli wins ties."""
+    accepted = accepted_encodings(header)
+    available = ['br', 'gzip'] if brotli is not None else ['gzip']
+    best, best_q = None, 0.0
+    for coding in available:
+        q = accepted.get(coding, accepted.get('*', 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def compress(content, encoding, config=None):
+    if encoding == 'br':
+        return brotli.compress(content, quality=(config or get_config())['BROTLI_QUALITY'])
+    return compress_string(content, max_random_bytes=GZIP_RANDOM_BYTES)
+
+
+def _brotli_sequence(chunks, quality):
+    compressor = brotli.Compressor(quality=quality)
+    for chunk in chunks:
+        data = compressor.process(chunk) + compressor.flush()
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+class CompressionMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        config = get_config()
+
+        content_type = response.get('Content-Type', '')
+        if response.has_header('Content-Encoding') or not content_type.startswith(tuple(config['CONTENT_TYPES'])):
+            return response
+        if not response.streaming and len(response.content) < config['MIN_SIZE']:
+            return response
+        if response.streaming and response.is_async:
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = choose_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            if encoding == 'br':
+                response.streaming_content = _brotli_sequence(response.streaming_content, config['BROTLI_QUALITY'])
+            else:
+                response.streaming_content = compress_sequence(response.streaming_content, max_random_bytes=GZIP_RANDOM_BYTES)
+            del response.headers['Content-Length']
+        else:
+            compressed = compress(response.content, encoding, config)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response.headers['Content-Length'] = str(len(compressed))
+
+        # A strong ETag no longer matches the bytes sent (RFC 9110 8.8.1)
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = encoding
+        return response
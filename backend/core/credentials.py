@@ -0,0 +1,154 @@
+"""
+Decrypted cloud credentials.
+
+CloudAccount's credential columns (CloudAccount.CREDENTIAL_FIELDS) are
+Fernet-encrypted, and Django decrypts them every time a row is loaded,
+including through select_related. Code that doesn't need them loads
+accounts with `without_credentials`, so the columns are neither read nor
+decrypted.
+
+Code that does need them calls `get_credentials(account)`. It decrypts the
+account's credentials once and keeps them in a per-process cache for TTL
+seconds. Secrets are held in bytearrays. Every caller gets its own copy of
+the cached entry, so the cache can overwrite its entry with zeros when the
+entry expires, is evicted or is invalidated without emptying credentials
+another thread is still using; a caller's copy is zeroized when it is
+garbage collected. Saving or deleting an account invalidates its entry in
+the process that did it. Other processes see the change once their entry
+expires, so keep TTL short. Copies handed to an SDK (which wants str) are
+beyond our reach; zeroizing only covers what this module holds.
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import CloudAccount
+
+DEFAULTS = {
+    'TTL': 300,             # Seconds a decrypted entry is reused
+    'MAX_ENTRIES': 256,     # Least recently used entries beyond this are evicted
+}
+
+_cache = OrderedDict()  # account id -> Credentials
+_lock = threading.Lock()
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'CREDENTIAL_CACHE', {})}
+
+
+def _buffer(value):
+    return bytearray(value.encode()) if value else None
+
+
+def _text(buffer):
+    return buffer.decode() if buffer is not None else None
+
+
+class Credentials:
+    """Decrypted credentials of one account. Read each attribute once per use rather than keeping the values."""
+    __slots__ = ('account_id', 'expires_at', '_access_key', '_secret_key', '_extra_config')
+
+    def __init__(self, account_id, access_key, secret_key, extra_config, ttl):
+        self.account_id = account_id
+        self.expires_at = time.monotonic() + ttl
+        self._access_key = _buffer(access_key)
+        self._secret_key = _buffer(secret_key)
+        self._extra_config = _buffer(json.dumps(extra_config)) if extra_config is not None else None
+
+    @property
+    def access_key(self):
+        return _text(self._access_key)
+
+    @property
+    def secret_key(self):
+        return _text(self._secret_key)
+
+    @property
+    def extra_config(self):
+        """A fresh dict on every access; never None."""
+        return json.loads(self._extra_config) if self._extra_config is not None else {}
+
+    def copy(self):
+        """The same credentials in buffers of their own, which zeroizing this entry leaves alone."""
+        copy = Credentials.__new__(Credentials)
+        copy.account_id, copy.expires_at = self.account_id, self.expires_at
+        copy._access_key, copy._secret_key, copy._extra_config = (
+            bytearray(buffer) if buffer is not None else None
+            for buffer in (self._access_key, self._secret_key, self._extra_config)
+        )
+        return copy
+
+    def zeroize(self):
+        for buffer in (self._access_key, self._secret_key, self._extra_config):
+            if buffer is not None:
+                buffer[:] = bytes(len(buffer))
+        self._access_key = self._secret_key = self._extra_config = None
+
+    def __del__(self):
+        self.zeroize()
+
+
+def get_credentials(account):
+    """
+    Credentials of a CloudAccount (or account id), decrypted at most once per
+    TTL in this process. The result is the caller's own copy.
+    """
+    account_id = getattr(account, 'pk', account)
+    now = time.monotonic()
+    with _lock:
+        entry = _cache.get(account_id)
+        if entry is not None and entry.expires_at > now:
+            _cache.move_to_end(account_id)
+            return entry.copy()
+        if entry is not None:
+            _cache.pop(account_id).zeroize()
+
+    # Decrypts the three columns once, without loading the rest of the row
+    access_key, secret_key, extra_config = CloudAccount.objects.filter(pk=account_id).values_list(*CloudAccount.CREDENTIAL_FIELDS).get()
+    config = get_config()
+    entry = Credentials(account_id, access_key, secret_key, extra_config, config['TTL'])
+    result = entry.copy()
+
+    with _lock:
+        previous = _cache.pop(account_id, None)
+        if previous is not None:
+            previous.zeroize()
+        _cache[account_id] = entry
+        while len(_cache) > config['MAX_ENTRIES']:
+            _cache.popitem(last=False)[1].zeroize()
+    return result
+
+
+def invalidate(account_id=None):
+    """Drops one account's entry, or every entry."""
+    with _lock:
+        entries = [_cache.pop(account_id, None)] if account_id is not None else list(_cache.values())
+        if account_id is None:
+            _cache.clear()
+    for entry in entries:
+        if entry is not None:
+            entry.zeroize()
+
+
+def without_credentials(queryset, path=''):
+    """Defers the credential columns of the CloudAccount at `path` (e.g. 'entity__cloud_account')."""
+    prefix = f"{path}__" if path else ''
+    return queryset.defer(*[prefix + field for field in CloudAccount.CREDENTIAL_FIELDS])
+
+
+@receiver(post_save, sender=CloudAccount)
+def _account_saved(sender, instance, update_fields=None, **kwargs):
+    # Saves that only touch sync bookkeeping (e.g. of an account loaded without credentials) keep the entry
+    if update_fields is None or set(update_fields) & set(CloudAccount.CREDENTIAL_FIELDS):
+        invalidate(instance.pk)
+
+
+@receiver(post_delete, sender=CloudAccount)
+def _account_deleted(sender, instance, **kwargs):
+    invalidate(instance.pk)
@@ -0,0 +1,154 @@
+"""
+Content-addressed policy documents.
+
+A PolicyDocument is stored once per distinct (platform, document) and keyed
+by its hash, together with its scan result. IAMPolicy rows are attachment
+records that point at one, so a managed policy attached to thousands of
+principals is stored and scanned once.
+
+Scan results are tagged with SCANNER_VERSION; a document scanned by an older
+scanner is rescanned the next time it is resolved, or earlier by the
+`rescan_documents` task (see `rescan_outdated`). New documents are
+projected into PolicyStatement rows for search (core/search.py).
+"""
+import hashlib
+import json
+from collections import OrderedDict
+
+from django.db import IntegrityError, transaction
+
+from .models import IAMPolicy, PolicyDocument
+from .scanner import SCANNER_VERSION, scan_document
+from .search import project_documents
+from .storage import decode
+
+
+def document_hash(document, platform):
+    """sha256 of the platform and the canonical JSON of the document."""
+    canonical = json.dumps(document, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(f"{platform}:{canonical}".encode()).hexdigest()
+
+
+def resolve_document(document, platform, digest=None, known=None, cache=None, result=None):
+    """
+    Returns the PolicyDocument for `document`, scanning it only if it is new
+    or its scan is out of date. `known` (statement results from a document
+    scanned with the current SCANNER_VERSION) lets unchanged statements
+    reuse their earlier results. `cache` is a per-run dict of documents
+    already resolved, so a shared document costs one lookup per sync.
+    `result` is a `scan_document` result computed elsewhere (the sync
+    pipeline's scan pool); it is used instead of scanning here.
+    """
+    digest = digest or document_hash(document, platform)
+    if cache is not None and digest in cache:
+        return cache[digest]
+    stored = _resolve(document, platform, digest, known, result)
+    if cache is not None:
+        cache[digest] = stored
+    return stored
+
+
+def _scan(document, platform, known, result=None):
+    score, findings, statement_results = result or scan_document(document, platform, known)
+    return {
+        'risk_score': score,
+        'is_vulnerable': score > 50,
+        'finding_details': {"issues": findings},
+        'statement_results': statement_results,
+        'scanner_version': SCANNER_VERSION,
+    }
+
+
+def _rescan(stored, known=None, result=None):
+    scan = _scan(stored.document, stored.platform, known, result)
+    for field, value in scan.items():
+        setattr(stored, field, value)
+    stored.save(update_fields=list(scan))
+    return stored
+
+
+def _resolve(document, platform, digest, known, result=None):
+    stored = PolicyDocument.objects.filter(hash=digest).first()
+    if stored and stored.scanner_version == SCANNER_VERSION:
+        return stored
+    if stored:
+        return _rescan(stored, known, result)
+
+    scan = _scan(document, platform, known, result)
+    stored = PolicyDocument(hash=digest, platform=platform, document=document, **scan)
+    try:
+        with transaction.atomic():
+            stored.save(force_insert=True)
+            project_documents([stored])
+    except IntegrityError:
+        pass  # Another worker stored (and projected) the same document first; the content is identical
+    return stored
+
+
+def current_hashes(digests):
+    """The subset of `digests` already stored with a current scan result."""
+    return set(PolicyDocument.objects.filter(hash__in=digests, scanner_version=SCANNER_VERSION).values_list('hash', flat=True))
+
+
+class DocumentCache(OrderedDict):
+    """Per-run `resolve_document` cache that keeps the `size` most recently used documents, so a long sync doesn't hold every document it saw."""
+
+    def __init__(self, size=1000):
+        super().__init__()
+        self.size = size
+
+    def __getitem__(self, digest):
+        self.move_to_end(digest)
+        return super().__getitem__(digest)
+
+    def __setitem__(self, digest, stored):
+        super().__setitem__(digest, stored)
+        self.move_to_end(digest)
+        if len(self) > self.size:
+            self.popitem(last=False)
+
+
+def previous_document(digest):
+    """Document, scan result and reusable statement results of a policy's current document, before it is replaced."""
+    previous = PolicyDocument.objects.filter(hash=digest).values('document', 'risk_score', 'finding_details', 'statement_results', 'scanner_version').first()
+    if previous is None:
+        return None
+    for field in ('document', 'finding_details', 'statement_results'):
+        previous[field] = decode(previous[field])
+    if previous.pop('scanner_version') != SCANNER_VERSION:
+        previous['statement_results'] = None
+    return previous
+
+
+def store_unscanned(document, platform, score, finding_details):
+    """Stores a document with a provisional result (e.g. the scanner failed); it is rescanned when next resolved."""
+    digest = document_hash(document, platform)
+    with transaction.atomic():
+        stored, created = PolicyDocument.objects.get_or_create(hash=digest, defaults={
+            'platform': platform,
+            'document': document,
+            'risk_score': score,
+            'is_vulnerable': score > 50,
+            'finding_details': finding_details,
+            'scanner_version': 0,
+        })
+        if created:
+            project_documents([stored])
+    return stored
+
+
+def rescan_outdated(limit=500):
+    """
+    Rescans up to `limit` documents stored by an older scanner version and
+    updates the scores copied onto the policies that use them. Returns the
+    number of documents rescanned.
+    """
+    rescanned = 0
+    for stored in PolicyDocument.objects.exclude(scanner_version=SCANNER_VERSION).order_by('hash')[:limit]:
+        with transaction.atomic():
+            _rescan(stored)
+            IAMPolicy.objects.filter(policy_document=stored).update(
+                risk_score=stored.risk_score, is_vulnerable=stored.is_vulnerable
+            )
+        rescanned += 1
+    return rescanned
@@ -0,0 +1,234 @@
+"""
+Effective permissions.
+
+For every IAMEntity we combine its own policies (attached and inline) with
+the policies of the groups it belongs to, and materialize the result in two
+places:
+
+- `EffectivePermissionSet`: the compact allow/deny list for one entity
+- `ActionGrant`: one row per (entity, action pattern, resource pattern),
+  which is the inverted action -> entities index used by `who_can`
+
+`refresh_entities` recomputes only the entities it is given (plus members of
+any groups among them) and skips entities whose fingerprint didn't change,
+so the sync and the policy editor can call it after every write.
+
+Explicit Deny wins over Allow. Conditional statements are kept but flagged,
+and a conditional Deny is not treated as a guaranteed denial.
+NotAction/NotResource statements are not modelled yet.
+"""
+import hashlib
+import json
+from fnmatch import fnmatchcase
+
+from django.db import transaction
+from django.db.models import Q
+
+from .credentials import without_credentials
+from .models import ActionGrant, EffectivePermissionSet, IAMEntity
+
+WILDCARDS = ('*', '?')
+CHUNK_SIZE = 500
+
+
+def _as_list(value):
+    if value is None:
+        return []
+    return [value] if isinstance(value, str) else list(value)
+
+
+def _prefix(pattern):
+    """Text before the first wildcard, which is what the index can look up exactly."""
+    cut = min((pattern.index(w) for w in WILDCARDS if w in pattern), default=len(pattern))
+    return pattern[:cut]
+
+
+def document_grants(document, platform):
+    """Yields (effect, action, resource, conditional) for every grant in a policy document."""
+    document = document or {}
+
+    if platform == 'azure':
+        for action in _as_list(document.get('actions')):
+            yield 'allow', action.lower(), '*', False
+        return
+
+    if platform != 'aws':
+        return  # GCP documents are role bindings, not action lists
+
+    statements = document.get('Statement', [])
+    if isinstance(statements, dict):
+        statements = [statements]
+    for stmt in statements:
+        effect = str(stmt.get('Effect', '')).lower()
+        if effect not in ('allow', 'deny'):
+            continue
+        conditional = bool(stmt.get('Condition'))
+        resources = _as_list(stmt.get('Resource')) or ['*']
+        for action in _as_list(stmt.get('Action')):
+            for resource in resources:
+                yield effect, action.lower(), resource, conditional
+
+
+def compact(grants):
+    """
+    Dedupes grants and drops the ones already covered by a wider wildcard on
+    the same resource (`*` covers everything, `s3:*` covers `s3:GetObject`).
+    """
+    grants = set(grants)
+    wide = {(effect, resource, conditional, action) for effect, action, resource, conditional in grants if action == '*' or action.endswith(':*')}
+
+    kept = []
+    for effect, action, resource, conditional in grants:
+        if action != '*' and (effect, resource, conditional, '*') in wide:
+            continue
+        service = action.split(':', 1)[0]
+        if not action.endswith(':*') and action != '*' and (effect, resource, conditional, f"{service}:*") in wide:
+            continue
+        kept.append((effect, action, resource, conditional))
+    return sorted(kept)
+
+
+def _entity_grants(entity, platform, cache):
+    """`cache` maps document hash -> grants, so a shared document is only parsed once per chunk."""
+    grants = []
+    policies = list(entity.policies.all())
+    for group in entity.groups.all():
+        policies.extend(group.policies.all())
+    for policy in policies:
+        if policy.policy_document_id not in cache:
+            cache[policy.policy_document_id] = list(document_grants(policy.policy_document.document, platform))
+        grants.extend(cache[policy.policy_document_id])
+    return compact(grants)
+
+
+def refresh_entities(entity_ids):
+    """Recomputes effective permissions for the given entities. Returns how many actually changed."""
+    ids = set(entity_ids)
+    if not ids:
+        return 0
+
+    # A group's policies flow down to its members
+    membership = IAMEntity.groups.through.objects
+    ids |= set(membership.filter(to_iamentity_id__in=ids).values_list('from_iamentity_id', flat=True))
+
+    changed = 0
+    ordered = sorted(ids)
+    for start in range(0, len(ordered), CHUNK_SIZE):
+        changed += _refresh_chunk(ordered[start:start + CHUNK_SIZE])
+    return changed
+
+
+def _refresh_chunk(ids):
+    entities = without_credentials(
+        IAMEntity.objects.filter(id__in=ids)
+        .select_related('cloud_account')
+        .prefetch_related('policies__policy_document', 'groups__policies__policy_document'),
+        'cloud_account',
+    )
+    fingerprints = dict(EffectivePermissionSet.objects.filter(entity_id__in=ids).values_list('entity_id', 'fingerprint'))
+
+    sets, rows, changed_ids, cache = [], [], [], {}
+    for entity in entities:
+        grants = _entity_grants(entity, entity.cloud_account.platform, cache)
+        fingerprint = hashlib.sha256(json.dumps(grants).encode()).hexdigest()
+        if fingerprints.get(entity.id) == fingerprint:
+            continue
+
+        changed_ids.append(entity.id)
+        sets.append(EffectivePermissionSet(
+            entity=entity,
+            allow=[[a, r, c] for e, a, r, c in grants if e == 'allow'],
+            deny=[[a, r, c] for e, a, r, c in grants if e == 'deny'],
+            fingerprint=fingerprint,
+        ))
+        for effect, action, resource, conditional in grants:
+            prefix = _prefix(action)
+            rows.append(ActionGrant(
+                entity=entity,
+                cloud_account_id=entity.cloud_account_id,
+                effect=effect,
+                action=action,
+                action_prefix=prefix,
+                is_wildcard=prefix != action,
+                resource=resource,
+                conditional=conditional,
+            ))
+
+    if changed_ids:
+        with transaction.atomic():
+            ActionGrant.objects.filter(entity_id__in=changed_ids).delete()
+            ActionGrant.objects.bulk_create(rows, batch_size=5000)
+            EffectivePermissionSet.objects.bulk_create(
+                sets,
+                update_conflicts=True,
+                unique_fields=['entity'],
+                update_fields=['allow', 'deny', 'fingerprint', 'computed_at'],
+            )
+    return len(changed_ids)
+
+
+def refresh_account(account):
+    """Full rebuild for one account (used by the rebuild_permissions command)."""
+    ids = list(IAMEntity.objects.filter(cloud_account=account).values_list('id', flat=True))
+    return refresh_entities(ids)
+
+
+def matching_grants(effect, actions, cloud_account_ids=None, any_resource=False, entity_ids=None, resources=None):
+    """
+    Yields (action, entity_id, resource pattern, conditional) for every grant
+    of `effect` whose action pattern covers one of `actions`, all in one
+    query. With `any_resource`, only grants on `*` are returned; with
+    `resources`, only grants on exactly those resource patterns.
+    `entity_ids` limits the grants to those entities.
+    """
+    prefixes = {action[:i] for action in actions for i in range(len(action) + 1)}
+    grants = ActionGrant.objects.filter(effect=effect).filter(
+        Q(action__in=actions) | Q(is_wildcard=True, action_prefix__in=prefixes)
+    )
+    if any_resource:
+        grants = grants.filter(resource='*')
+    if resources is not None:
+        grants = grants.filter(resource__in=resources)
+    if cloud_account_ids is not None:
+        grants = grants.filter(cloud_account_id__in=cloud_account_ids)
+    if entity_ids is not None:
+        grants = grants.filter(entity_id__in=entity_ids)
+
+    for entity_id, pattern, resource_pattern, conditional in grants.values_list('entity_id', 'action', 'resource', 'conditional').iterator():
+        for action in actions:
+            # Plain "prefix*" patterns only need a prefix check; anything fancier goes through fnmatch
+            if pattern == action or (
+                action.startswith(pattern[:-1]) if pattern.endswith('*') and not any(w in pattern[:-1] for w in WILDCARDS)
+                else fnmatchcase(action, pattern)
+            ):
+                yield action, entity_id, resource_pattern, conditional
+
+
+def _matching(effect, action, resource, cloud_account_ids, entity_ids=None):
+    """
+    Entity ids with a grant of `effect` that matches action and resource,
+    mapped to True if every matching grant is conditional.
+    """
+    matches = {}
+    # "on *" means every resource, so only grants on * itself qualify
+    for _, entity_id, resource_pattern, conditional in matching_grants(effect, [action], cloud_account_ids, resource == '*', entity_ids):
+        if resource != '*' and not fnmatchcase(resource, resource_pattern):
+            continue
+        matches[entity_id] = matches.get(entity_id, True) and conditional
+    return matches
+
+
+def who_can(action, resource='*', cloud_account_ids=None, include_conditional=True, entity_ids=None):
+    """
+    Which principals (of `entity_ids`, default all) can perform `action` on
+    `resource`? Returns a dict of entity id -> True if the access depends on
+    a Condition.
+    """
+    action = action.lower()
+    allowed = _matching('allow', action, resource, cloud_account_ids, entity_ids)
+    denied = {entity_id for entity_id, conditional in _matching('deny', action, resource, cloud_account_ids, entity_ids).items() if not conditional}
+
+    result = {entity_id: conditional for entity_id, conditional in allowed.items() if entity_id not in denied}
+    if not include_conditional:
+        result = {entity_id: conditional for entity_id, conditional in result.items() if not conditional}
+    return result
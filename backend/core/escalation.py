@@ -0,0 +1,403 @@
+"""
+Privilege-escalation graph (AWS).
+
+Nodes are the IAMEntity rows of one account. An edge S -> T means S can
+obtain T's permissions:
+
+- trust:      T's trust policy names S directly
+- assume:     S is allowed sts:AssumeRole on T, and T trusts its account (root or "*")
+- pass_role:  S is allowed iam:PassRole on T, so it can run code as T
+- join_group: S is allowed iam:AddUserToGroup on T
+
+Admin-equivalent entities are the starting points ("seeds") of the search:
+
+- 0 hops: allowed `*` or `iam:*` on `*`
+- 1 hop:  can rewrite its own permissions (attach/put a policy on itself or
+          on a group it is in, or iam:CreatePolicyVersion on `*`)
+- 2 hops: can rewrite the permissions of a role it can also assume or pass
+
+`refresh_account_graph` rebuilds the account's edges from the ActionGrant
+index, so it only reads entities that hold one of the relevant actions. It
+then runs one multi-source shortest-path pass backwards from the seeds and
+writes only the edges and EscalationPath rows that changed. "Shortest
+escalation path from X" is then a single-row read.
+
+Given the entities whose permissions, trust policy or groups changed, it
+only recomputes their outgoing edges (and those of entities whose grants
+name them) and the paths of entities that can reach one of them, old edges
+or new. Every other path is unaffected and stays as stored; the search over
+the affected part continues along it where an edge leaves that part.
+
+A Deny only removes an edge when it is unconditional and on `*`, and
+Conditions on Allow statements are ignored, so paths are an upper bound.
+"""
+import heapq
+import re
+from collections import defaultdict
+from fnmatch import fnmatchcase
+
+from django.db import transaction
+
+from .effective import WILDCARDS, _as_list, _prefix, matching_grants, who_can
+from .models import EscalationEdge, EscalationPath, IAMEntity
+
+EDGE_ACTIONS = {
+    'assume': 'sts:assumerole',
+    'pass_role': 'iam:passrole',
+    'join_group': 'iam:addusertogroup',
+}
+
+MUTATION_ACTIONS = {
+    'user': ('iam:attachuserpolicy', 'iam:putuserpolicy'),
+    'role': ('iam:attachrolepolicy', 'iam:putrolepolicy'),
+    'group': ('iam:attachgrouppolicy', 'iam:putgrouppolicy'),
+}
+
+RELEVANT_ACTIONS = [*EDGE_ACTIONS.values(), *(a for actions in MUTATION_ACTIONS.values() for a in actions), 'iam:createpolicyversion']
+
+# Past this share of the account, reading every grant once is cheaper than filtering by entity ids
+FULL_REBUILD_SHARE = 0.25
+
+ACCOUNT_PRINCIPAL = re.compile(r'^(arn:aws:iam::)?\d{12}(:root)?$')
+IAM_ARN_PREFIX = 'arn:aws:iam::'
+
+
+def trusted_principals(trust_policy):
+    """Yields the AWS principals (ARNs, account ids or "*") a trust policy lets call sts:AssumeRole."""
+    statements = (trust_policy or {}).get('Statement', [])
+    if isinstance(statements, dict):
+        statements = [statements]
+    for stmt in statements:
+        if str(stmt.get('Effect', '')).lower() != 'allow':
+            continue
+        if not any(fnmatchcase('sts:assumerole', a.lower()) for a in _as_list(stmt.get('Action'))):
+            continue
+        principal = stmt.get('Principal')
+        if principal == '*':
+            yield '*'
+        elif isinstance(principal, dict):
+            yield from _as_list(principal.get('AWS'))
+
+
+def _allowed(actions, account_id, entity_ids=None):
+    """action -> entity id -> resource patterns it is allowed on, minus entities denied it everywhere."""
+    allowed = {action: defaultdict(list) for action in actions}
+    for action, entity_id, resource, _ in matching_grants('allow', actions, [account_id], entity_ids=entity_ids):
+        allowed[action][entity_id].append(resource)
+    for action, entity_id, _, conditional in matching_grants('deny', actions, [account_id], any_resource=True, entity_ids=entity_ids):
+        if not conditional:
+            allowed[action].pop(entity_id, None)
+    return allowed
+
+
+def _can_match_iam_arn(pattern):
+    prefix = _prefix(pattern)
+    return prefix.startswith(IAM_ARN_PREFIX) or IAM_ARN_PREFIX.startswith(prefix)
+
+
+def _wildcard_index(edges):
+    """
+    Wildcard edges keyed by the literal text before the wildcard:
+    kind -> prefix -> pattern -> [source ids], and the prefix lengths per kind.
+    """
+    pending = defaultdict(lambda: defaultdict(lambda: defaultdict(list)))
+    for source, target, pattern, kind in edges:
+        if target is None:
+            pending[kind][_prefix(pattern)][pattern].append(source)
+    return pending, {kind: sorted({len(prefix) for prefix in by_prefix}) for kind, by_prefix in pending.items()}
+
+
+def _pop_matching(pending, prefix_lengths, kind, arn):
+    """Sources of the wildcard edges of `kind` matching `arn`, removing those edges from `pending`."""
+    by_prefix = pending[kind]
+    for length in prefix_lengths[kind]:
+        patterns = by_prefix.get(arn[:length])
+        if not patterns:
+            continue
+        for pattern in [p for p in patterns if fnmatchcase(arn, p)]:
+            yield from patterns.pop(pattern)
+
+
+class _Graph:
+    """
+    In-memory graph of one account, built from the index: nodes and trust
+    policies here, then grants and the edges from both in `permission_edges`.
+    """
+
+    def __init__(self, account):
+        self.account = account
+        self.nodes = {}  # id -> (arn, name, type)
+        for entity_id, arn, name, entity_type in IAMEntity.objects.filter(cloud_account=account).values_list('id', 'arn_or_id', 'name', 'entity_type'):
+            self.nodes[entity_id] = (arn, name, entity_type)
+        self.by_arn = {arn: entity_id for entity_id, (arn, _, _) in self.nodes.items()}
+        self.roles = {entity_id for entity_id, node in self.nodes.items() if node[2] == 'role'}
+        self.groups = {entity_id for entity_id, node in self.nodes.items() if node[2] == 'group'}
+
+        # Which roles each edge kind can lead to. "assume" needs the role to trust its account.
+        self.account_trusting = set()
+        self.trust_edges = set()
+        self._trust_edges()
+        self.candidates = {'assume': self.account_trusting, 'pass_role': self.roles, 'join_group': self.groups}
+
+    def arn(self, entity_id):
+        return self.nodes[entity_id][0]
+
+    def permission_edges(self, sources=None):
+        """
+        Reads grants and rebuilds the edges from the trust edges plus the
+        permission edges of `sources` (default all) and of the entities
+        whose grants name them; the caller adds the rest (see `add_edges`).
+        """
+        if sources is not None:
+            sources = {entity_id for entity_id in sources if entity_id in self.nodes}
+            sources |= self._naming(sources)
+        self.sources = sources
+        self.allowed = _allowed(RELEVANT_ACTIONS, self.account.id, sources)
+        self.edges = set()  # (source_id, target_id or None, target_pattern, kind)
+        self.outgoing = defaultdict(list)
+        self.add_edges(self.trust_edges)
+        self.add_edges(self._permission_edges())
+
+    def add_edges(self, edges):
+        for edge in edges:
+            self.edges.add(edge)
+            source, target, pattern, kind = edge
+            self.outgoing[source].append((target, pattern, kind))
+
+    def load_grants(self, entity_ids):
+        """Reads the grants of more entities, for their seeds; their edges are not rebuilt."""
+        for action, grants in _allowed(RELEVANT_ACTIONS, self.account.id, entity_ids).items():
+            self.allowed[action].update(grants)
+
+    def _naming(self, entity_ids):
+        """Entities with an exact edge grant on one of `entity_ids`, which can gain or lose an edge to it."""
+        arns = [self.arn(entity_id) for entity_id in entity_ids]
+        grants = matching_grants('allow', list(EDGE_ACTIONS.values()), [self.account.id], resources=arns) if arns else ()
+        return {entity_id for _, entity_id, _, _ in grants if entity_id in self.nodes}
+
+    def upstream(self, entity_ids, edges):
+        """`entity_ids` and every entity that can reach one of them over `edges`."""
+        incoming = defaultdict(list)
+        for source, target, _, _ in edges:
+            if target is not None:
+                incoming[target].append(source)
+        pending, prefix_lengths = _wildcard_index(edges)
+
+        entity_ids = set(entity_ids)
+        found = set(entity_ids)
+        queue = list(found)
+        while queue:
+            entity_id = queue.pop()
+            sources = list(incoming.get(entity_id, ()))
+            for kind in pending:
+                # A changed role may have stopped trusting its account, so its old callers count too
+                if entity_id in self.candidates[kind] or (kind == 'assume' and entity_id in entity_ids and entity_id in self.roles):
+                    sources.extend(_pop_matching(pending, prefix_lengths, kind, self.arn(entity_id)))
+            for source in sources:
+                # Stored edges can still name entities that are gone
+                if source not in found and source in self.nodes:
+                    found.add(source)
+                    queue.append(source)
+        return found
+
+    def _trust_edges(self):
+        roles = IAMEntity.objects.filter(id__in=self.roles).exclude(trust_policy=None).values_list('id', 'trust_policy')
+        for role_id, trust_policy in roles:
+            for principal in trusted_principals(trust_policy):
+                if principal == '*' or ACCOUNT_PRINCIPAL.match(principal):
+                    self.account_trusting.add(role_id)
+                elif principal in self.by_arn and self.by_arn[principal] != role_id:
+                    self.trust_edges.add((self.by_arn[principal], role_id, '', 'trust'))
+
+    def _permission_edges(self):
+        for kind, action in EDGE_ACTIONS.items():
+            for source_id, patterns in self.allowed[action].items():
+                if kind == 'join_group' and self.nodes.get(source_id, (None, None, None))[2] != 'user':
+                    continue
+                for pattern in patterns:
+                    if any(w in pattern for w in WILDCARDS):
+                        # Patterns for other services (e.g. arn:aws:s3:::*) can never name a role or group
+                        if _can_match_iam_arn(pattern):
+                            yield source_id, None, pattern, kind
+                    elif self.by_arn.get(pattern) in self.candidates[kind] and self.by_arn[pattern] != source_id:
+                        yield source_id, self.by_arn[pattern], '', kind
+
+    def targets(self, source_id):
+        """(target_id, kind) for every node one edge away from `source_id`, in a stable order."""
+        found = set()
+        for target, pattern, kind in self.outgoing.get(source_id, ()):
+            if target is not None:
+                found.add((target, kind))
+            else:
+                found.update(
+                    (candidate, kind) for candidate in self.candidates[kind]
+                    if candidate != source_id and fnmatchcase(self.arn(candidate), pattern)
+                )
+        return sorted(found)
+
+    def seeds(self, only=None):
+        """
+        entity id -> (hops, grant, role) for admin-equivalent entities (of
+        `only`, default all). `role` is set for 2-hop seeds.
+        """
+        account_id = self.account.id
+        seeds = {}
+        for entity_id in who_can('iam:*', '*', [account_id], entity_ids=only):
+            seeds[entity_id] = (0, 'iam:* on *', None)
+
+        for entity_id, patterns in self.allowed['iam:createpolicyversion'].items():
+            if '*' in patterns and entity_id not in seeds and (only is None or entity_id in only):
+                seeds[entity_id] = (1, 'iam:createpolicyversion on *', None)
+
+        membership = IAMEntity.groups.through.objects.filter(from_iamentity__cloud_account=self.account)
+        if only is not None:
+            membership = membership.filter(from_iamentity_id__in=only)
+        groups_of = defaultdict(list)
+        for user_id, group_id in membership.values_list('from_iamentity_id', 'to_iamentity_id'):
+            groups_of[user_id].append(group_id)
+
+        for entity_type, actions in MUTATION_ACTIONS.items():
+            for action in actions:
+                for entity_id, patterns in self.allowed[action].items():
+                    if entity_id not in self.nodes or seeds.get(entity_id, (3,))[0] <= 1 or (only is not None and entity_id not in only):
+                        continue
+                    # 1. Itself, or a group it is in
+                    own = sorted(groups_of.get(entity_id, [])) if entity_type == 'group' else [entity_id]
+                    hit = next((t for t in own if self.nodes[t][2] == entity_type and any(fnmatchcase(self.arn(t), p) for p in patterns)), None)
+                    if hit is not None:
+                        seeds[entity_id] = (1, f"{action} on {self.nodes[hit][1]}", None)
+                        continue
+                    # 2. A role it can also become
+                    if entity_type == 'role' and entity_id not in seeds:
+                        role = next((
+                            (target, kind) for target, kind in self.targets(entity_id)
+                            if target in self.roles and any(fnmatchcase(self.arn(target), p) for p in patterns)
+                        ), None)
+                        if role is not None:
+                            seeds[entity_id] = (2, f"{action} on {self.nodes[role[0]][1]}", role)
+        return seeds
+
+    def shortest_paths(self, only=None, known=None):
+        """
+        entity id -> (hops, path) for every entity (of `only`, default all)
+        that can reach admin, by one backwards search from the seeds.
+        `known` holds the stored hops of the entities outside `only` that
+        have a path; a path out of `only` continues along the stored one.
+        """
+        edges = self.edges if only is None else [edge for edge in self.edges if edge[0] in only]
+        incoming = defaultdict(list)
+        for source, target, _, kind in edges:
+            if target is not None:
+                incoming[target].append((source, kind))
+        pending, prefix_lengths = _wildcard_index(edges)
+
+        seeds = self.seeds(only)
+        # Entries are (hops, entity id, next entity id, edge kind); 0 marks a seed, which wins ties
+        heap = [(hops, entity_id, 0, '') for entity_id, (hops, _, _) in seeds.items()]
+        # Entities outside `only` are settled at their stored hops, in the order the full search would reach them
+        heap += [(hops, entity_id, None, '') for entity_id, hops in (known or {}).items()]
+        heapq.heapify(heap)
+        step = {}
+
+        while heap:
+            hops, entity_id, next_id, kind = heapq.heappop(heap)
+            if entity_id in step:
+                continue
+            step[entity_id] = (hops, next_id, kind)
+
+            for source, edge_kind in incoming.get(entity_id, ()):
+                if source not in step:
+                    heapq.heappush(heap, (hops + 1, source, entity_id, edge_kind))
+            # Wildcard edges fire on the first (closest) matching target, then are done
+            for edge_kind in pending:
+                if entity_id not in self.candidates[edge_kind]:
+                    continue
+                for source in _pop_matching(pending, prefix_lengths, edge_kind, self.arn(entity_id)):
+                    if source not in step and source != entity_id:
+                        heapq.heappush(heap, (hops + 1, source, entity_id, edge_kind))
+
+        known = known or {}
+        exits = {next_id for entity_id, (_, next_id, _) in step.items() if entity_id not in known and next_id in known}
+        stored = dict(EscalationPath.objects.filter(entity_id__in=exits).values_list('entity_id', 'path')) if exits else {}
+        paths = {}
+        for entity_id, (hops, next_id, kind) in step.items():
+            if entity_id in known:
+                continue
+            path = [{'entity_id': entity_id, 'name': self.nodes[entity_id][1], 'via': None}]
+            while next_id and next_id not in known:
+                path.append({'entity_id': next_id, 'name': self.nodes[next_id][1], 'via': kind})
+                _, next_id, kind = step[next_id]
+            if next_id:
+                rest = stored[next_id]
+                path += [{**rest[0], 'via': kind}, *rest[1:]]
+            else:
+                _, grant, role = seeds[path[-1]['entity_id']]
+                if role is not None:
+                    path.append({'entity_id': role[0], 'name': self.nodes[role[0]][1], 'via': role[1]})
+                path[-1]['grant'] = grant
+            paths[entity_id] = (hops, path)
+        return paths
+
+
+def refresh_account_graph(account, entity_ids=None):
+    """
+    Updates the escalation graph of one AWS account after the permissions,
+    trust policies or group memberships of `entity_ids` changed; None
+    rebuilds all of it. Returns how many cached paths changed.
+    """
+    if account.platform != 'aws':
+        return 0
+
+    stored_edges = {
+        (source, target, pattern, kind): edge_id
+        for edge_id, source, target, pattern, kind in EscalationEdge.objects.filter(cloud_account=account).values_list('id', 'source_id', 'target_id', 'target_pattern', 'kind')
+    }
+    stored_paths = EscalationPath.objects.filter(cloud_account=account)
+    graph = _Graph(account)
+    affected, known = None, None
+    if entity_ids is not None and len(entity_ids) <= FULL_REBUILD_SHARE * len(graph.nodes):
+        # 1. Members of a changed group have changed too
+        changed = set(entity_ids)
+        changed |= set(IAMEntity.groups.through.objects.filter(to_iamentity_id__in=changed).values_list('from_iamentity_id', flat=True))
+        graph.permission_edges(changed)
+        if not graph.sources:
+            return 0
+        # 2. Trust edges were all re-read; other permission edges stay as stored
+        graph.add_edges(edge for edge in stored_edges if edge[3] != 'trust' and edge[0] not in graph.sources)
+        # 3. Only entities that could reach a changed one, before or now, can get a different path
+        affected = graph.upstream(graph.sources, set(stored_edges) | graph.edges)
+        if len(affected) > FULL_REBUILD_SHARE * len(graph.nodes):
+            affected = None
+        else:
+            graph.load_grants(affected - graph.sources)
+            hops = dict(stored_paths.values_list('entity_id', 'hops'))
+            known = {entity_id: value for entity_id, value in hops.items() if entity_id not in affected}
+            stored_paths = stored_paths.filter(entity_id__in=[entity_id for entity_id in hops if entity_id in affected])
+    if affected is None:
+        graph.permission_edges()
+    paths = graph.shortest_paths(affected, known)
+
+    stored_paths = {entity_id: (hops, path) for entity_id, hops, path in stored_paths.values_list('entity_id', 'hops', 'path')}
+    changed = {entity_id: value for entity_id, value in paths.items() if stored_paths.get(entity_id) != value}
+    removed = set(stored_paths) - set(paths)
+    stale_edges = [edge_id for edge, edge_id in stored_edges.items() if edge not in graph.edges]
+    new_edges = graph.edges - set(stored_edges)
+
+    with transaction.atomic():
+        for i in range(0, len(stale_edges), 5000):
+            EscalationEdge.objects.filter(id__in=stale_edges[i:i + 5000]).delete()
+        EscalationEdge.objects.bulk_create([
+            EscalationEdge(cloud_account=account, source_id=source, target_id=target, target_pattern=pattern, kind=kind)
+            for source, target, pattern, kind in new_edges
+        ], batch_size=5000)
+        if removed:
+            EscalationPath.objects.filter(entity_id__in=removed).delete()
+        if changed:
+            EscalationPath.objects.bulk_create(
+                [EscalationPath(entity_id=entity_id, cloud_account=account, hops=hops, path=path) for entity_id, (hops, path) in changed.items()],
+                batch_size=5000,
+                update_conflicts=True,
+                unique_fields=['entity'],
+                update_fields=['hops', 'path', 'computed_at'],
+            )
+    return len(changed) + len(removed)
@@ -0,0 +1,78 @@
+"""
+Realistic-looking IAM documents for load tests and benchmarks.
+
+Every generator takes a `random.Random` so output is reproducible from a
+seed. The shapes match what the fetchers store in `PolicyDocument.document` for
+each platform, so the scanner sees the same structures it sees in production.
+"""
+
+AWS_SERVICES = {
+    's3': ['GetObject', 'PutObject', 'DeleteObject', 'ListBucket', 'DeleteBucket', 'PutBucketPolicy'],
+    'ec2': ['DescribeInstances', 'RunInstances', 'TerminateInstances', 'CreateSecurityGroup'],
+    'iam': ['GetUser', 'ListRoles', 'PassRole', 'AttachUserPolicy', 'PutUserPolicy', 'CreatePolicyVersion', 'CreateAccessKey'],
+    'lambda': ['InvokeFunction', 'CreateFunction', 'UpdateFunctionCode', 'GetFunction'],
+    'dynamodb': ['GetItem', 'PutItem', 'Query', 'Scan', 'DeleteTable'],
+    'kms': ['Decrypt', 'Encrypt', 'CreateGrant', 'ScheduleKeyDeletion'],
+    'logs': ['CreateLogGroup', 'PutLogEvents', 'DescribeLogStreams'],
+    'sts': ['AssumeRole', 'GetCallerIdentity', 'GetSessionToken'],
+}
+
+AZURE_ACTIONS = [
+    'Microsoft.Compute/virtualMachines/read',
+    'Microsoft.Compute/virtualMachines/write',
+    'Microsoft.Compute/virtualMachines/runCommand/action',
+    'Microsoft.Storage/storageAccounts/read',
+    'Microsoft.Storage/storageAccounts/listKeys/action',
+    'Microsoft.Network/networkSecurityGroups/write',
+    'Microsoft.KeyVault/vaults/secrets/read',
+    'Microsoft.Authorization/roleAssignments/write',
+    'Microsoft.Resources/subscriptions/resourceGroups/read',
+    'Microsoft.Web/sites/config/list/action',
+]
+
+GCP_ROLES = [
+    'roles/viewer', 'roles/editor', 'roles/owner',
+    'roles/storage.objectViewer', 'roles/storage.admin',
+    'roles/compute.instanceAdmin.v1', 'roles/iam.serviceAccountUser',
+    'roles/iam.serviceAccountTokenCreator', 'roles/cloudsql.client', 'roles/logging.viewer',
+]
+
+
+def aws_policy_document(rng, account_id='123456789012'):
+    statements = []
+    for _ in range(rng.randint(1, 4)):
+        service = rng.choice(list(AWS_SERVICES))
+        roll = rng.random()
+        if roll < 0.03:
+            actions, resource = '*', '*'
+        elif roll < 0.15:
+            actions, resource = f"{service}:*", '*'
+        else:
+            actions = [f"{service}:{a}" for a in rng.sample(AWS_SERVICES[service], rng.randint(1, 3))]
+            resource = '*' if rng.random() < 0.3 else f"arn:aws:{service}:::{service}-{rng.randint(1, 500)}/*"
+
+        statement = {
+            'Sid': f"Stmt{rng.randint(1000, 9999)}",
+            'Effect': 'Deny' if rng.random() < 0.08 else 'Allow',
+            'Action': actions,
+            'Resource': resource,
+        }
+        if rng.random() < 0.2:
+            statement['Condition'] = {'StringEquals': {'aws:RequestedRegion': rng.choice(['us-east-1', 'eu-west-1'])}}
+        statements.append(statement)
+
+    return {'Version': '2012-10-17', 'Statement': statements}
+
+
+def azure_role_document(rng):
+    if rng.random() < 0.03:
+        return {'actions': ['*']}
+    return {'actions': rng.sample(AZURE_ACTIONS, rng.randint(1, 5))}
+
+
+def gcp_binding_document(rng, email):
+    return {
+        'email': email,
+        'role': rng.choice(GCP_ROLES),
+        'unique_id': str(rng.randint(10 ** 20, 10 ** 21 - 1)),
+    }
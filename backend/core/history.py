@@ -0,0 +1,219 @@
+"""
+Findings history and risk trends.
+
+Every scan result the sync (or the policy editor) writes is appended to
+FindingRecord. On PostgreSQL that table is partitioned by month on
+`recorded_at`. `ensure_partitions` creates the coming months ahead of time
+and `drop_expired` drops whole months past retention, which is much cheaper
+than deleting rows. Other databases get a plain table and row deletes.
+
+At the end of each sync `roll_up_account` writes the account's current
+per-severity state into that day's and that week's FindingRollup rows, so
+the trend endpoint reads a few pre-aggregated rows per bucket instead of the
+history itself.
+"""
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, Count, Max, Q, Sum, Value, When
+from django.utils import timezone
+
+from .models import SEVERITY_CHOICES, FindingRecord, FindingRollup, IAMPolicy
+
+DEFAULTS = {
+    'RETENTION_MONTHS': 13,       # Raw history; whole months are dropped
+    'MONTHS_AHEAD': 2,            # Partitions created ahead of time
+    'DAILY_ROLLUP_DAYS': 400,     # Daily rollups older than this are deleted; weekly ones are kept
+}
+
+TABLE = FindingRecord._meta.db_table
+SEVERITIES = [value for value, _ in SEVERITY_CHOICES]
+# Lower bound of each severity, highest first
+SEVERITY_FLOORS = [('critical', 90), ('high', 70), ('medium', 40), ('low', 1)]
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'FINDINGS_HISTORY', {})}
+
+
+def severity(score):
+    for name, floor in SEVERITY_FLOORS:
+        if score >= floor:
+            return name
+    return 'none'
+
+
+def _severity_case():
+    """SQL equivalent of severity(risk_score)."""
+    return Case(*[When(risk_score__gte=floor, then=Value(name)) for name, floor in SEVERITY_FLOORS], default=Value('none'))
+
+
+def finding_record(policy, policy_document, platform):
+    """Unsaved FindingRecord for a scan result that was just written to `policy`."""
+    details = policy_document.finding_details
+    issues = details.get('issues', []) if isinstance(details, dict) else []
+    return FindingRecord(
+        cloud_account_id=policy.cloud_account_id,
+        platform=platform,
+        policy_id=policy.id,
+        entity_id=policy.entity_id,
+        document_hash=policy_document.hash,
+        risk_score=policy_document.risk_score,
+        severity=severity(policy_document.risk_score),
+        finding_count=len(issues),
+    )
+
+
+def record_findings(records):
+    FindingRecord.objects.bulk_create(records, batch_size=1000)
+
+
+# --- PARTITIONS ---
+
+def _month(day):
+    return date(day.year, day.month, 1)
+
+
+def _add_months(month, n):
+    years, index = divmod(month.month - 1 + n, 12)
+    return date(month.year + years, index + 1, 1)
+
+
+def partition_name(month):
+    return f"{TABLE}_y{month.year}m{month.month:02d}"
+
+
+def partitions():
+    """(name, first day of month) of every existing partition, oldest first. PostgreSQL only."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE parent.relname = %s",
+            [TABLE],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+    found = []
+    for name in names:
+        suffix = name[len(TABLE) + 2:]  # "2026m10"
+        year, _, month = suffix.partition('m')
+        if year.isdigit() and month.isdigit():
+            found.append((name, date(int(year), int(month), 1)))
+    return sorted(found, key=lambda item: item[1])
+
+
+def ensure_partitions(now=None):
+    """Creates this month's partition and the next MONTHS_AHEAD. Returns the names created."""
+    if connection.vendor != 'postgresql':
+        return []
+    config = get_config()
+    current = _month((now or timezone.now()).astimezone(dt_timezone.utc).date())
+    existing = {name for name, _ in partitions()}
+
+    created = []
+    with connection.cursor() as cursor:
+        for n in range(config['MONTHS_AHEAD'] + 1):
+            start = _add_months(current, n)
+            name = partition_name(start)
+            if name in existing:
+                continue
+            cursor.execute(
+                f'CREATE TABLE IF NOT EXISTS "{name}" PARTITION OF "{TABLE}" '
+                f"FOR VALUES FROM ('{start.isoformat()} 00:00:00+00') TO ('{_add_months(start, 1).isoformat()} 00:00:00+00')"
+            )
+            created.append(name)
+    return created
+
+
+def drop_expired(now=None):
+    """Applies retention to the raw history and the daily rollups. Returns what was removed."""
+    config = get_config()
+    now = now or timezone.now()
+    cutoff = _add_months(_month(now.astimezone(dt_timezone.utc).date()), -config['RETENTION_MONTHS'])
+
+    dropped = []
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            for name, month in partitions():
+                if month < cutoff:
+                    cursor.execute(f'DROP TABLE IF EXISTS "{name}"')
+                    dropped.append(name)
+        deleted = 0
+    else:
+        deleted, _ = FindingRecord.objects.filter(recorded_at__lt=datetime.combine(cutoff, time.min, dt_timezone.utc)).delete()
+
+    rollups, _ = FindingRollup.objects.filter(
+        period='day', bucket__lt=timezone.localdate(now) - timedelta(days=config['DAILY_ROLLUP_DAYS'])
+    ).delete()
+    return {'partitions_dropped': dropped, 'records_deleted': deleted, 'rollups_deleted': rollups}
+
+
+# --- ROLLUPS ---
+
+def roll_up_account(account, now=None):
+    """Overwrites the account's rollups for the current day and week with its current state."""
+    now = now or timezone.now()
+    day = timezone.localdate(now)
+    week = day - timedelta(days=day.weekday())
+
+    # 1. Current state of the account's policies per severity
+    state = {
+        row.pop('severity'): row
+        for row in IAMPolicy.objects.filter(cloud_account=account)
+        .annotate(severity=_severity_case()).values('severity')
+        .annotate(policies=Count('id'), vulnerable=Count('id', filter=Q(is_vulnerable=True)),
+                  risk_total=Sum('risk_score'), risk_max=Max('risk_score'))
+        .order_by()
+    }
+
+    # 2. Day and week rows, including severities that dropped to zero
+    rows = []
+    for period, bucket in (('day', day), ('week', week)):
+        since = timezone.make_aware(datetime.combine(bucket, time.min))
+        changes = dict(
+            FindingRecord.objects.filter(cloud_account_id=account.id, recorded_at__gte=since)
+            .values('severity').annotate(n=Count('id')).order_by().values_list('severity', 'n')
+        )
+        for name in SEVERITIES:
+            counts = state.get(name, {})
+            rows.append(FindingRollup(
+                period=period,
+                bucket=bucket,
+                cloud_account=account,
+                platform=account.platform,
+                severity=name,
+                policies=counts.get('policies', 0),
+                vulnerable=counts.get('vulnerable', 0),
+                risk_total=counts.get('risk_total') or 0,
+                risk_max=counts.get('risk_max') or 0,
+                changes=changes.get(name, 0),
+            ))
+
+    FindingRollup.objects.bulk_create(
+        rows,
+        update_conflicts=True,
+        unique_fields=['period', 'bucket', 'cloud_account', 'severity'],
+        update_fields=['platform', 'policies', 'vulnerable', 'risk_total', 'risk_max', 'changes', 'updated_at'],
+    )
+    return len(rows)
+
+
+def trend(period, since, cloud_account_ids=None, platform=None, severity_name=None):
+    """Rollups from `since` on, summed over the selected accounts, one row per (bucket, severity)."""
+    rollups = FindingRollup.objects.filter(period=period, bucket__gte=since)
+    if cloud_account_ids is not None:
+        rollups = rollups.filter(cloud_account_id__in=cloud_account_ids)
+    if platform:
+        rollups = rollups.filter(platform=platform)
+    if severity_name:
+        rollups = rollups.filter(severity=severity_name)
+
+    rows = rollups.values('bucket', 'severity').annotate(
+        policies=Sum('policies'), vulnerable=Sum('vulnerable'), risk_total=Sum('risk_total'),
+        risk_max=Max('risk_max'), changes=Sum('changes'),
+    ).order_by('bucket', 'severity')
+    for row in rows:
+        row['avg_risk'] = round(row['risk_total'] / row['policies'], 1) if row['policies'] else 0
+        yield row
@@ -0,0 +1,33 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from core.benchmarks.encoding import database_rows, generated_rows, run
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks JSON encoding and response compression of a /api/policies/ list payload'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100_000, help='Policies in the payload')
+        parser.add_argument('--from-db', action='store_true', help='Serialize real policies instead of generating them')
+        parser.add_argument('--repeat', type=int, default=3, help='Runs per measurement; the fastest is reported')
+        parser.add_argument('--json', action='store_true', help='Print full results as JSON')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Building {options['rows']} rows...")
+        rows = database_rows(options['rows']) if options['from_db'] else generated_rows(options['rows'])
+        results = run(rows, max(options['repeat'], 1))
+
+        self.stdout.write(f"{results['rows']} policies (orjson: {results['orjson']}, brotli: {results['brotli']})")
+        for name, stats in results['encode'].items():
+            self.stdout.write(f"  encode {name:<8} {stats['seconds']:.3f}s, {stats['bytes'] / 1e6:.1f} MB")
+        identity = results['wire']['identity']['bytes']
+        for name, stats in results['wire'].items():
+            self.stdout.write(
+                f"  wire   {name:<8} {stats['bytes'] / 1e6:.1f} MB ({stats['bytes'] / identity:.1%}), "
+                f"compressed in {stats['seconds']:.3f}s"
+            )
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
@@ -0,0 +1,38 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.benchmarks.imports import SCENARIOS, run_scenario
+
+
+class Command(BaseCommand):
+    help = 'Measures import time and memory of web and worker processes, and what each cloud SDK adds'
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenarios', nargs='*', help=f"Scenarios to run (default: all of {', '.join(SCENARIOS)})")
+        parser.add_argument('--repeat', type=int, default=3, help='Runs per scenario; the fastest is reported')
+        parser.add_argument('--json', action='store_true', help='Print full results as JSON')
+
+    def handle(self, *args, **options):
+        names = options['scenarios'] or list(SCENARIOS)
+        unknown = [name for name in names if name not in SCENARIOS]
+        if unknown:
+            raise CommandError(f"Unknown scenario(s): {', '.join(unknown)}")
+
+        results = {}
+        for name in names:
+            runs = [run_scenario(SCENARIOS[name]) for _ in range(max(options['repeat'], 1))]
+            result = min(runs, key=lambda run: run['import_seconds'])
+            results[name] = result
+            self.stdout.write(
+                f"{name:<8} {result['import_seconds']:.3f}s, +{result['import_mb']} MB "
+                f"(peak {result['maxrss_mb']} MB), SDKs: {', '.join(result['sdks']) or 'none'}"
+            )
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+
+        # Web and worker processes must not load any SDK at import time
+        eager = [name for name in ('django', 'web', 'worker') if name in results and results[name]['sdks']]
+        if eager:
+            raise CommandError(f"SDKs loaded at startup in: {', '.join(eager)}")
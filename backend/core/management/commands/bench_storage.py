@@ -0,0 +1,46 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from core.benchmarks.storage import database_bodies, database_reads, generated_bodies, run
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks stored size and decode time of policy document bodies as JSON and zstd, with and without a dictionary'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--documents', type=int, default=5000, help='Documents measured')
+        parser.add_argument('--train', type=int, default=2000, help='Other documents the dictionary is trained on')
+        parser.add_argument('--from-db', action='store_true', help='Use stored documents and time loading them')
+        parser.add_argument('--repeat', type=int, default=3, help='Runs per measurement; the fastest is reported')
+        parser.add_argument('--json', action='store_true', help='Print full results as JSON')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Building {options['documents']} documents...")
+        if options['from_db']:
+            # The training sample is taken after the measured documents, so the two don't overlap
+            bodies = database_bodies(options['documents'])
+            training = database_bodies(options['train'], offset=options['documents'])
+        else:
+            bodies = generated_bodies(options['documents'])
+            training = generated_bodies(options['train'], seed=7)
+        results = run(bodies, training, max(options['repeat'], 1))
+
+        self.stdout.write(f"{results['documents']} documents, {results['values']} values (zstandard: {results['zstandard']})")
+        for name, stats in results['modes'].items():
+            self.stdout.write(
+                f"  {name:<10} {stats['bytes'] / 1e6:.2f} MB ({stats['ratio']:.1%}), "
+                f"encode {stats['encode_us']:.1f} µs, decode {stats['decode_us']:.1f} µs per value"
+            )
+
+        if options['from_db']:
+            results['database'] = reads = database_reads(options['documents'], max(options['repeat'], 1))
+            self.stdout.write(
+                f"  load {reads['documents']} documents: {reads['load_seconds']:.3f}s, "
+                f"reading their bodies: {reads['load_and_read_seconds']:.3f}s"
+            )
+            for field, size in reads.get('column_bytes', {}).items():
+                self.stdout.write(f"  column {field:<18} {size / 1e6:.2f} MB on disk")
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
@@ -0,0 +1,55 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.benchmarks.harness import SCENARIOS, SNAPSHOT_SCENARIOS, compare, load_baseline, run_scenario, save_baseline
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks the sync fetchers and snapshot ingestion against in-process fake AWS/Azure/GCP orgs and flags regressions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenarios', nargs='*', help=f"Scenarios to run (default: all of {', '.join(SCENARIOS)})")
+        parser.add_argument('--update-baseline', action='store_true', help='Store these results as the new baseline')
+        parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed slowdown in wall time (0.25 = 25%%)')
+        parser.add_argument('--json', action='store_true', help='Print full results as JSON')
+        parser.add_argument('--trace-memory', action='store_true', help='Also report peak Python memory during each sync (slower)')
+
+    def handle(self, *args, **options):
+        names = options['scenarios'] or list(SCENARIOS)
+        unknown = [name for name in names if name not in SCENARIOS]
+        if unknown:
+            raise CommandError(f"Unknown scenario(s): {', '.join(unknown)}")
+
+        baseline = load_baseline()
+        results, regressions = {}, []
+        for name in names:
+            platform, spec = SCENARIOS[name]
+            self.stdout.write(f"Running {name}...")
+            result = run_scenario(platform, spec, options['trace_memory'], snapshot=name in SNAPSHOT_SCENARIOS)
+            results[name] = result
+            regressions += compare(name, result, baseline, options['tolerance'])
+            self.stdout.write(
+                f"  {result['seconds']}s, {result['principals_per_second']} principals/s, "
+                f"{result['api_calls']} API calls, {result['db_writes']} DB writes / {result['db_queries']} queries, "
+                f"{result['throttles']} throttles"
+            )
+            self.stdout.write('  ' + ', '.join(
+                f"{name} {stage['per_second']}/s (max depth {stage['max_depth']})" for name, stage in result['pipeline'].items()
+            ))
+            if 'peak_traced_kb' in result:
+                self.stdout.write(f"  peak traced memory {result['peak_traced_kb']} KB")
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+
+        if options['update_baseline']:
+            save_baseline(results)
+            self.stdout.write(self.style.SUCCESS(f"Baseline updated for {len(results)} scenario(s)."))
+            return
+
+        if regressions:
+            for line in regressions:
+                self.stderr.write(self.style.ERROR(line))
+            raise CommandError(f"{len(regressions)} regression(s) against the baseline")
+        self.stdout.write(self.style.SUCCESS('No regressions against the baseline.'))
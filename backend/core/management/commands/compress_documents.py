@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core import storage
+from core.models import PolicyDocument
+
+FIELDS = ('document', 'finding_details', 'statement_results')
+
+
+class Command(BaseCommand):
+    help = 'Trains a compression dictionary on stored documents and re-encodes documents with it (core/storage.py)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--train', action='store_true', help='Train a new dictionary first')
+        parser.add_argument('--samples', type=int, default=2000, help='Documents to train on; each gives up to three samples')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Documents re-encoded per query')
+
+    def handle(self, *args, **options):
+        config = storage.get_config()
+        if options['train']:
+            documents = PolicyDocument.objects.order_by('?').values_list(*FIELDS)[:options['samples']]
+            samples = [storage.decode(value) for row in documents for value in row if value]
+            try:
+                dict_id = storage.train_dictionary(samples, config)
+            except ValueError as e:
+                raise CommandError(str(e))
+            self.stdout.write(f"Trained dictionary {dict_id} on {len(samples)} values")
+
+        # 1. Re-encode what wasn't written with the current dictionary (or as MODE now says)
+        current = storage.current_dictionary(config) if config['MODE'] == 'zstd' and storage.zstandard else None
+        before = after = rewritten = 0
+        last_hash = ''
+        while True:
+            batch = list(PolicyDocument.objects.filter(hash__gt=last_hash).order_by('hash').values_list('hash', *FIELDS)[:options['batch_size']])
+            if not batch:
+                break
+            changed = []
+            for digest, *values in batch:
+                encoded = [self._encode(value, current, config) for value in values]
+                before += sum(len(value) for value in values)
+                after += sum(len(value) for value in encoded)
+                if encoded != values:
+                    changed.append(PolicyDocument(hash=digest, **dict(zip(FIELDS, encoded))))
+            # Encoded values are written as they are
+            PolicyDocument.objects.bulk_update(changed, FIELDS)
+            rewritten += len(changed)
+            last_hash = batch[-1][0]
+
+        # 2. Report
+        ratio = f" ({after / before:.1%})" if before else ''
+        self.stdout.write(f"{rewritten} documents re-encoded; stored bodies {before / 1e6:.1f} MB -> {after / 1e6:.1f} MB{ratio}")
+        self.stdout.write(self.style.SUCCESS('Documents compressed.'))
+
+    def _encode(self, value, current, config):
+        if current is not None and storage.stored_dictionary(value) == current:
+            return value
+        return storage.Encoded(storage.encode(storage.decode(value), config, current))
@@ -0,0 +1,51 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.credentials import without_credentials
+from core.models import CloudAccount, SyncRun
+from core.snapshots import PLATFORMS, ijson
+from core.tasks import dispatch_sync, sync_cloud_iam
+
+
+class Command(BaseCommand):
+    help = 'Syncs an air-gapped account from an exported IAM snapshot (see core/snapshots.py for the formats)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('account_id', type=int)
+        parser.add_argument('path', help='`aws iam get-account-authorization-details` or `az role assignment list --all` output')
+        parser.add_argument('--definitions', help='Azure: `az role definition list` output, unless it is in the same file')
+        parser.add_argument('--queue', action='store_true', help='Hand it to a sync-full worker instead; the files must be readable there')
+
+    def handle(self, *args, **options):
+        try:
+            account = without_credentials(CloudAccount.objects).get(id=options['account_id'])
+        except CloudAccount.DoesNotExist:
+            raise CommandError(f"No cloud account {options['account_id']}")
+        if account.platform not in PLATFORMS:
+            raise CommandError(f"Snapshots are supported for {', '.join(PLATFORMS)}, not {account.platform}")
+        for path in (options['path'], options['definitions']):
+            if path and not os.path.isfile(path):
+                raise CommandError(f"No such file: {path}")
+        if ijson is None:
+            self.stderr.write(self.style.WARNING('ijson is not installed; the whole file will be loaded into memory'))
+
+        snapshot = {'path': os.path.abspath(options['path'])}
+        if options['definitions']:
+            snapshot['definitions'] = os.path.abspath(options['definitions'])
+
+        if options['queue']:
+            task = dispatch_sync(account.id, account.platform, 'full', snapshot=snapshot)
+            self.stdout.write(self.style.SUCCESS(f"Queued as task {task.id}"))
+            return
+
+        message = sync_cloud_iam(account.id, snapshot)
+        run = SyncRun.objects.filter(cloud_account=account).first()
+        if run is None or run.status != 'success':
+            raise CommandError(run.error if run and run.error else message)
+        persist = run.pipeline_stats.get('persist', {})
+        self.stdout.write(
+            f"{run.duration_ms / 1000:.1f}s, {persist.get('items', 0)} records ({persist.get('per_second')}/s), "
+            f"{run.rows_written} rows written, {run.rows_skipped} unchanged"
+        )
+        self.stdout.write(self.style.SUCCESS(message))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from core.models import CloudAccount
+from core.effective import refresh_account
+from core.escalation import refresh_account_graph
+
+class Command(BaseCommand):
+    help = 'Rebuilds the effective-permission index and escalation paths (e.g. after seeding or a bulk import)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--account', type=int, action='append', help='Only rebuild these cloud account ids')
+
+    def handle(self, *args, **options):
+        accounts = CloudAccount.objects.all()
+        if options['account']:
+            accounts = accounts.filter(id__in=options['account'])
+
+        for account in accounts:
+            changed = refresh_account(account)
+            paths = refresh_account_graph(account)
+            self.stdout.write(f"{account}: {changed} entities updated, {paths} escalation paths updated")
+
+        self.stdout.write(self.style.SUCCESS('Effective permissions rebuilt.'))
@@ -1,31 +1,44 @@
 import random
+import time
+from datetime import timedelta
 from django.core.management.base import BaseCommand
+from django.db import transaction
 from django.utils import timezone
-from core.models import User, CloudAccount, IAMEntity, IAMPolicy
+from core.models import User, CloudAccount, IAMEntity, IAMPolicy, PolicyDocument, PolicyStatement
+from core.documents import document_hash, store_unscanned
+from core.search import project_documents
+from core.generators import aws_policy_document, azure_role_document, gcp_binding_document
+from core.scanner import SCANNER_VERSION, SecurityScanner
 
 class Command(BaseCommand):
-    help = 'Populates the database with 30 diverse IAM policies'
+    help = 'Populates the database with 30 diverse IAM policies, or with millions in scale mode (--accounts/--entities)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--accounts', type=int, help='Scale mode: number of cloud accounts to create (round-robin over AWS/Azure/GCP)')
+        parser.add_argument('--entities', type=int, help='Scale mode: entities per account')
+        parser.add_argument('--policies-per-entity', type=int, default=3, help='Scale mode: policies attached to each entity')
+        parser.add_argument('--seed', type=int, help='Random seed for reproducible data')
+        parser.add_argument('--append', action='store_true', help='Scale mode: keep existing data and add to it')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Scale mode: rows per bulk_create')
+        parser.add_argument('--shared-ratio', type=float, default=0.7, help='Scale mode: share of policies drawn from a pool of common (managed) documents')
+
+    def handle(self, *args, **options):
+        if options['seed'] is not None:
+            random.seed(options['seed'])
+
+        if options['accounts'] or options['entities']:
+            return self.handle_scale(options)
 
-    def handle(self, *args, **kwargs):
         # 1. Cleanup existing data (order matters due to ForeignKeys)
-        self.stdout.write("Cleaning up old data...")
-        IAMPolicy.objects.all().delete()
-        IAMEntity.objects.all().delete()
-        CloudAccount.objects.all().delete()
-        # We'll keep the superuser if it exists, otherwise create a dummy
-        user = User.objects.filter(is_superuser=True).first()
-        if not user:
-            user = User.objects.create_user(
-                email="admin@missioncontrol.local",
-                password="password123"
-            )
+        self.cleanup()
+        user = self.get_user()
 
         platforms = ['aws', 'azure', 'gcp']
         entity_types = ['user', 'role', 'group']
         base_names = ['Admin', 'Dev', 'Storage', 'Lambda', 'Scanner', 'Billing']
-        
+
         self.stdout.write("Seeding Cloud Accounts...")
-        
+
         # 2. Create one Cloud Account for each platform
         accounts = {}
         for p in platforms:
@@ -48,17 +61,18 @@ class Command(BaseCommand):
             e_type = random.choice(entity_types)
             e_name = f"{random.choice(base_names)}_{i}"
             risk_score = random.randint(0, 100)
-            
+
             # 4. Create the Entity
             entity_obj = IAMEntity.objects.create(
                 cloud_account=selected_account,
+                user=selected_account.user,
                 name=e_name,
                 arn_or_id=f"arn:{platform}:iam::id:{e_type}/{e_name}_{i}", # Ensure uniqueness
                 entity_type=e_type,
                 created_at_in_cloud=timezone.now(),
                 last_used=timezone.now()
             )
-            
+
             # 5. Create Mock Document
             doc = {
                 "Version": "2012-10-17",
@@ -69,17 +83,193 @@ class Command(BaseCommand):
                 }]
             }
 
-            # 6. Create the Policy
+            # 6. Create the Policy (the mock result is provisional, the next sync rescans it)
+            policy_document = store_unscanned(doc, platform, risk_score, {
+                "reason": "Wildcard access detected" if risk_score > 70 else "Baseline check passed",
+                "timestamp": timezone.now().isoformat()
+            })
             IAMPolicy.objects.create(
                 entity=entity_obj,
+                cloud_account=selected_account,
+                user=selected_account.user,
                 name=f"Policy_{e_name}",
-                document=doc,
+                policy_document=policy_document,
                 risk_score=risk_score,
-                is_vulnerable=risk_score > 70,
-                finding_details={
-                    "reason": "Wildcard access detected" if risk_score > 70 else "Baseline check passed",
-                    "timestamp": timezone.now().isoformat()
-                }
+                is_vulnerable=risk_score > 70
+            )
+
+        self.stdout.write(self.style.SUCCESS('Successfully seeded 30 policies across all platforms!'))
+
+    def cleanup(self):
+        self.stdout.write("Cleaning up old data...")
+        IAMPolicy.objects.all().delete()
+        PolicyStatement.objects.all().delete()
+        PolicyDocument.objects.all().delete()
+        IAMEntity.objects.all().delete()
+        CloudAccount.objects.all().delete()
+
+    def get_user(self):
+        # We'll keep the superuser if it exists, otherwise create a dummy
+        user = User.objects.filter(is_superuser=True).first()
+        if not user:
+            user = User.objects.filter(email="admin@missioncontrol.local").first() or User.objects.create_user(
+                email="admin@missioncontrol.local",
+                password="password123"
             )
+        return user
+
+    # --- SCALE MODE ---
+
+    def handle_scale(self, options):
+        """
+        Streams entities and policies into the DB in bulk_create batches.
+        Only one batch is held in memory at a time, so memory use stays flat
+        no matter how many rows are generated.
+        """
+        rng = random.Random(options['seed'])
+        n_accounts = options['accounts'] or 1
+        n_entities = options['entities'] or 1000
+        per_entity = options['policies_per_entity']
+        batch_size = options['batch_size']
+
+        if not options['append']:
+            self.cleanup()
+        user = self.get_user()
+
+        # Common documents are shared across many entities, like AWS managed policies.
+        # Each one becomes a single PolicyDocument that is only scanned once.
+        self.pools = {
+            'aws': [aws_policy_document(rng) for _ in range(200)],
+            'azure': [azure_role_document(rng) for _ in range(100)],
+        }
+        self.shared_documents = {}
+        self.new_documents = {}
+        self.shared_ratio = options['shared_ratio']
+
+        total = n_accounts * n_entities * (1 + per_entity)
+        self.stdout.write(f"Seeding {n_accounts} accounts x {n_entities} entities x {per_entity} policies ({total:,} rows)...")
+        started = time.perf_counter()
+        written = 0
+        platforms = ['aws', 'azure', 'gcp']
+        run_tag = rng.randrange(16 ** 6)
+
+        for a in range(n_accounts):
+            platform = platforms[a % len(platforms)]
+            account = CloudAccount.objects.create(
+                user=user,
+                name=f"Load Test {platform.upper()} {a + 1}",
+                platform=platform,
+                last_sync_status=True,
+                last_sync_at=timezone.now()
+            )
+
+            for offset in range(0, n_entities, batch_size):
+                count = min(batch_size, n_entities - offset)
+                with transaction.atomic():
+                    entities = IAMEntity.objects.bulk_create(
+                        [self.build_entity(rng, account, run_tag, offset + i) for i in range(count)],
+                        batch_size=batch_size
+                    )
+                    written += len(entities)
+
+                    batch = []
+                    for entity in entities:
+                        for n in range(per_entity):
+                            batch.append(self.build_policy(rng, entity, platform, n))
+                            if len(batch) >= batch_size:
+                                self.flush_documents(batch_size)
+                                IAMPolicy.objects.bulk_create(batch, batch_size=batch_size)
+                                written += len(batch)
+                                batch = []
+                    if batch:
+                        self.flush_documents(batch_size)
+                        IAMPolicy.objects.bulk_create(batch, batch_size=batch_size)
+                        written += len(batch)
+
+                elapsed = time.perf_counter() - started
+                self.stdout.write(f"  {written:,}/{total:,} rows ({written / elapsed * 60:,.0f} rows/min)")
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {written:,} rows in {elapsed:.1f}s ({written / elapsed * 60:,.0f} rows/min)"
+        ))
+
+    def build_entity(self, rng, account, run_tag, i):
+        now = timezone.now()
+        created = now - timedelta(days=rng.randint(1, 1100))
+        if account.platform == 'aws':
+            e_type = rng.choices(['user', 'role', 'group'], weights=[6, 3, 1])[0]
+            name = f"{rng.choice(['svc', 'dev', 'ops', 'ci', 'data', 'app'])}-{e_type}-{i}"
+            arn = f"arn:aws:iam::{account.id:012d}:{e_type}/{name}-{run_tag:06x}"
+        elif account.platform == 'azure':
+            e_type = 'user'
+            name = f"Azure-Principal-{i:08x}"
+            arn = f"{account.id:08x}-{run_tag:04x}-4000-8000-{i:012x}"
+        else:
+            e_type = 'user'
+            name = f"sa-{i}@loadtest-{account.id}.iam.gserviceaccount.com"
+            arn = f"{account.id:06d}{run_tag:06x}{i:09d}"
+
+        return IAMEntity(
+            cloud_account=account,
+            user_id=account.user_id,
+            name=name,
+            arn_or_id=arn,
+            entity_type=e_type,
+            created_at_in_cloud=created,
+            last_used=None if rng.random() < 0.2 else now - timedelta(days=rng.randint(0, 400))
+        )
+
+    def build_policy(self, rng, entity, platform, n):
+        shared = platform in self.pools and rng.random() < self.shared_ratio
+        if shared:
+            index = rng.randrange(len(self.pools[platform]))
+            doc = self.pools[platform][index]
+            name = f"Managed-{platform}-{index}"
+            cache_key = (platform, index)
+        elif platform == 'aws':
+            doc, name, cache_key = aws_policy_document(rng), f"Inline-{entity.name}-{n}", None
+        elif platform == 'azure':
+            doc, name, cache_key = azure_role_document(rng), f"Custom-Role-{entity.name}-{n}", None
+        else:
+            doc, name, cache_key = gcp_binding_document(rng, entity.name), f"Binding-{n}", None
+
+        if cache_key in self.shared_documents:
+            policy_document = self.shared_documents[cache_key]
+        else:
+            scanner = SecurityScanner(doc)
+            if platform == 'aws':
+                score, findings, statement_results = scanner.scan_aws_statements()
+            else:
+                (score, findings), statement_results = getattr(scanner, f"scan_{platform}")(), {}
+            policy_document = PolicyDocument(
+                hash=document_hash(doc, platform),
+                platform=platform,
+                document=doc,
+                risk_score=score,
+                is_vulnerable=score > 50,
+                finding_details={"issues": findings},
+                statement_results=statement_results,
+                scanner_version=SCANNER_VERSION
+            )
+            self.new_documents[policy_document.hash] = policy_document
+            if cache_key:
+                self.shared_documents[cache_key] = policy_document
+
+        return IAMPolicy(
+            entity=entity,
+            cloud_account_id=entity.cloud_account_id,
+            user_id=entity.user_id,
+            name=name,
+            policy_document=policy_document,
+            risk_score=policy_document.risk_score,
+            is_vulnerable=policy_document.is_vulnerable
+        )
 
-        self.stdout.write(self.style.SUCCESS('Successfully seeded 30 policies across all platforms!'))
\ No newline at end of file
+    def flush_documents(self, batch_size):
+        """Documents have to exist before the policies that point at them."""
+        existing = set(PolicyDocument.objects.filter(hash__in=list(self.new_documents)).values_list('hash', flat=True))
+        created = [doc for digest, doc in self.new_documents.items() if digest not in existing]
+        PolicyDocument.objects.bulk_create(created, batch_size=batch_size)
+        project_documents(created)
+        self.new_documents = {}
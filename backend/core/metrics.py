@@ -0,0 +1,276 @@
+"""
+Sync instrumentation.
+
+A `SyncRecorder` is activated for the duration of `sync_cloud_iam`. Fetchers
+grab it with `get_recorder()` and use it to time phases, count API calls and
+record how many rows were written or skipped. At the end of the run the
+numbers are stored on a `SyncRun` row, and `render_prometheus` exports the
+latest run per account for the `/metrics` endpoint. The crawl runs in the
+sync pipeline's fetch thread (core/pipeline.py), so its 'list' and 'fetch'
+phases overlap the others and phase times can add up to more than the run.
+Accounts that enumerate targets crawl them from several threads at once
+(core/targets.py); `pace()` holds each API request to the rate they share.
+"""
+import contextvars
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.db.models import Count, Max
+from django.utils import timezone
+
+from .documents import DocumentCache
+from .models import SyncRun
+
+try:
+    import resource
+except ImportError:  # Windows dev machines
+    resource = None
+
+THROTTLE_CODES = {
+    'Throttling', 'ThrottlingException', 'TooManyRequestsException',
+    'RequestLimitExceeded', 'SlowDown', 'TooManyRequests', 'ResourceExhausted',
+}
+
+_current = contextvars.ContextVar('sync_recorder', default=None)
+
+
+class SyncRecorder:
+    def __init__(self):
+        self.phase_seconds = defaultdict(float)
+        self.api_calls = {}
+        self.throttles = 0
+        self.retries = 0
+        self.rows_written = 0
+        self.rows_skipped = 0
+        self.changed_entity_ids = set() # Entities whose policies or groups changed in this run
+        self.documents = DocumentCache() # Recently resolved PolicyDocuments, by hash (core/documents.py)
+        self.findings = [] # Unsaved FindingRecords, appended per persisted batch (core/history.py)
+        self.stages = {} # Per-stage throughput and queue depths of the sync pipeline (core/pipeline.py)
+        self.targets = {} # Roll-up of a multi-target sync (core/targets.py)
+        self.limiter = None # RateLimiter shared by the crawl threads of a multi-target sync
+        self._lock = threading.Lock() # API calls and retries are recorded from several crawl threads in multi-target syncs
+        self.started = time.perf_counter()
+
+    @contextmanager
+    def activate(self):
+        """Makes this recorder the one `get_recorder()` returns."""
+        token = _current.set(self)
+        try:
+            yield self
+        finally:
+            _current.reset(token)
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phase_seconds[name] += time.perf_counter() - start
+
+    def pace(self):
+        """Waits until the next API request is allowed by the limiter, if any."""
+        if self.limiter is not None:
+            self.limiter.acquire()
+
+    def timed_iter(self, phase, iterable, operation=None):
+        """
+        Iterates a lazy pager, charging each step to `phase`. When `operation`
+        is given every step is also counted as one API call (use it with
+        page iterators, where one step == one request).
+        """
+        iterator = iter(iterable)
+        while True:
+            if operation:
+                self.pace()
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.phase_seconds[phase] += time.perf_counter() - start
+                return
+            elapsed = time.perf_counter() - start
+            self.phase_seconds[phase] += elapsed
+            if operation:
+                self.record_call(operation, elapsed)
+            yield item
+
+    def call(self, operation, fn, *args, **kwargs):
+        """Runs one SDK call and records its latency (used for Azure/GCP clients)."""
+        self.pace()
+        start = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            self.record_call(operation, time.perf_counter() - start, error=e)
+            if _error_code(e) in THROTTLE_CODES:
+                self.record_retries(throttles=1)
+            raise
+        self.record_call(operation, time.perf_counter() - start)
+        return result
+
+    def record_call(self, operation, elapsed, error=None):
+        ms = elapsed * 1000
+        with self._lock:
+            stats = self.api_calls.setdefault(operation, {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'errors': 0})
+            stats['count'] += 1
+            stats['total_ms'] += ms
+            stats['max_ms'] = max(stats['max_ms'], ms)
+            if error is not None:
+                stats['errors'] += 1
+
+    def record_retries(self, throttles=0, retries=0):
+        with self._lock:
+            self.throttles += throttles
+            self.retries += retries
+
+    def instrument_boto3(self, client):
+        """
+        Hooks botocore's event system so every request made by `client`
+        (including paginator pages) is timed and paced, and throttles/retries
+        done by botocore's built-in retry handler are counted.
+        """
+        events = client.meta.events
+        service = client.meta.service_model.service_name
+
+        def before_parameter_build(context, **kwargs):
+            context['sentinel_started'] = time.perf_counter()
+
+        def after_call(parsed, model, context, **kwargs):
+            elapsed = time.perf_counter() - context.get('sentinel_started', time.perf_counter())
+            self.record_call(f"{service}.{model.name}", elapsed)
+            self.record_retries(retries=parsed.get('ResponseMetadata', {}).get('RetryAttempts', 0))
+
+        def after_call_error(exception, context, event_name, **kwargs):
+            elapsed = time.perf_counter() - context.get('sentinel_started', time.perf_counter())
+            self.record_call(f"{service}.{event_name.rsplit('.', 1)[-1]}", elapsed, error=exception)
+
+        def before_send(**kwargs):
+            # Once per attempt, so retries are paced too; returning None lets the request go out
+            self.pace()
+
+        def needs_retry(response, **kwargs):
+            # Called once per attempt; only inspect it, the retry decision stays with botocore
+            if response and response[1].get('Error', {}).get('Code') in THROTTLE_CODES:
+                self.record_retries(throttles=1)
+
+        events.register(f'before-parameter-build.{service}', before_parameter_build)
+        events.register(f'after-call.{service}', after_call)
+        events.register(f'after-call-error.{service}', after_call_error)
+        events.register(f'before-send.{service}', before_send)
+        events.register(f'needs-retry.{service}', needs_retry)
+        return client
+
+    def finish(self, run, status, error=''):
+        """Copies the collected numbers onto a SyncRun row and saves it."""
+        run.status = status
+        run.error = error
+        run.finished_at = timezone.now()
+        run.duration_ms = int((time.perf_counter() - self.started) * 1000)
+        run.phase_timings = {name: round(seconds * 1000, 1) for name, seconds in self.phase_seconds.items()}
+        run.api_calls = {
+            op: {**stats, 'total_ms': round(stats['total_ms'], 1), 'max_ms': round(stats['max_ms'], 1)}
+            for op, stats in self.api_calls.items()
+        }
+        run.throttle_count = self.throttles
+        run.retry_count = self.retries
+        run.rows_written = self.rows_written
+        run.rows_skipped = self.rows_skipped
+        run.pipeline_stats = self.stages
+        run.target_stats = self.targets
+        run.peak_rss_kb = peak_rss_kb()
+        run.save()
+        return run
+
+
+def get_recorder():
+    """The active recorder, or a throwaway one when called outside a sync."""
+    return _current.get() or SyncRecorder()
+
+
+def peak_rss_kb():
+    """
+    Peak resident memory of this process. Note that prefork workers are
+    reused, so this is the high-water mark since the worker started.
+    """
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss  # KB on Linux
+
+
+def _error_code(error):
+    response = getattr(error, 'response', None)
+    if isinstance(response, dict):
+        return response.get('Error', {}).get('Code')
+    return type(error).__name__
+
+
+# --- PROMETHEUS EXPORT ---
+
+def _labels(**labels):
+    parts = []
+    for key, value in labels.items():
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{key}="{value}"')
+    return '{' + ','.join(parts) + '}'
+
+
+def render_prometheus():
+    """Renders run totals and the latest SyncRun per account in Prometheus text format."""
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in samples:
+            lines.append(f"{name}{_labels(**labels)} {value}")
+
+    totals = SyncRun.objects.values('cloud_account__platform', 'status').annotate(n=Count('id'))
+    metric('sentinel_sync_runs_total', 'counter', 'Sync runs by platform and outcome.', [
+        ({'platform': row['cloud_account__platform'], 'status': row['status']}, row['n']) for row in totals
+    ])
+
+    latest_ids = SyncRun.objects.exclude(status='running').values('cloud_account').annotate(last=Max('id')).values('last')
+    latest = list(SyncRun.objects.filter(id__in=latest_ids).select_related('cloud_account'))
+
+    def per_account(run, **extra):
+        return {'account_id': run.cloud_account_id, 'platform': run.cloud_account.platform, **extra}
+
+    metric('sentinel_sync_last_duration_seconds', 'gauge', 'Wall time of the last sync.', [
+        (per_account(r), r.duration_ms / 1000) for r in latest if r.duration_ms is not None
+    ])
+    metric('sentinel_sync_last_success', 'gauge', '1 if the last sync succeeded.', [
+        (per_account(r), int(r.status == 'success')) for r in latest
+    ])
+    metric('sentinel_sync_last_phase_seconds', 'gauge', 'Wall time per phase of the last sync.', [
+        (per_account(r, phase=phase), ms / 1000) for r in latest for phase, ms in r.phase_timings.items()
+    ])
+    metric('sentinel_sync_last_api_calls', 'gauge', 'API calls per operation in the last sync.', [
+        (per_account(r, operation=op), stats['count']) for r in latest for op, stats in r.api_calls.items()
+    ])
+    metric('sentinel_sync_last_api_seconds', 'gauge', 'Total API latency per operation in the last sync.', [
+        (per_account(r, operation=op), stats['total_ms'] / 1000) for r in latest for op, stats in r.api_calls.items()
+    ])
+    for field, help_text in [
+        ('throttle_count', 'Throttled API responses in the last sync.'),
+        ('retry_count', 'SDK retries in the last sync.'),
+        ('rows_written', 'DB rows written by the last sync.'),
+        ('rows_skipped', 'Unchanged rows skipped by the last sync.'),
+    ]:
+        metric(f'sentinel_sync_last_{field}', 'gauge', help_text, [(per_account(r), getattr(r, field)) for r in latest])
+    metric('sentinel_sync_last_stage_items_per_second', 'gauge', 'Items per second through each sync pipeline stage in the last sync.', [
+        (per_account(r, stage=stage), stats['per_second']) for r in latest for stage, stats in r.pipeline_stats.items() if stats.get('per_second') is not None
+    ])
+    metric('sentinel_sync_last_stage_max_depth', 'gauge', 'Largest backlog in front of each sync pipeline stage in the last sync.', [
+        (per_account(r, stage=stage), stats['max_depth']) for r in latest for stage, stats in r.pipeline_stats.items()
+    ])
+    metric('sentinel_sync_last_failed_targets', 'gauge', 'Member accounts, subscriptions or projects that failed in the last sync.', [
+        (per_account(r), r.target_stats['failed']) for r in latest if r.target_stats
+    ])
+    metric('sentinel_sync_last_peak_rss_bytes', 'gauge', 'Peak worker RSS at the end of the last sync.', [
+        (per_account(r), r.peak_rss_kb * 1024) for r in latest if r.peak_rss_kb is not None
+    ])
+
+    return '\n'.join(lines) + '\n'
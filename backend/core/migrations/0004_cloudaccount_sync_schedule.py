@@ -0,0 +1,38 @@
+# Generated by Django 6.0.1 on 2026-10-19 10:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_iamentity_iampolicy'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cloudaccount',
+            name='consecutive_failures',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='cloudaccount',
+            name='last_change_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='cloudaccount',
+            name='next_sync_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='cloudaccount',
+            name='sync_interval',
+            field=models.PositiveIntegerField(default=3600, help_text='Current sync interval in seconds'),
+        ),
+        migrations.AddField(
+            model_name='cloudaccount',
+            name='sync_started_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
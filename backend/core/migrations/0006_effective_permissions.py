@@ -0,0 +1,51 @@
+# Generated by Django 6.0.1 on 2026-10-19 11:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_syncrun'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EffectivePermissionSet',
+            fields=[
+                ('entity', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='effective_permissions', serialize=False, to='core.iamentity')),
+                ('allow', models.JSONField(default=list)),
+                ('deny', models.JSONField(default=list)),
+                ('fingerprint', models.CharField(max_length=64)),
+                ('computed_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='iamentity',
+            name='groups',
+            field=models.ManyToManyField(blank=True, related_name='members', to='core.iamentity'),
+        ),
+        migrations.AddField(
+            model_name='iampolicy',
+            name='policy_type',
+            field=models.CharField(choices=[('managed', 'Managed'), ('inline', 'Inline')], default='managed', max_length=10),
+        ),
+        migrations.CreateModel(
+            name='ActionGrant',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('effect', models.CharField(choices=[('allow', 'Allow'), ('deny', 'Deny')], max_length=5)),
+                ('action', models.CharField(max_length=255)),
+                ('action_prefix', models.CharField(max_length=255)),
+                ('is_wildcard', models.BooleanField(default=False)),
+                ('resource', models.CharField(max_length=1024)),
+                ('conditional', models.BooleanField(default=False)),
+                ('cloud_account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.cloudaccount')),
+                ('entity', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='action_grants', to='core.iamentity')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['action', 'effect'], name='core_action_action_3430f2_idx'), models.Index(condition=models.Q(('is_wildcard', True)), fields=['action_prefix', 'effect'], name='core_grant_wildcard_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 6.0.1 on 2026-10-19 11:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_effective_permissions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='iamentity',
+            name='trust_policy',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='EscalationEdge',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('target_pattern', models.CharField(blank=True, max_length=1024)),
+                ('kind', models.CharField(choices=[('trust', 'Named in trust policy'), ('assume', 'sts:AssumeRole'), ('pass_role', 'iam:PassRole'), ('join_group', 'iam:AddUserToGroup')], max_length=10)),
+                ('cloud_account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.cloudaccount')),
+                ('source', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='escalation_edges', to='core.iamentity')),
+                ('target', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.iamentity')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['cloud_account', 'kind'], name='core_escala_cloud_a_d8d2f3_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='EscalationPath',
+            fields=[
+                ('entity', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='escalation_path', serialize=False, to='core.iamentity')),
+                ('hops', models.PositiveSmallIntegerField()),
+                ('path', models.JSONField(default=list)),
+                ('computed_at', models.DateTimeField(auto_now=True)),
+                ('cloud_account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.cloudaccount')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['cloud_account', 'hops'], name='core_escala_cloud_a_4d5ab4_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 6.0.1 on 2026-10-19 11:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_escalation_graph'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IAMPolicyVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveIntegerField()),
+                ('source', models.CharField(choices=[('sync', 'Cloud sync'), ('edit', 'Policy editor')], default='sync', max_length=10)),
+                ('statement_key', models.CharField(blank=True, max_length=20)),
+                ('fields', models.JSONField(blank=True, null=True)),
+                ('statement_hashes', models.JSONField(default=list)),
+                ('added', models.JSONField(default=dict)),
+                ('removed', models.JSONField(default=list)),
+                ('snapshot', models.JSONField(blank=True, null=True)),
+                ('risk_score', models.IntegerField(default=0)),
+                ('finding_details', models.JSONField(blank=True, default=dict)),
+                ('statement_results', models.JSONField(blank=True, default=dict)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('policy', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='versions', to='core.iampolicy')),
+            ],
+            options={
+                'ordering': ['-version'],
+                'constraints': [models.UniqueConstraint(fields=('policy', 'version'), name='core_policy_version_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 6.0.1 on 2026-10-19 12:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# The data copy (0010_policydocument_data) and the cleanup (0011_policydocument_cleanup) are
+# separate migrations: each runs in its own transaction, so on PostgreSQL the trigger events
+# queued by the copy are settled before the later ALTER TABLEs on core_iampolicy
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_policy_versions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PolicyDocument',
+            fields=[
+                ('hash', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('platform', models.CharField(max_length=10)),
+                ('document', models.JSONField(help_text='The raw JSON policy structure')),
+                ('is_vulnerable', models.BooleanField(default=False)),
+                ('risk_score', models.IntegerField(default=0)),
+                ('finding_details', models.JSONField(blank=True, default=dict)),
+                ('statement_results', models.JSONField(blank=True, default=dict)),
+                ('scanner_version', models.PositiveSmallIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='iampolicy',
+            name='policy_document',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='attachments', to='core.policydocument'),
+        ),
+        # Nullable first, so the column can be restored when migrating backwards
+        migrations.AlterField(
+            model_name='iampolicy',
+            name='document',
+            field=models.JSONField(null=True, help_text='The raw JSON policy structure'),
+        ),
+    ]
@@ -0,0 +1,74 @@
+# Generated by Django 6.0.1 on 2026-10-19 12:05
+
+import hashlib
+import json
+
+from django.db import migrations
+
+BATCH_SIZE = 2000
+
+
+def document_hash(document, platform):
+    # Same as core.documents.document_hash, frozen here so the migration doesn't depend on app code
+    canonical = json.dumps(document, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(f"{platform}:{canonical}".encode()).hexdigest()
+
+
+def move_documents(apps, schema_editor):
+    """Stores each distinct document once and points the policies at it. Old scans are kept but marked for a rescan."""
+    IAMPolicy = apps.get_model('core', 'IAMPolicy')
+    PolicyDocument = apps.get_model('core', 'PolicyDocument')
+
+    last_id = 0
+    while True:
+        batch = list(
+            IAMPolicy.objects.filter(id__gt=last_id).order_by('id')
+            .values('id', 'document', 'risk_score', 'is_vulnerable', 'finding_details', 'entity__cloud_account__platform')[:BATCH_SIZE]
+        )
+        if not batch:
+            break
+
+        documents, policies = {}, []
+        for row in batch:
+            platform = row['entity__cloud_account__platform']
+            digest = document_hash(row['document'], platform)
+            documents.setdefault(digest, PolicyDocument(
+                hash=digest,
+                platform=platform,
+                document=row['document'],
+                risk_score=row['risk_score'],
+                is_vulnerable=row['is_vulnerable'],
+                finding_details=row['finding_details'],
+                scanner_version=0,
+            ))
+            policies.append(IAMPolicy(id=row['id'], policy_document_id=digest))
+
+        PolicyDocument.objects.bulk_create(documents.values(), ignore_conflicts=True)
+        IAMPolicy.objects.bulk_update(policies, ['policy_document'])
+        last_id = batch[-1]['id']
+
+
+def copy_documents_back(apps, schema_editor):
+    IAMPolicy = apps.get_model('core', 'IAMPolicy')
+
+    last_id = 0
+    while True:
+        batch = list(IAMPolicy.objects.filter(id__gt=last_id).order_by('id').select_related('policy_document')[:BATCH_SIZE])
+        if not batch:
+            break
+        for policy in batch:
+            policy.document = policy.policy_document.document
+            policy.finding_details = policy.policy_document.finding_details
+        IAMPolicy.objects.bulk_update(batch, ['document', 'finding_details'])
+        last_id = batch[-1].id
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_policydocument'),
+    ]
+
+    operations = [
+        migrations.RunPython(move_documents, copy_documents_back),
+    ]
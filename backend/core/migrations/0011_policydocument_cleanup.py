@@ -0,0 +1,31 @@
+# Generated by Django 6.0.1 on 2026-10-19 12:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_policydocument_data'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='iampolicy',
+            name='document',
+        ),
+        migrations.RemoveField(
+            model_name='iampolicy',
+            name='finding_details',
+        ),
+        migrations.AlterField(
+            model_name='iampolicy',
+            name='policy_document',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='attachments', to='core.policydocument'),
+        ),
+        migrations.RemoveField(
+            model_name='iampolicyversion',
+            name='statement_results',
+        ),
+    ]
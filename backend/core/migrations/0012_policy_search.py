@@ -0,0 +1,123 @@
+# Generated by Django 6.0.1 on 2026-10-19 11:33
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+BATCH_SIZE = 2000
+WILDCARDS = ('*', '?')
+
+
+# Same as core.search at the time of writing, frozen here so the migration doesn't depend on app code
+def _as_list(value):
+    if value is None:
+        return []
+    return [value] if isinstance(value, str) else list(value)
+
+
+def _prefix(pattern):
+    cut = min((pattern.index(w) for w in WILDCARDS if w in pattern), default=len(pattern))
+    return pattern[:cut]
+
+
+def _kind(pattern):
+    if not any(w in pattern for w in WILDCARDS):
+        return 'exact'
+    if pattern.endswith('*') and not any(w in pattern[:-1] for w in WILDCARDS):
+        return 'prefix'
+    return 'glob'
+
+
+def statement_rows(document, platform):
+    document = document or {}
+    if platform == 'gcp':
+        if document.get('role'):
+            yield 0, 'allow', document['role'].lower(), '*', ''
+        return
+    if platform == 'azure':
+        for action in _as_list(document.get('actions')):
+            yield 0, 'allow', action.lower(), '*', ''
+        return
+
+    statements = document.get('Statement', [])
+    if isinstance(statements, dict):
+        statements = [statements]
+    for index, stmt in enumerate(statements):
+        effect = str(stmt.get('Effect', '')).lower()
+        if effect not in ('allow', 'deny'):
+            continue
+        condition_keys = sorted({key.lower() for operator in (stmt.get('Condition') or {}).values() if isinstance(operator, dict) for key in operator}) or ['']
+        for action in _as_list(stmt.get('Action')):
+            for resource in _as_list(stmt.get('Resource')) or ['*']:
+                for condition_key in condition_keys:
+                    yield index, effect, action.lower(), resource, condition_key
+
+
+def project_documents(apps, schema_editor):
+    PolicyDocument = apps.get_model('core', 'PolicyDocument')
+    PolicyStatement = apps.get_model('core', 'PolicyStatement')
+
+    last_hash = ''
+    while True:
+        batch = list(PolicyDocument.objects.filter(hash__gt=last_hash).order_by('hash').values_list('hash', 'platform', 'document')[:BATCH_SIZE])
+        if not batch:
+            break
+        rows = [
+            PolicyStatement(
+                document_id=digest,
+                statement_index=index,
+                effect=effect,
+                action=action[:255],
+                action_prefix=_prefix(action)[:255],
+                action_kind=_kind(action),
+                resource=resource[:1024],
+                resource_prefix=_prefix(resource)[:1024],
+                resource_kind=_kind(resource),
+                condition_key=condition_key[:255],
+            )
+            for digest, platform, document in batch
+            for index, effect, action, resource, condition_key in statement_rows(document, platform)
+        ]
+        PolicyStatement.objects.bulk_create(rows, batch_size=5000)
+        last_hash = batch[-1][0]
+
+
+# jsonb_path_ops serves `document @> '{...}'` containment queries; other databases have no equivalent
+def create_gin_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('CREATE INDEX IF NOT EXISTS core_policydocument_document_gin ON core_policydocument USING gin (document jsonb_path_ops)')
+
+
+def drop_gin_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS core_policydocument_document_gin')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_policydocument_cleanup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PolicyStatement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('statement_index', models.PositiveSmallIntegerField(default=0)),
+                ('effect', models.CharField(choices=[('allow', 'Allow'), ('deny', 'Deny')], max_length=5)),
+                ('action', models.CharField(max_length=255)),
+                ('action_prefix', models.CharField(max_length=255)),
+                ('action_kind', models.CharField(choices=[('exact', 'Exact'), ('prefix', 'Trailing wildcard'), ('glob', 'Other wildcard')], default='exact', max_length=6)),
+                ('resource', models.CharField(max_length=1024)),
+                ('resource_prefix', models.CharField(max_length=1024)),
+                ('resource_kind', models.CharField(choices=[('exact', 'Exact'), ('prefix', 'Trailing wildcard'), ('glob', 'Other wildcard')], default='exact', max_length=6)),
+                ('condition_key', models.CharField(blank=True, max_length=255)),
+                ('document', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='statements', to='core.policydocument')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['action', 'effect'], name='core_stmt_action_idx', opclasses=['varchar_pattern_ops', 'varchar_pattern_ops']), models.Index(condition=models.Q(('action_kind', 'exact'), _negated=True), fields=['action_prefix', 'effect'], name='core_stmt_action_wild_idx'), models.Index(fields=['resource'], name='core_stmt_resource_idx', opclasses=['varchar_pattern_ops']), models.Index(condition=models.Q(('resource_kind', 'exact'), _negated=True), fields=['resource_prefix'], name='core_stmt_resource_wild_idx'), models.Index(condition=models.Q(('condition_key', ''), _negated=True), fields=['condition_key'], name='core_stmt_condition_idx')],
+            },
+        ),
+        migrations.RunPython(project_documents, migrations.RunPython.noop),
+        migrations.RunPython(create_gin_index, drop_gin_index),
+    ]
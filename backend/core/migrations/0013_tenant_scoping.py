@@ -0,0 +1,34 @@
+# Generated by Django 6.0.1 on 2026-10-19 13:10
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+# Backfilled in 0014_tenant_scoping_data and made NOT NULL and indexed in
+# 0015_tenant_scoping_cleanup, each in its own transaction (see 0009_policydocument)
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_policy_search'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        # Nullable until the backfill has run
+        migrations.AddField(
+            model_name='iamentity',
+            name='user',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='iampolicy',
+            name='cloud_account',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', db_index=False, to='core.cloudaccount'),
+        ),
+        migrations.AddField(
+            model_name='iampolicy',
+            name='user',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', db_index=False, to=settings.AUTH_USER_MODEL),
+        ),
+    ]
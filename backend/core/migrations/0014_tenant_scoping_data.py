@@ -0,0 +1,31 @@
+# Generated by Django 6.0.1 on 2026-10-19 13:10
+
+from django.db import migrations
+from django.db.models import OuterRef, Subquery
+
+
+def copy_owners(apps, schema_editor):
+    """One UPDATE per table: entities take the owner of their account, policies take both from their entity."""
+    CloudAccount = apps.get_model('core', 'CloudAccount')
+    IAMEntity = apps.get_model('core', 'IAMEntity')
+    IAMPolicy = apps.get_model('core', 'IAMPolicy')
+
+    IAMEntity.objects.update(
+        user_id=Subquery(CloudAccount.objects.filter(id=OuterRef('cloud_account_id')).values('user_id')[:1])
+    )
+    entities = IAMEntity.objects.filter(id=OuterRef('entity_id'))
+    IAMPolicy.objects.update(
+        cloud_account_id=Subquery(entities.values('cloud_account_id')[:1]),
+        user_id=Subquery(entities.values('user_id')[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_tenant_scoping'),
+    ]
+
+    operations = [
+        migrations.RunPython(copy_owners, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 6.0.1 on 2026-10-19 13:10
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_tenant_scoping_data'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='iamentity',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='iampolicy',
+            name='cloud_account',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', db_index=False, to='core.cloudaccount'),
+        ),
+        migrations.AlterField(
+            model_name='iampolicy',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', db_index=False, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='iampolicy',
+            index=models.Index(fields=['user', 'is_vulnerable', '-risk_score'], name='core_policy_user_risk_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='iampolicy',
+            index=models.Index(fields=['cloud_account', 'is_vulnerable', '-risk_score'], name='core_policy_account_risk_idx'),
+        ),
+    ]
@@ -0,0 +1,110 @@
+# Generated by Django 6.0.1 on 2026-10-19 11:40
+
+from datetime import date
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+TABLE = 'core_findingrecord'
+MONTHS_AHEAD = 2
+
+PARTITIONED_TABLE = f"""
+CREATE TABLE "{TABLE}" (
+    "id" bigint GENERATED BY DEFAULT AS IDENTITY,
+    "recorded_at" timestamp with time zone NOT NULL,
+    "cloud_account_id" bigint NOT NULL,
+    "platform" varchar(10) NOT NULL,
+    "policy_id" bigint NOT NULL,
+    "entity_id" bigint NOT NULL,
+    "document_hash" varchar(64) NOT NULL,
+    "risk_score" integer NOT NULL,
+    "severity" varchar(8) NOT NULL,
+    "finding_count" integer NOT NULL CHECK ("finding_count" >= 0),
+    PRIMARY KEY ("id", "recorded_at")
+) PARTITION BY RANGE ("recorded_at")
+"""
+
+INDEXES = [
+    f'CREATE INDEX "core_finding_account_time_idx" ON "{TABLE}" ("cloud_account_id", "recorded_at")',
+    f'CREATE INDEX "core_finding_policy_time_idx" ON "{TABLE}" ("policy_id", "recorded_at")',
+]
+
+
+def _add_months(month, n):
+    years, index = divmod(month.month - 1 + n, 12)
+    return date(month.year + years, index + 1, 1)
+
+
+def create_history_table(apps, schema_editor):
+    """Partitioned by month on PostgreSQL (core/history.py keeps the partitions coming); a plain table elsewhere."""
+    if schema_editor.connection.vendor != 'postgresql':
+        schema_editor.create_model(apps.get_model('core', 'FindingRecord'))
+    else:
+        schema_editor.execute(PARTITIONED_TABLE)
+        today = date.today()
+        current = date(today.year, today.month, 1)
+        for n in range(MONTHS_AHEAD + 1):
+            start = _add_months(current, n)
+            schema_editor.execute(
+                f'CREATE TABLE "{TABLE}_y{start.year}m{start.month:02d}" PARTITION OF "{TABLE}" '
+                f"FOR VALUES FROM ('{start.isoformat()} 00:00:00+00') TO ('{_add_months(start, 1).isoformat()} 00:00:00+00')"
+            )
+    for sql in INDEXES:
+        schema_editor.execute(sql)
+
+
+def drop_history_table(apps, schema_editor):
+    # Dropping the parent drops its partitions
+    schema_editor.execute(f'DROP TABLE "{TABLE}"')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_tenant_scoping_cleanup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FindingRecord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('recorded_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('platform', models.CharField(max_length=10)),
+                ('policy_id', models.BigIntegerField()),
+                ('entity_id', models.BigIntegerField()),
+                ('document_hash', models.CharField(max_length=64)),
+                ('risk_score', models.IntegerField()),
+                ('severity', models.CharField(choices=[('critical', 'Critical'), ('high', 'High'), ('medium', 'Medium'), ('low', 'Low'), ('none', 'None')], max_length=8)),
+                ('finding_count', models.PositiveIntegerField(default=0)),
+                ('cloud_account', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='core.cloudaccount')),
+            ],
+            options={
+                'db_table': 'core_findingrecord',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='FindingRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('day', 'Daily'), ('week', 'Weekly')], max_length=4)),
+                ('bucket', models.DateField()),
+                ('platform', models.CharField(max_length=10)),
+                ('severity', models.CharField(choices=[('critical', 'Critical'), ('high', 'High'), ('medium', 'Medium'), ('low', 'Low'), ('none', 'None')], max_length=8)),
+                ('policies', models.PositiveIntegerField(default=0)),
+                ('vulnerable', models.PositiveIntegerField(default=0)),
+                ('risk_total', models.PositiveBigIntegerField(default=0)),
+                ('risk_max', models.PositiveSmallIntegerField(default=0)),
+                ('changes', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('cloud_account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.cloudaccount')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['period', 'bucket'], name='core_rollup_bucket_idx')],
+                'constraints': [models.UniqueConstraint(fields=('period', 'bucket', 'cloud_account', 'severity'), name='core_rollup_unique')],
+            },
+        ),
+        migrations.RunPython(create_history_table, drop_history_table),
+    ]
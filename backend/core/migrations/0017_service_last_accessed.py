@@ -0,0 +1,32 @@
+# Generated by Django 6.0.1 on 2026-10-19 11:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_findings_history'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ServiceLastAccessed',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('service_namespace', models.CharField(max_length=64)),
+                ('service_name', models.CharField(max_length=255)),
+                ('last_authenticated', models.DateTimeField(blank=True, null=True)),
+                ('last_authenticated_entity', models.CharField(blank=True, max_length=512)),
+                ('last_authenticated_region', models.CharField(blank=True, max_length=32)),
+                ('total_authenticated_entities', models.PositiveIntegerField(default=0)),
+                ('analyzed_at', models.DateTimeField()),
+                ('entity', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='service_access', to='core.iamentity')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['last_authenticated'], name='core_service_access_used_idx')],
+                'constraints': [models.UniqueConstraint(fields=('entity', 'service_namespace'), name='core_service_access_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0.1 on 2026-10-19 12:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_service_last_accessed'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='syncrun',
+            name='pipeline_stats',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
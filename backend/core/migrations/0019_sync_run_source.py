@@ -0,0 +1,18 @@
+# Generated by Django 6.0.1 on 2026-10-19 12:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_sync_pipeline_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='syncrun',
+            name='source',
+            field=models.CharField(choices=[('api', 'Cloud API'), ('snapshot', 'Snapshot')], default='api', max_length=10),
+        ),
+    ]
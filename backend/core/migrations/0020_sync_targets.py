@@ -0,0 +1,54 @@
+# Generated by Django 6.0.1 on 2026-10-19 12:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0019_sync_run_source'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cloudaccount',
+            name='enumerate_targets',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='syncrun',
+            name='target_stats',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.CreateModel(
+            name='CloudAccountTarget',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('target_id', models.CharField(max_length=255)),
+                ('name', models.CharField(blank=True, max_length=255)),
+                ('is_active', models.BooleanField(default=True)),
+                ('discovered_at', models.DateTimeField(auto_now_add=True)),
+                ('last_seen_at', models.DateTimeField(blank=True, null=True)),
+                ('last_sync_status', models.BooleanField(default=False)),
+                ('last_sync_at', models.DateTimeField(blank=True, null=True)),
+                ('last_error', models.TextField(blank=True)),
+                ('principal_count', models.PositiveIntegerField(default=0)),
+                ('policy_count', models.PositiveIntegerField(default=0)),
+                ('duration_ms', models.PositiveIntegerField(blank=True, null=True)),
+                ('cloud_account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='targets', to='core.cloudaccount')),
+            ],
+            options={
+                'ordering': ['target_id'],
+            },
+        ),
+        migrations.AddField(
+            model_name='iamentity',
+            name='target',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='entities', to='core.cloudaccounttarget'),
+        ),
+        migrations.AddConstraint(
+            model_name='cloudaccounttarget',
+            constraint=models.UniqueConstraint(fields=('cloud_account', 'target_id'), name='core_target_account_id_uniq'),
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 6.0.1 on 2026-10-19 13:02
+
+import core.storage
+from django.db import migrations, models
+
+
+# The GIN index only served jsonb containment on the old column; it moves to DocumentContent in 0025
+def drop_gin_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS core_policydocument_document_gin')
+
+
+def create_gin_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('CREATE INDEX IF NOT EXISTS core_policydocument_document_gin ON core_policydocument USING gin (document jsonb_path_ops)')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0020_sync_targets'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CompressionDictionary',
+            fields=[
+                ('id', models.PositiveIntegerField(primary_key=True, serialize=False)),
+                ('data', models.BinaryField()),
+                ('samples', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.RunPython(drop_gin_index, create_gin_index),
+        # Nullable while both columns exist, so that the old one can be added back empty when migrating backwards
+        migrations.AlterField(
+            model_name='policydocument',
+            name='document',
+            field=models.JSONField(help_text='The raw JSON policy structure', null=True),
+        ),
+        migrations.AddField(
+            model_name='policydocument',
+            name='document_stored',
+            field=core.storage.CompressedJSONField(null=True),
+        ),
+        migrations.AddField(
+            model_name='policydocument',
+            name='finding_details_stored',
+            field=core.storage.CompressedJSONField(null=True),
+        ),
+        migrations.AddField(
+            model_name='policydocument',
+            name='statement_results_stored',
+            field=core.storage.CompressedJSONField(null=True),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 6.0.1 on 2026-10-19 13:02
+
+import core.storage
+from django.db import migrations
+
+BATCH_SIZE = 1000
+FIELDS = ('document', 'finding_details', 'statement_results')
+
+
+def _copy(apps, source, target):
+    """Copies each field's `source` column into its `target` one, in batches of documents."""
+    PolicyDocument = apps.get_model('core', 'PolicyDocument')
+    columns = [source.format(field) for field in FIELDS]
+    last_hash = ''
+    while True:
+        batch = list(PolicyDocument.objects.filter(hash__gt=last_hash).order_by('hash').values_list('hash', *columns)[:BATCH_SIZE])
+        if not batch:
+            break
+        documents = []
+        for digest, *values in batch:
+            document = PolicyDocument(hash=digest)
+            for field, value in zip(FIELDS, values):
+                # Stored bytes are decoded here; the compressed field encodes on save
+                setattr(document, target.format(field), core.storage.decode(value))
+            documents.append(document)
+        PolicyDocument.objects.bulk_update(documents, [target.format(field) for field in FIELDS])
+        last_hash = batch[-1][0]
+
+
+def compress_documents(apps, schema_editor):
+    _copy(apps, '{}', '{}_stored')
+
+
+def decompress_documents(apps, schema_editor):
+    _copy(apps, '{}_stored', '{}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0021_compressed_documents'),
+    ]
+
+    operations = [
+        migrations.RunPython(compress_documents, decompress_documents),
+    ]
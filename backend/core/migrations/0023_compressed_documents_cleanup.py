@@ -0,0 +1,56 @@
+# Generated by Django 6.0.1 on 2026-10-19 13:02
+
+import core.storage
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0022_compressed_documents_data'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='policydocument',
+            name='document',
+        ),
+        migrations.RemoveField(
+            model_name='policydocument',
+            name='finding_details',
+        ),
+        migrations.RemoveField(
+            model_name='policydocument',
+            name='statement_results',
+        ),
+        migrations.RenameField(
+            model_name='policydocument',
+            old_name='document_stored',
+            new_name='document',
+        ),
+        migrations.RenameField(
+            model_name='policydocument',
+            old_name='finding_details_stored',
+            new_name='finding_details',
+        ),
+        migrations.RenameField(
+            model_name='policydocument',
+            old_name='statement_results_stored',
+            new_name='statement_results',
+        ),
+        migrations.AlterField(
+            model_name='policydocument',
+            name='document',
+            field=core.storage.CompressedJSONField(help_text='The raw JSON policy structure'),
+        ),
+        migrations.AlterField(
+            model_name='policydocument',
+            name='finding_details',
+            field=core.storage.CompressedJSONField(blank=True, default=dict),
+        ),
+        migrations.AlterField(
+            model_name='policydocument',
+            name='statement_results',
+            field=core.storage.CompressedJSONField(blank=True, default=dict),
+        ),
+    ]
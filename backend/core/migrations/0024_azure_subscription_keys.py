@@ -0,0 +1,27 @@
+# Generated by Django 6.0.1 on 2026-10-19 16:02
+
+from django.db import migrations
+from django.db.models import CharField, OuterRef, Subquery, Value
+from django.db.models.functions import Concat
+
+
+def key_by_subscription(apps, schema_editor):
+    """Azure entities crawled from a subscription target are re-keyed `<subscription>/<principalId>` in one UPDATE."""
+    CloudAccountTarget = apps.get_model('core', 'CloudAccountTarget')
+    IAMEntity = apps.get_model('core', 'IAMEntity')
+
+    subscription = CloudAccountTarget.objects.filter(id=OuterRef('target_id')).values('target_id')[:1]
+    IAMEntity.objects.filter(cloud_account__platform='azure', target__isnull=False).exclude(arn_or_id__contains='/').update(
+        arn_or_id=Concat(Subquery(subscription), Value('/'), 'arn_or_id', output_field=CharField())
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0023_compressed_documents_cleanup'),
+    ]
+
+    operations = [
+        migrations.RunPython(key_by_subscription, migrations.RunPython.noop),
+    ]
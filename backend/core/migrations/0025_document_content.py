@@ -0,0 +1,33 @@
+# Generated by Django 6.0.1 on 2026-10-19 14:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# jsonb_path_ops serves `content @> '{...}'` containment queries; other databases have no equivalent
+def create_gin_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('CREATE INDEX IF NOT EXISTS core_documentcontent_gin ON core_documentcontent USING gin (content jsonb_path_ops)')
+
+
+def drop_gin_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS core_documentcontent_gin')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0024_azure_subscription_keys'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentContent',
+            fields=[
+                ('document', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='content', serialize=False, to='core.policydocument')),
+                ('content', models.JSONField()),
+            ],
+        ),
+        migrations.RunPython(create_gin_index, drop_gin_index),
+    ]
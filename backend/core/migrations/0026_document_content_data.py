@@ -0,0 +1,34 @@
+# Generated by Django 6.0.1 on 2026-10-19 14:28
+
+import core.storage
+from django.db import migrations
+
+BATCH_SIZE = 1000
+
+
+def project_contents(apps, schema_editor):
+    """Writes the DocumentContent row of every stored document, in batches of documents."""
+    DocumentContent = apps.get_model('core', 'DocumentContent')
+    PolicyDocument = apps.get_model('core', 'PolicyDocument')
+
+    last_hash = ''
+    while True:
+        batch = list(PolicyDocument.objects.filter(hash__gt=last_hash).order_by('hash').values_list('hash', 'document')[:BATCH_SIZE])
+        if not batch:
+            break
+        DocumentContent.objects.bulk_create(
+            [DocumentContent(document_id=digest, content=core.storage.decode(document)) for digest, document in batch],
+            ignore_conflicts=True,
+        )
+        last_hash = batch[-1][0]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0025_document_content'),
+    ]
+
+    operations = [
+        migrations.RunPython(project_contents, migrations.RunPython.noop),
+    ]
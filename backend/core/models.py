@@ -1,6 +1,9 @@
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
 from encrypted_fields.fields import EncryptedCharField, EncryptedJSONField
 from django.db import models
+from django.utils import timezone
+
+from .storage import CompressedJSONField
 
 class UserManager(BaseUserManager):
     def create_user(self, email, password=None, **extra_fields):
@@ -57,6 +60,16 @@ class CloudAccount(models.Model):
     last_sync_status = models.BooleanField(default=False) # True = Green, False = Red
     last_sync_at = models.DateTimeField(null=True, blank=True)
 
+    # Adaptive Scheduling (see core/scheduler.py)
+    sync_interval = models.PositiveIntegerField(default=3600, help_text="Current sync interval in seconds")
+    next_sync_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    sync_started_at = models.DateTimeField(null=True, blank=True) # Set while a sync is in flight
+    consecutive_failures = models.PositiveIntegerField(default=0)
+    last_change_count = models.PositiveIntegerField(default=0) # Policies created/changed by the last sync
+
+    # Organization-wide accounts: sync every member account / subscription / project these credentials can reach (core/targets.py)
+    enumerate_targets = models.BooleanField(default=False)
+
     # SECURE CREDENTIALS SECTION
     # These will be encrypted in Postgres
     access_key = EncryptedCharField(max_length=255, blank=True, null=True)
@@ -65,9 +78,36 @@ class CloudAccount(models.Model):
     # For Azure/GCP which use more complex JSON or multiple IDs
     extra_config = EncryptedJSONField(blank=True, null=True, help_text="Store TenantID, ProjectID, etc.")
 
+    # Decrypted on every load; read them through core.credentials instead
+    CREDENTIAL_FIELDS = ('access_key', 'secret_key', 'extra_config')
+
     def __str__(self):
         return f"{self.name} ({self.platform.upper()})"
 
+class CloudAccountTarget(models.Model):
+    """A member AWS account, Azure subscription or GCP project that a CloudAccount enumerates and syncs. See core/targets.py."""
+    cloud_account = models.ForeignKey(CloudAccount, on_delete=models.CASCADE, related_name='targets')
+    target_id = models.CharField(max_length=255) # AWS account ID, Azure subscription ID or GCP project ID
+    name = models.CharField(max_length=255, blank=True)
+    is_active = models.BooleanField(default=True) # False = skipped by syncs
+
+    discovered_at = models.DateTimeField(auto_now_add=True)
+    last_seen_at = models.DateTimeField(null=True, blank=True) # Last enumeration that listed it; only listed targets are synced
+
+    # Result of the last sync that crawled it
+    last_sync_status = models.BooleanField(default=False)
+    last_sync_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    principal_count = models.PositiveIntegerField(default=0)
+    policy_count = models.PositiveIntegerField(default=0)
+    duration_ms = models.PositiveIntegerField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['target_id']
+        constraints = [models.UniqueConstraint(fields=['cloud_account', 'target_id'], name='core_target_account_id_uniq')]
+
+    def __str__(self):
+        return f"{self.name or self.target_id} ({self.cloud_account.name})"
 
 
 
@@ -80,6 +120,8 @@ class IAMEntity(models.Model):
     ]
 
     cloud_account = models.ForeignKey(CloudAccount, on_delete=models.CASCADE, related_name='entities')
+    target = models.ForeignKey(CloudAccountTarget, on_delete=models.SET_NULL, null=True, blank=True, related_name='entities') # Member account it was crawled from, for accounts that enumerate targets
+    user = models.ForeignKey('core.User', on_delete=models.CASCADE, related_name='+') # Owner of cloud_account, copied so tenant filters need no join
     name = models.CharField(max_length=255)
     arn_or_id = models.CharField(max_length=512, unique=True, help_text="The unique cloud identifier (e.g. AWS ARN)")
     entity_type = models.CharField(max_length=10, choices=ENTITY_TYPES)
@@ -88,22 +130,352 @@ class IAMEntity(models.Model):
     created_at_in_cloud = models.DateTimeField(null=True, blank=True)
     last_used = models.DateTimeField(null=True, blank=True)
 
+    # Group membership (users -> groups), used to inherit group policies
+    groups = models.ManyToManyField('self', symmetrical=False, related_name='members', blank=True)
+
+    # Roles only: who is allowed to assume this role (AWS AssumeRolePolicyDocument)
+    trust_policy = models.JSONField(null=True, blank=True)
+
     def __str__(self):
         return f"{self.entity_type.upper()}: {self.name}"
 
+class PolicyDocument(models.Model):
+    """A policy document stored once per distinct content, with its scan result. See core/documents.py."""
+    hash = models.CharField(max_length=64, primary_key=True) # sha256 of platform + canonical JSON
+    platform = models.CharField(max_length=10)
+
+    # The actual JSON policy document from AWS/Azure, stored compressed (core/storage.py)
+    document = CompressedJSONField(help_text="The raw JSON policy structure")
+
+    # Security Scoring
+    is_vulnerable = models.BooleanField(default=False)
+    risk_score = models.IntegerField(default=0) # 0-100
+    finding_details = CompressedJSONField(default=dict, blank=True) # e.g. {"issues": ["Wildcard Admin Access"]}
+    statement_results = CompressedJSONField(default=dict, blank=True) # statement hash -> [score, findings], reused by the next scan
+    scanner_version = models.PositiveSmallIntegerField(default=0)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Document {self.hash[:12]} ({self.platform})"
+
+class CompressionDictionary(models.Model):
+    """A zstd dictionary trained on stored documents. Kept forever: values name the dictionary they were compressed with."""
+    id = models.PositiveIntegerField(primary_key=True) # The dictionary's own zstd id
+    data = models.BinaryField()
+    samples = models.PositiveIntegerField(default=0) # Values it was trained on
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Dictionary {self.id} ({len(self.data)} bytes)"
+
+class PolicyStatement(models.Model):
+    """Search projection of a PolicyDocument: one row per (statement, action, resource, condition key). See core/search.py."""
+    EFFECT_CHOICES = [
+        ('allow', 'Allow'),
+        ('deny', 'Deny'),
+    ]
+    KIND_CHOICES = [
+        ('exact', 'Exact'),
+        ('prefix', 'Trailing wildcard'),
+        ('glob', 'Other wildcard'),
+    ]
+
+    document = models.ForeignKey(PolicyDocument, on_delete=models.CASCADE, related_name='statements')
+    statement_index = models.PositiveSmallIntegerField(default=0)
+    effect = models.CharField(max_length=5, choices=EFFECT_CHOICES)
+    action = models.CharField(max_length=255) # Lowercased, e.g. "s3:delete*"
+    action_prefix = models.CharField(max_length=255) # Everything before the first wildcard
+    action_kind = models.CharField(max_length=6, choices=KIND_CHOICES, default='exact')
+    resource = models.CharField(max_length=1024)
+    resource_prefix = models.CharField(max_length=1024)
+    resource_kind = models.CharField(max_length=6, choices=KIND_CHOICES, default='exact')
+    condition_key = models.CharField(max_length=255, blank=True) # Lowercased, e.g. "aws:sourceip"; blank = unconditional
+
+    class Meta:
+        indexes = [
+            # pattern_ops so `startswith` can use the index whatever the database collation
+            models.Index(fields=['action', 'effect'], opclasses=['varchar_pattern_ops', 'varchar_pattern_ops'], name='core_stmt_action_idx'),
+            models.Index(fields=['action_prefix', 'effect'], condition=~models.Q(action_kind='exact'), name='core_stmt_action_wild_idx'),
+            models.Index(fields=['resource'], opclasses=['varchar_pattern_ops'], name='core_stmt_resource_idx'),
+            models.Index(fields=['resource_prefix'], condition=~models.Q(resource_kind='exact'), name='core_stmt_resource_wild_idx'),
+            models.Index(fields=['condition_key'], condition=~models.Q(condition_key=''), name='core_stmt_condition_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.effect} {self.action} on {self.resource}"
+
+class DocumentContent(models.Model):
+    """Containment projection of a PolicyDocument: its document as plain JSON, GIN-indexed on PostgreSQL. See core/search.py."""
+    document = models.OneToOneField(PolicyDocument, on_delete=models.CASCADE, primary_key=True, related_name='content')
+    content = models.JSONField()
+
+    def __str__(self):
+        return f"Content of {self.document_id[:12]}"
+
 class IAMPolicy(models.Model):
+    """An attachment of a PolicyDocument to an entity under a name."""
+    POLICY_TYPES = [
+        ('managed', 'Managed'),
+        ('inline', 'Inline'),
+    ]
+
     entity = models.ForeignKey(IAMEntity, on_delete=models.CASCADE, related_name='policies')
+    # Copied from the entity so tenant-scoped lists are single-table queries.
+    # No index of their own: the composite indexes in Meta start with them.
+    cloud_account = models.ForeignKey(CloudAccount, on_delete=models.CASCADE, related_name='+', db_index=False)
+    user = models.ForeignKey('core.User', on_delete=models.CASCADE, related_name='+', db_index=False)
     name = models.CharField(max_length=255)
-    
-    # The actual JSON policy document from AWS/Azure
-    document = models.JSONField(help_text="The raw JSON policy structure")
-    
-    # Security Scoring
+    policy_type = models.CharField(max_length=10, choices=POLICY_TYPES, default='managed')
+    policy_document = models.ForeignKey(PolicyDocument, on_delete=models.PROTECT, related_name='attachments')
+
+    # Copied from the document's scan so lists can filter and sort without a join
     is_vulnerable = models.BooleanField(default=False)
     risk_score = models.IntegerField(default=0) # 0-100
-    finding_details = models.JSONField(default=dict, blank=True) # e.g. {"reason": "Wildcard Admin Access"}
 
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'is_vulnerable', '-risk_score'], name='core_policy_user_risk_idx'),
+            models.Index(fields=['cloud_account', 'is_vulnerable', '-risk_score'], name='core_policy_account_risk_idx'),
+        ]
+
+    @property
+    def document(self):
+        return self.policy_document.document
+
+    @property
+    def finding_details(self):
+        return self.policy_document.finding_details
+
+    def __str__(self):
+        return f"Policy: {self.name} for {self.entity.name}"
+
+class IAMPolicyVersion(models.Model):
+    """
+    One revision of a policy document, stored as a diff against the previous
+    revision (with periodic full snapshots). See core/versions.py.
+    """
+    SOURCE_CHOICES = [
+        ('sync', 'Cloud sync'),
+        ('edit', 'Policy editor'),
+    ]
+
+    policy = models.ForeignKey(IAMPolicy, on_delete=models.CASCADE, related_name='versions')
+    version = models.PositiveIntegerField()
+    source = models.CharField(max_length=10, choices=SOURCE_CHOICES, default='sync')
+
+    statement_key = models.CharField(max_length=20, blank=True) # e.g. "Statement"; blank = the document is one statement
+    fields = models.JSONField(null=True, blank=True) # The document minus its statement list
+    statement_hashes = models.JSONField(default=list) # Ordered statement hashes of this revision
+    added = models.JSONField(default=dict) # hash -> statement, for statements not in the previous revision
+    removed = models.JSONField(default=list) # Hashes that were in the previous revision
+    snapshot = models.JSONField(null=True, blank=True) # hash -> statement for every statement, on every SNAPSHOT_EVERY-th revision
+
+    risk_score = models.IntegerField(default=0)
+    finding_details = models.JSONField(default=dict, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-version']
+        constraints = [models.UniqueConstraint(fields=['policy', 'version'], name='core_policy_version_unique')]
+
+    def __str__(self):
+        return f"{self.policy.name} v{self.version}"
+
+class EffectivePermissionSet(models.Model):
+    """Compact, materialized permissions of one entity (own + group policies). See core/effective.py."""
+    entity = models.OneToOneField(IAMEntity, on_delete=models.CASCADE, primary_key=True, related_name='effective_permissions')
+    allow = models.JSONField(default=list) # [[action, resource, conditional], ...]
+    deny = models.JSONField(default=list)
+    fingerprint = models.CharField(max_length=64) # Lets a refresh skip entities that didn't change
+    computed_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Effective permissions for {self.entity.name}"
+
+class ActionGrant(models.Model):
+    """Inverted index row: this entity is allowed/denied `action` on `resource`."""
+    EFFECT_CHOICES = [
+        ('allow', 'Allow'),
+        ('deny', 'Deny'),
+    ]
+
+    entity = models.ForeignKey(IAMEntity, on_delete=models.CASCADE, related_name='action_grants')
+    cloud_account = models.ForeignKey(CloudAccount, on_delete=models.CASCADE, related_name='+')
+    effect = models.CharField(max_length=5, choices=EFFECT_CHOICES)
+    action = models.CharField(max_length=255) # Lowercased pattern, e.g. "s3:delete*"
+    action_prefix = models.CharField(max_length=255) # Everything before the first wildcard
+    is_wildcard = models.BooleanField(default=False)
+    resource = models.CharField(max_length=1024)
+    conditional = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['action', 'effect']),
+            models.Index(fields=['action_prefix', 'effect'], condition=models.Q(is_wildcard=True), name='core_grant_wildcard_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.effect} {self.action} on {self.resource}"
+
+class SyncRun(models.Model):
+    STATUS_CHOICES = [
+        ('running', 'Running'),
+        ('success', 'Success'),
+        ('failed', 'Failed'),
+    ]
+
+    SOURCE_CHOICES = [
+        ('api', 'Cloud API'),
+        ('snapshot', 'Snapshot'), # An exported dump (core/snapshots.py)
+    ]
+
+    cloud_account = models.ForeignKey(CloudAccount, on_delete=models.CASCADE, related_name='sync_runs')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='running')
+    source = models.CharField(max_length=10, choices=SOURCE_CHOICES, default='api')
+    started_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    duration_ms = models.PositiveIntegerField(null=True, blank=True)
+
+    # Filled in by core.metrics.SyncRecorder
+    phase_timings = models.JSONField(default=dict, blank=True) # e.g. {"list": 820.1, "fetch": 5130.4} in ms
+    api_calls = models.JSONField(default=dict, blank=True) # e.g. {"iam.GetPolicy": {"count": 40, "total_ms": 912.3, ...}}
+    throttle_count = models.PositiveIntegerField(default=0)
+    retry_count = models.PositiveIntegerField(default=0)
+    rows_written = models.PositiveIntegerField(default=0)
+    rows_skipped = models.PositiveIntegerField(default=0)
+    peak_rss_kb = models.PositiveBigIntegerField(null=True, blank=True)
+    pipeline_stats = models.JSONField(default=dict, blank=True) # e.g. {"fetch": {"items": 5120, "per_second": 410.2, ...}, "scan": ..., "persist": ...}
+    target_stats = models.JSONField(default=dict, blank=True) # Accounts that enumerate targets: e.g. {"targets": 40, "failed": 1, "errors": {"123456789012": "AccessDenied ..."}, ...}
+    error = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ['-started_at']
+        indexes = [models.Index(fields=['cloud_account', '-started_at'])]
+
+    def __str__(self):
+        return f"SyncRun {self.id} for {self.cloud_account.name} ({self.status})"
+
+class EscalationEdge(models.Model):
+    """
+    "source can become (or act as) target". Edges with no target apply to
+    every role/group whose ARN matches `target_pattern`, which keeps a
+    `Resource: *` grant from fanning out into one row per role. See core/escalation.py.
+    """
+    KIND_CHOICES = [
+        ('trust', 'Named in trust policy'),
+        ('assume', 'sts:AssumeRole'),
+        ('pass_role', 'iam:PassRole'),
+        ('join_group', 'iam:AddUserToGroup'),
+    ]
+
+    cloud_account = models.ForeignKey(CloudAccount, on_delete=models.CASCADE, related_name='+')
+    source = models.ForeignKey(IAMEntity, on_delete=models.CASCADE, related_name='escalation_edges')
+    target = models.ForeignKey(IAMEntity, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    target_pattern = models.CharField(max_length=1024, blank=True)
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+
+    class Meta:
+        indexes = [models.Index(fields=['cloud_account', 'kind'])]
+
+    def __str__(self):
+        return f"{self.source_id} -[{self.kind}]-> {self.target_id or self.target_pattern}"
+
+class EscalationPath(models.Model):
+    """Cached shortest path from an entity to admin-equivalent access. Entities with no path have no row."""
+    entity = models.OneToOneField(IAMEntity, on_delete=models.CASCADE, primary_key=True, related_name='escalation_path')
+    cloud_account = models.ForeignKey(CloudAccount, on_delete=models.CASCADE, related_name='+')
+    hops = models.PositiveSmallIntegerField()
+    path = models.JSONField(default=list) # [{"entity_id", "name", "via"}, ...], the last step carries the admin "grant"
+    computed_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['cloud_account', 'hops'])]
+
+    def __str__(self):
+        return f"Escalation path for {self.entity_id}: {self.hops} hops"
+
+
+SEVERITY_CHOICES = [
+    ('critical', 'Critical'),
+    ('high', 'High'),
+    ('medium', 'Medium'),
+    ('low', 'Low'),
+    ('none', 'None'),
+]
+
+class FindingRecord(models.Model):
+    """
+    Append-only scan history: one row each time a policy's scan result is
+    written. On PostgreSQL the table is partitioned by month and old
+    partitions are dropped, so the table is created by migration 0012, not by
+    Django. See core/history.py.
+    """
+    recorded_at = models.DateTimeField(default=timezone.now)
+    cloud_account = models.ForeignKey(CloudAccount, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    platform = models.CharField(max_length=10)
+    policy_id = models.BigIntegerField() # Not a foreign key: history outlives deleted policies
+    entity_id = models.BigIntegerField()
+    document_hash = models.CharField(max_length=64)
+    risk_score = models.IntegerField()
+    severity = models.CharField(max_length=8, choices=SEVERITY_CHOICES)
+    finding_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        managed = False
+        db_table = 'core_findingrecord'
+
+    def __str__(self):
+        return f"Policy {self.policy_id} scored {self.risk_score} at {self.recorded_at}"
+
+class FindingRollup(models.Model):
+    """Downsampled risk per account, severity and day/week, for the trend charts."""
+    PERIOD_CHOICES = [
+        ('day', 'Daily'),
+        ('week', 'Weekly'),
+    ]
+
+    period = models.CharField(max_length=4, choices=PERIOD_CHOICES)
+    bucket = models.DateField() # The day, or the Monday of the week
+    cloud_account = models.ForeignKey(CloudAccount, on_delete=models.CASCADE, related_name='+')
+    platform = models.CharField(max_length=10)
+    severity = models.CharField(max_length=8, choices=SEVERITY_CHOICES)
+
+    # State of the account's policies at the last sync in the bucket
+    policies = models.PositiveIntegerField(default=0)
+    vulnerable = models.PositiveIntegerField(default=0)
+    risk_total = models.PositiveBigIntegerField(default=0)
+    risk_max = models.PositiveSmallIntegerField(default=0)
+    # Scan results written during the bucket (new or changed findings)
+    changes = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['period', 'bucket', 'cloud_account', 'severity'], name='core_rollup_unique')]
+        indexes = [models.Index(fields=['period', 'bucket'], name='core_rollup_bucket_idx')]
+
+    def __str__(self):
+        return f"{self.period} {self.bucket} {self.severity} for account {self.cloud_account_id}"
+
+class ServiceLastAccessed(models.Model):
+    """
+    When an entity last used each AWS service its policies grant, from
+    IAM's service-last-accessed report. See core/access.py.
+    """
+    entity = models.ForeignKey(IAMEntity, on_delete=models.CASCADE, related_name='service_access')
+    service_namespace = models.CharField(max_length=64) # e.g. "s3"
+    service_name = models.CharField(max_length=255)
+    last_authenticated = models.DateTimeField(null=True, blank=True) # None = not used in the tracking period
+    last_authenticated_entity = models.CharField(max_length=512, blank=True)
+    last_authenticated_region = models.CharField(max_length=32, blank=True)
+    total_authenticated_entities = models.PositiveIntegerField(default=0)
+    analyzed_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['entity', 'service_namespace'], name='core_service_access_unique')]
+        indexes = [models.Index(fields=['last_authenticated'], name='core_service_access_used_idx')]
+
     def __str__(self):
-        return f"Policy: {self.name} for {self.entity.name}"
\ No newline at end of file
+        return f"{self.entity_id} last used {self.service_namespace} at {self.last_authenticated}"
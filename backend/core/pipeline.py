@@ -0,0 +1,375 @@
+"""
+Streaming sync pipeline.
+
+Fetchers (core/providers/) don't write to the database. They yield records
+(`Principal`, `Policy`, `Membership`) as the API crawl produces them, and
+`run_pipeline` streams them through three stages:
+
+    fetch --bounded queue--> scan --batches in flight--> persist
+
+- fetch: the crawl, in its own thread. It hands records over in batches of
+  BATCH_SIZE (or whatever arrived within BATCH_WAIT), and waits when the
+  queue is full, so a slow database slows the crawl down instead of piling
+  up records.
+- scan: documents that aren't stored with a current scan result yet are
+  scanned on a process pool (the scanner is pure Python and would otherwise hold the
+  GIL), at most MAX_BATCHES batches ahead of persist.
+- persist: runs in the calling thread, on its database connection, with one
+  transaction per batch. Principals and group memberships are written in
+  bulk; policies go through `run_security_scan` with their scan result
+  already computed.
+
+Memory is bounded by QUEUE_SIZE + MAX_BATCHES * BATCH_SIZE records, the
+run's DocumentCache and the account's groups, not by the size of the
+account. Records, time spent working and waiting, and the backlog (in
+batches) per stage end up on the SyncRun (`pipeline_stats`).
+"""
+import contextvars
+import multiprocessing
+import queue
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.db import transaction
+
+from .documents import current_hashes, document_hash
+from .history import record_findings
+from .metrics import get_recorder
+from .models import IAMEntity
+from .scanner import scan_documents
+from .tasks import run_security_scan
+
+DEFAULTS = {
+    'QUEUE_SIZE': 1000,     # Records the crawl may get ahead of the scan stage
+    'BATCH_SIZE': 200,      # Records per scan submission and per persist transaction
+    'MAX_BATCHES': 4,       # Batches scanned ahead of the one being persisted
+    'BATCH_WAIT': 0.5,      # Seconds a batch may wait to fill before it is handed over partial
+    'SCAN_WORKERS': 2,      # Scan processes per worker process; 0 scans in the calling thread
+}
+
+ENTITY_FIELDS = ['cloud_account', 'user', 'target', 'name', 'entity_type', 'created_at_in_cloud', 'trust_policy']
+
+_DONE = object()  # Put on the queue by the fetch thread when the crawl is over
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'SYNC_PIPELINE', {})}
+
+
+@dataclass(slots=True)
+class Principal:
+    arn: str
+    name: str
+    entity_type: str
+    created_at: object = None
+    trust_policy: dict = None  # Roles only
+    target: int = None         # CloudAccountTarget it was crawled from (core/targets.py)
+
+
+@dataclass(slots=True)
+class Policy:
+    principal: str  # arn of a Principal yielded before it
+    name: str
+    document: dict
+    policy_type: str = 'managed'
+
+
+@dataclass(slots=True)
+class Membership:
+    principal: str  # arn of the user, yielded before it
+    groups: list    # arns of its group Principals, yielded before the user
+
+
+class Stage:
+    """Counters of one stage. `depth` is the number of batches waiting for it, sampled once per batch."""
+
+    def __init__(self):
+        self.items = 0
+        self.batches = 0
+        self.busy = 0.0
+        self.waiting = 0.0
+        self.max_depth = 0
+        self.depth_total = 0
+
+    def sample(self, depth):
+        self.max_depth = max(self.max_depth, depth)
+        self.depth_total += depth
+
+    def as_dict(self, seconds):
+        return {
+            'items': self.items,
+            'per_second': round(self.items / seconds, 1) if seconds else None,
+            'busy_ms': round(self.busy * 1000, 1),
+            'waiting_ms': round(self.waiting * 1000, 1),
+            'max_depth': self.max_depth,
+            'mean_depth': round(self.depth_total / self.batches, 1) if self.batches else 0,
+        }
+
+
+def scan_pool(workers):
+    """
+    The scan process pool, started on first use and kept for the life of
+    the worker process. Pool processes only import core/scanner.py, so they
+    are started with forkserver (or spawn) rather than forked from a
+    process that has a fetch thread and open database connections.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(method))
+        return _pool
+
+
+def _reset_pool():
+    global _pool
+    with _pool_lock:
+        _pool = None
+
+
+def run_pipeline(account, records):
+    """Syncs `records` (an iterable of the record types above) into `account`. Returns the number of changed policies."""
+    return Pipeline(account).run(records)
+
+
+class Pipeline:
+    def __init__(self, account, config=None):
+        self.account = account
+        self.config = config or get_config()
+        self.recorder = get_recorder()
+        self.queue = queue.Queue(max(1, self.config['QUEUE_SIZE'] // self.config['BATCH_SIZE']))
+        self.stopping = threading.Event()
+        self.done = False
+        self.error = None
+        self.stages = {'fetch': Stage(), 'scan': Stage(), 'persist': Stage()}
+        self.scanning = set()  # Digests being scanned for a batch that isn't persisted yet
+        self.scanned = 0
+        self.entities = {}     # arn -> IAMEntity of the current batch, the account's groups and the last principal
+        self.last = None
+        self.changed = 0
+
+    def run(self, records):
+        started = time.perf_counter()
+        # A copy of this context, so the crawl reports to the same SyncRecorder
+        fetcher = threading.Thread(
+            target=contextvars.copy_context().run, args=(self._fetch, records),
+            name=f"sync-fetch-{self.account.id}", daemon=True,
+        )
+        fetcher.start()
+        in_flight = deque()
+        try:
+            while not (self.done and not in_flight):
+                batch = self._take(timeout=self.config['BATCH_WAIT'] if in_flight else None)
+                if batch:
+                    in_flight.append(self._scan(batch))
+                # Persist when enough is scanned ahead, or when nothing new arrived in time
+                if in_flight and (not batch or self.done or len(in_flight) >= self.config['MAX_BATCHES']):
+                    self.stages['persist'].sample(len(in_flight))
+                    self._persist(*in_flight.popleft())
+        finally:
+            self.stopping.set()
+            fetcher.join()
+            seconds = time.perf_counter() - started
+            self.recorder.stages = {name: stage.as_dict(seconds) for name, stage in self.stages.items()}
+            self.recorder.stages['scan']['documents'] = self.scanned
+        if self.error is not None:
+            raise self.error
+        return self.changed
+
+    # --- FETCH (own thread) ---
+
+    def _fetch(self, records):
+        # Whole batches go through the queue: handing over single records
+        # makes the two threads trade the GIL on every one of them
+        stage = self.stages['fetch']
+        batch, started = [], None
+        try:
+            iterator = iter(records)
+            while not self.stopping.is_set():
+                start = time.perf_counter()
+                try:
+                    record = next(iterator)
+                except StopIteration:
+                    break
+                finally:
+                    stage.busy += time.perf_counter() - start
+                stage.items += 1
+                batch.append(record)
+                started = started or time.perf_counter()
+                if len(batch) >= self.config['BATCH_SIZE'] or time.perf_counter() - started >= self.config['BATCH_WAIT']:
+                    self._put(batch)
+                    batch, started = [], None
+        except Exception as e:
+            self.error = e  # Raised by `run` once what was fetched before it is persisted
+        finally:
+            if batch:
+                self._put(batch)
+            self._put(_DONE)
+
+    def _put(self, item):
+        stage = self.stages['fetch']
+        start = time.perf_counter()
+        # Gives up when the persist side has failed and stopped taking batches
+        while not self.stopping.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                break
+            except queue.Full:
+                continue
+        stage.waiting += time.perf_counter() - start
+
+    # --- SCAN ---
+
+    def _take(self, timeout=None):
+        """The next fetched batch, or [] if none arrived within `timeout` seconds (None: waits) or the crawl is over."""
+        if self.done:
+            return []
+        stage = self.stages['scan']
+        stage.sample(self.queue.qsize())
+        start = time.perf_counter()
+        try:
+            batch = self.queue.get(timeout=timeout)
+        except queue.Empty:
+            batch = []
+        stage.waiting += time.perf_counter() - start
+        if batch is _DONE:
+            self.done = True
+            return []
+        return batch
+
+    def _scan(self, batch):
+        """Starts scanning the batch's documents that have no current scan result yet."""
+        stage = self.stages['scan']
+        start = time.perf_counter()
+        platform = self.account.platform
+        digests = [document_hash(record.document, platform) if isinstance(record, Policy) else None for record in batch]
+
+        documents = {}
+        for record, digest in zip(batch, digests):
+            if digest and digest not in self.recorder.documents and digest not in self.scanning:
+                documents[digest] = record.document
+        if documents:
+            for digest in current_hashes(list(documents)):
+                del documents[digest]
+
+        keys = list(documents)
+        items = [(documents[digest], platform) for digest in keys]
+        self.scanning.update(keys)
+        pending = None
+        if items:
+            if self.config['SCAN_WORKERS']:
+                pending = scan_pool(self.config['SCAN_WORKERS']).submit(scan_documents, items)
+            else:
+                pending = scan_documents(items)
+
+        self.scanned += len(keys)
+        stage.items += len(batch)
+        stage.batches += 1
+        stage.busy += time.perf_counter() - start
+        return batch, digests, keys, items, pending
+
+    def _results(self, items, pending):
+        if pending is None or isinstance(pending, list):
+            return pending or []
+        try:
+            return pending.result()
+        except BrokenProcessPool:
+            # A pool process died (e.g. killed for memory); start a new pool next time and scan this batch here
+            _reset_pool()
+            return scan_documents(items)
+
+    # --- PERSIST ---
+
+    def _persist(self, batch, digests, keys, items, pending):
+        stage = self.stages['persist']
+        start = time.perf_counter()
+        results = dict(zip(keys, self._results(items, pending)))
+        stage.waiting += time.perf_counter() - start
+
+        start = time.perf_counter()
+        platform = self.account.platform
+        self.entities = {arn: entity for arn, entity in self.entities.items() if entity.entity_type == 'group' or arn == self.last}
+        with transaction.atomic():
+            with self.recorder.phase('persist'):
+                self._upsert([record for record in batch if isinstance(record, Principal)])
+                self._memberships([record for record in batch if isinstance(record, Membership)])
+            for record, digest in zip(batch, digests):
+                if isinstance(record, Policy):
+                    self.changed += run_security_scan(
+                        self.entities[record.principal], record.name, record.document, platform,
+                        record.policy_type, digest, results.get(digest),
+                    )
+            with self.recorder.phase('persist'):
+                record_findings(self.recorder.findings)
+                self.recorder.findings.clear()
+        self.scanning.difference_update(keys)
+
+        stage.items += len(batch)
+        stage.batches += 1
+        stage.busy += time.perf_counter() - start
+
+    def _upsert(self, principals):
+        """Creates or updates the batch's principals with two queries and at most one bulk write each."""
+        if not principals:
+            return
+        recorder = self.recorder
+        latest = {principal.arn: principal for principal in principals}  # Azure yields a principal per role assignment
+        existing = {entity.arn_or_id: entity for entity in IAMEntity.objects.filter(arn_or_id__in=list(latest))}
+        created, updated = [], []
+        for arn, principal in latest.items():
+            values = {
+                'cloud_account_id': self.account.id,
+                'user_id': self.account.user_id,
+                'target_id': principal.target,
+                'name': principal.name,
+                'entity_type': principal.entity_type,
+            }
+            if principal.created_at is not None:
+                values['created_at_in_cloud'] = principal.created_at
+            if principal.entity_type == 'role':
+                values['trust_policy'] = principal.trust_policy
+
+            entity = existing.get(arn)
+            if entity is None:
+                entity = IAMEntity(arn_or_id=arn, **values)
+                created.append(entity)
+            elif any(getattr(entity, field) != value for field, value in values.items()):
+                # A role whose trust policy changed moves escalation paths
+                if principal.entity_type == 'role' and entity.trust_policy != principal.trust_policy:
+                    recorder.changed_entity_ids.add(entity.id)
+                for field, value in values.items():
+                    setattr(entity, field, value)
+                updated.append(entity)
+            self.entities[arn] = entity
+
+        IAMEntity.objects.bulk_create(created)
+        if updated:
+            IAMEntity.objects.bulk_update(updated, ENTITY_FIELDS)
+        recorder.changed_entity_ids.update(entity.id for entity in created if entity.entity_type == 'role')
+        recorder.rows_written += len(created) + len(updated)
+        recorder.rows_skipped += len(latest) - len(created) - len(updated)
+        self.last = principals[-1].arn
+
+    def _memberships(self, memberships):
+        """Replaces the group memberships of the batch's users where they changed."""
+        if not memberships:
+            return
+        through = IAMEntity.groups.through
+        users = {self.entities[membership.principal]: membership for membership in memberships}
+        current = defaultdict(set)
+        for user_id, group_id in through.objects.filter(from_iamentity__in=[user.id for user in users]).values_list('from_iamentity_id', 'to_iamentity_id'):
+            current[user_id].add(group_id)
+        for user, membership in users.items():
+            wanted = {self.entities[arn].id for arn in membership.groups}
+            if current[user.id] != wanted:
+                user.groups.set(wanted)
+                self.recorder.changed_entity_ids.add(user.id)
+                self.recorder.rows_written += 1
@@ -0,0 +1,159 @@
+"""
+Opt-in request profiling for the API.
+
+When `API_PROFILING['ENABLED']` is on and a request carries the profiling
+header (default `X-Profile: 1`), `RequestProfilingMiddleware` records:
+
+- SQL query count and time, across every configured database
+- duplicate queries (the same SQL run more than once, i.e. an N+1)
+- time spent in serializers (via `ProfiledSerializerMixin`)
+- total time
+
+and returns them as `Server-Timing` headers, which show up in the browser
+devtools Network tab. Slow requests can optionally be sampled with cProfile
+and dumped to `API_PROFILING['CPROFILE_DIR']` for `snakeviz`/`pstats`.
+"""
+import contextvars
+import cProfile
+import logging
+import os
+import random
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': False,
+    'HEADER': 'X-Profile',
+    'CPROFILE_DIR': None,          # Directory for .prof dumps; None disables cProfile
+    'CPROFILE_SAMPLE_RATE': 0.1,   # Fraction of profiled requests that run under cProfile
+    'SLOW_REQUEST_MS': 500,        # Only dump cProfile output for requests slower than this
+}
+
+_current = contextvars.ContextVar('request_profile', default=None)
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'API_PROFILING', {})}
+
+
+def current_profile():
+    return _current.get()
+
+
+class RequestProfile:
+    def __init__(self):
+        self.query_count = 0
+        self.query_seconds = 0.0
+        self.queries = Counter()
+        self.serializer_seconds = 0.0
+        self.serializer_queries = 0
+        self.serializing = False
+
+    def record_query(self, execute, sql, params, many, context):
+        """`connection.execute_wrapper` hook; `sql` still has placeholders, so repeats are easy to spot."""
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.query_seconds += time.perf_counter() - start
+            self.query_count += 1
+            self.queries[sql] += 1
+
+    @property
+    def duplicate_count(self):
+        return sum(n - 1 for n in self.queries.values() if n > 1)
+
+    def server_timing(self, total_seconds):
+        def ms(seconds):
+            return f"{seconds * 1000:.1f}"
+
+        entries = [
+            f'db;dur={ms(self.query_seconds)};desc="{self.query_count} queries"',
+            f'dup;desc="{self.duplicate_count} duplicate queries"',
+            f'serialize;dur={ms(self.serializer_seconds)};desc="{self.serializer_queries} queries"',
+            f'total;dur={ms(total_seconds)}',
+        ]
+        return ', '.join(entries)
+
+
+class ProfiledSerializerMixin:
+    """
+    Charges time spent in `to_representation` to the active request profile.
+    Nested serializers are only counted once, at the outermost call, and any
+    SQL they trigger (e.g. a missing select_related) is counted separately.
+    """
+
+    def to_representation(self, instance):
+        profile = current_profile()
+        if profile is None or profile.serializing:
+            return super().to_representation(instance)
+
+        profile.serializing = True
+        queries_before = profile.query_count
+        start = time.perf_counter()
+        try:
+            return super().to_representation(instance)
+        finally:
+            profile.serializer_seconds += time.perf_counter() - start
+            profile.serializer_queries += profile.query_count - queries_before
+            profile.serializing = False
+
+
+class RequestProfilingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        config = get_config()
+        if not config['ENABLED'] or request.headers.get(config['HEADER']) not in ('1', 'true'):
+            return self.get_response(request)
+
+        profile = RequestProfile()
+        profiler = None
+        if config['CPROFILE_DIR'] and random.random() < config['CPROFILE_SAMPLE_RATE']:
+            profiler = cProfile.Profile()
+
+        token = _current.set(profile)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(profile.record_query))
+                if profiler:
+                    profiler.enable()
+                try:
+                    response = self.get_response(request)
+                finally:
+                    if profiler:
+                        profiler.disable()
+        finally:
+            _current.reset(token)
+        total = time.perf_counter() - start
+
+        response['Server-Timing'] = profile.server_timing(total)
+
+        if profile.duplicate_count:
+            worst_sql, worst_count = profile.queries.most_common(1)[0]
+            logger.warning(
+                "%s %s ran %d duplicate queries (worst: %dx %s)",
+                request.method, request.path, profile.duplicate_count, worst_count, worst_sql[:200],
+            )
+
+        if profiler and total * 1000 >= config['SLOW_REQUEST_MS']:
+            self.dump_profile(profiler, request, total, config['CPROFILE_DIR'])
+
+        return response
+
+    def dump_profile(self, profiler, request, total, directory):
+        os.makedirs(directory, exist_ok=True)
+        slug = request.path.strip('/').replace('/', '_') or 'root'
+        filename = f"{int(time.time())}-{request.method}-{slug}-{int(total * 1000)}ms.prof"
+        path = os.path.join(directory, filename)
+        profiler.dump_stats(path)
+        logger.info("Wrote cProfile output for slow request to %s", path)
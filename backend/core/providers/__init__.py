@@ -0,0 +1,49 @@
+"""
+Cloud provider registry.
+
+Each cloud lives in its own module in this package, which imports that
+cloud's SDK. The registry imports a provider module the first time an
+account on that platform needs it. A web or Celery worker that never touches
+Azure therefore never pays for loading the Azure SDK, and importing
+`core.providers` itself loads no SDK at all.
+
+A provider module exposes:
+- `fetch(account, client=None)`: syncs the account's IAM data and returns the changed count
+- `set_policy(policy, document)` / `delete_policy(policy)`: write-back used by the policy editor
+- `client(account)` where follow-up jobs need an SDK client (AWS, Azure),
+  and `target_client(account, target_id)` for one member account (AWS)
+- `targets(account, client=None)` / `target_records(account, target_id, client=None)`:
+  enumeration of member accounts and the records of one of them, for
+  accounts that enumerate targets (core/targets.py)
+
+Sync tasks are routed to queues per provider (see core/workloads.py). A
+worker started with `-Q sync.aws.incremental,sync.aws.full` only ever
+loads boto3.
+"""
+import importlib
+import sys
+
+PROVIDERS = {
+    'aws': 'core.providers.aws',
+    'azure': 'core.providers.azure',
+    'gcp': 'core.providers.gcp',
+}
+
+# Top-level SDK packages per provider, for the import benchmark and worker diagnostics
+SDK_MODULES = {
+    'aws': ['boto3', 'botocore'],
+    'azure': ['azure.identity', 'azure.mgmt.authorization'],
+    'gcp': ['google.cloud.iam_v2', 'google.cloud.resourcemanager_v3'],
+}
+
+
+def get_provider(platform):
+    """The provider module for `platform`, imported on first use."""
+    try:
+        return importlib.import_module(PROVIDERS[platform])
+    except KeyError:
+        raise ValueError(f"Unknown platform: {platform}") from None
+
+
+def loaded_providers():
+    return [platform for platform, module in PROVIDERS.items() if module in sys.modules]
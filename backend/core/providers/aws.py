@@ -0,0 +1,193 @@
+"""AWS IAM: users, groups, roles and their managed and inline policies, of one account or every account of an Organization."""
+import json
+import logging
+
+import boto3
+
+from ..credentials import get_credentials
+from ..metrics import get_recorder
+from ..pipeline import Membership, Policy, Principal, run_pipeline
+
+ORGANIZATION_ROLE = 'OrganizationAccountAccessRole'  # Created in every account Organizations creates
+logger = logging.getLogger(__name__)
+
+def session(account):
+    credentials = get_credentials(account)
+    return boto3.Session(
+        aws_access_key_id=credentials.access_key,
+        aws_secret_access_key=credentials.secret_key,
+        region_name='us-east-1'
+    )
+
+def client(account):
+    return session(account).client('iam')
+
+def fetch(account, iam=None):
+    """`iam` can be passed in to use a pre-built client (e.g. the benchmark fakes)."""
+    if iam is None:
+        iam = get_recorder().instrument_boto3(client(account))
+    return run_pipeline(account, records(iam))
+
+# --- ORGANIZATIONS (core/targets.py) ---
+
+def targets(account, organizations=None):
+    """(account id, name) of the Organization's active accounts; needs organizations:ListAccounts."""
+    if organizations is None:
+        organizations = get_recorder().instrument_boto3(session(account).client('organizations'))
+    for page in get_recorder().timed_iter('list', organizations.get_paginator('list_accounts').paginate()):
+        for member in page['Accounts']:
+            if member['Status'] == 'ACTIVE':
+                yield member['Id'], member['Name']
+
+def target_client(account, account_id):
+    """IAM client of one member account: through the organization role, unless it is the account holding the keys."""
+    base = session(account)
+    sts = get_recorder().instrument_boto3(base.client('sts'))
+    if sts.get_caller_identity()['Account'] == account_id:
+        return base.client('iam')
+    role = get_credentials(account).extra_config.get('organization_role', ORGANIZATION_ROLE)
+    assumed = sts.assume_role(RoleArn=f"arn:aws:iam::{account_id}:role/{role}", RoleSessionName='sentinel-iam-sync')['Credentials']
+    return boto3.Session(
+        aws_access_key_id=assumed['AccessKeyId'],
+        aws_secret_access_key=assumed['SecretAccessKey'],
+        aws_session_token=assumed['SessionToken'],
+        region_name='us-east-1'
+    ).client('iam')
+
+def target_records(account, account_id, iam=None):
+    """Records of one member account."""
+    if iam is None:
+        iam = get_recorder().instrument_boto3(target_client(account, account_id))
+    return records(iam)
+
+def records(iam):
+    """
+    Crawls users, their groups and roles, yielding pipeline records
+    (core/pipeline.py). Runs in the pipeline's fetch thread, so it only
+    calls the API.
+    """
+    recorder = get_recorder()
+    paginator = iam.get_paginator('list_users')
+    groups_seen = set()
+
+    for page in recorder.timed_iter('list', paginator.paginate()):
+        for user_data in page['Users']:
+            user_name = user_data['UserName']
+            # Groups first, as the user's membership refers to them. Each group is only crawled once per run.
+            with recorder.phase('list'):
+                groups = iam.list_groups_for_user(UserName=user_name)['Groups']
+            for g in groups:
+                if g['Arn'] not in groups_seen:
+                    groups_seen.add(g['Arn'])
+                    yield from group_records(iam, g)
+
+            yield Principal(user_data['Arn'], user_name, 'user', user_data['CreateDate'])
+            # Fetch Policy & Scan
+            with recorder.phase('list'):
+                policies = iam.list_attached_user_policies(UserName=user_name)
+            for p in policies['AttachedPolicies']:
+                yield managed_policy(iam, user_data['Arn'], p)
+
+            # Inline policies live on the user itself
+            with recorder.phase('list'):
+                inline_names = iam.list_user_policies(UserName=user_name)['PolicyNames']
+            for name in inline_names:
+                with recorder.phase('fetch'):
+                    doc = iam.get_user_policy(UserName=user_name, PolicyName=name)['PolicyDocument']
+                yield Policy(user_data['Arn'], name, doc, 'inline')
+
+            # The user inherits their groups' policies
+            yield Membership(user_data['Arn'], [g['Arn'] for g in groups])
+
+    # Roles, with the trust policy that says who may assume them
+    for page in recorder.timed_iter('list', iam.get_paginator('list_roles').paginate()):
+        for role_data in page['Roles']:
+            yield from role_records(iam, role_data)
+
+def managed_policy(iam, principal_arn, attached):
+    """Fetches the default version of an attached managed policy."""
+    recorder = get_recorder()
+    with recorder.phase('fetch'):
+        policy_info = iam.get_policy(PolicyArn=attached['PolicyArn'])
+        doc = iam.get_policy_version(
+            PolicyArn=attached['PolicyArn'], 
+            VersionId=policy_info['Policy']['DefaultVersionId']
+        )['PolicyVersion']['Document']
+    return Policy(principal_arn, attached['PolicyName'], doc)
+
+def group_records(iam, group_data):
+    """A group with its attached policies."""
+    recorder = get_recorder()
+    yield Principal(group_data['Arn'], group_data['GroupName'], 'group', group_data.get('CreateDate'))
+    with recorder.phase('list'):
+        policies = iam.list_attached_group_policies(GroupName=group_data['GroupName'])
+    for p in policies['AttachedPolicies']:
+        yield managed_policy(iam, group_data['Arn'], p)
+
+def role_records(iam, role_data):
+    """A role with its trust policy, attached and inline policies."""
+    recorder = get_recorder()
+    yield Principal(
+        role_data['Arn'], role_data['RoleName'], 'role', role_data.get('CreateDate'),
+        trust_policy=role_data.get('AssumeRolePolicyDocument'),
+    )
+
+    with recorder.phase('list'):
+        policies = iam.list_attached_role_policies(RoleName=role_data['RoleName'])
+    for p in policies['AttachedPolicies']:
+        yield managed_policy(iam, role_data['Arn'], p)
+
+    with recorder.phase('list'):
+        inline_names = iam.list_role_policies(RoleName=role_data['RoleName'])['PolicyNames']
+    for name in inline_names:
+        with recorder.phase('fetch'):
+            doc = iam.get_role_policy(RoleName=role_data['RoleName'], PolicyName=name)['PolicyDocument']
+        yield Policy(role_data['Arn'], name, doc, 'inline')
+
+# --- POLICY EDITOR ---
+
+def entity_client(entity):
+    """IAM client of the account an entity was crawled from."""
+    account = entity.cloud_account
+    return target_client(account, entity.target.target_id) if entity.target_id else client(account)
+
+def _principal_call(iam, entity, operation, **kwargs):
+    """Calls e.g. 'put_{}_policy' as put_user_policy(UserName=...), put_role_policy(RoleName=...), etc."""
+    kind = entity.entity_type
+    return getattr(iam, operation.format(kind))(**{f"{kind.title()}Name": entity.name}, **kwargs)
+
+def policy_arn(iam, policy_obj):
+    """ARN of an attached managed policy. Only its name is stored, so it is looked up among the entity's attachments."""
+    for attached in _principal_call(iam, policy_obj.entity, 'list_attached_{}_policies')['AttachedPolicies']:
+        if attached['PolicyName'] == policy_obj.name:
+            return attached['PolicyArn']
+    raise LookupError(f"{policy_obj.name} is no longer attached to {policy_obj.entity.arn_or_id}")
+
+def set_policy(policy_obj, new_doc):
+    """
+    Inline policies are replaced in place. AWS doesn't "edit" a managed
+    policy version; it creates a new one and sets it as the default.
+    """
+    try:
+        iam = entity_client(policy_obj.entity)
+        if policy_obj.policy_type == 'inline':
+            _principal_call(iam, policy_obj.entity, 'put_{}_policy', PolicyName=policy_obj.name, PolicyDocument=json.dumps(new_doc))
+        else:
+            iam.create_policy_version(PolicyArn=policy_arn(iam, policy_obj), PolicyDocument=json.dumps(new_doc), SetAsDefault=True)
+        return True
+    except Exception:
+        logger.warning("Writing policy %s to AWS failed", policy_obj.id, exc_info=True)
+        return False
+
+def delete_policy(policy_obj):
+    """Removes the policy from the entity: inline policies are deleted, managed ones (possibly attached elsewhere) detached."""
+    try:
+        iam = entity_client(policy_obj.entity)
+        if policy_obj.policy_type == 'inline':
+            _principal_call(iam, policy_obj.entity, 'delete_{}_policy', PolicyName=policy_obj.name)
+        else:
+            _principal_call(iam, policy_obj.entity, 'detach_{}_policy', PolicyArn=policy_arn(iam, policy_obj))
+        return True
+    except Exception:
+        logger.warning("Removing policy %s from AWS failed", policy_obj.id, exc_info=True)
+        return False
@@ -0,0 +1,89 @@
+"""GCP IAM: service accounts of a project, or of every project under an organization or folder."""
+import logging
+
+from google.cloud import iam_v2, resourcemanager_v3
+from google.oauth2 import service_account
+
+from ..credentials import get_credentials
+from ..metrics import get_recorder
+from ..pipeline import Policy, Principal, run_pipeline
+
+logger = logging.getLogger(__name__)
+
+
+def credentials(account):
+    return service_account.Credentials.from_service_account_info(get_credentials(account).extra_config.get('service_account_json'))
+
+def fetch(account, client=None):
+    info = get_credentials(account).extra_config.get('service_account_json')
+    if client is None:
+        client = iam_v2.IAMClient(credentials=credentials(account))
+    return run_pipeline(account, records(client, info.get('project_id')))
+
+# --- PROJECTS (core/targets.py) ---
+
+def targets(account, clients=None):
+    """
+    (project id, name) of the active projects under extra_config
+    'organization_id' or 'folder_id', walking nested folders. `clients`
+    is a (ProjectsClient, FoldersClient) pair.
+    """
+    recorder = get_recorder()
+    extra_config = get_credentials(account).extra_config
+    if extra_config.get('organization_id'):
+        parents = [f"organizations/{extra_config['organization_id']}"]
+    elif extra_config.get('folder_id'):
+        parents = [f"folders/{extra_config['folder_id']}"]
+    else:
+        raise ValueError("GCP accounts that enumerate targets need an organization_id or folder_id")
+    if clients is None:
+        creds = credentials(account)
+        clients = resourcemanager_v3.ProjectsClient(credentials=creds), resourcemanager_v3.FoldersClient(credentials=creds)
+    projects, folders = clients
+
+    while parents:
+        parent = parents.pop()
+        pager = projects.list_projects(parent=parent)
+        for page in recorder.timed_iter('list', pager.pages, operation='resourcemanager.list_projects'):
+            for project in page.projects:
+                if project.state == resourcemanager_v3.Project.State.ACTIVE:
+                    yield project.project_id, project.display_name
+        pager = folders.list_folders(parent=parent)
+        for page in recorder.timed_iter('list', pager.pages, operation='resourcemanager.list_folders'):
+            parents.extend(folder.name for folder in page.folders if folder.state == resourcemanager_v3.Folder.State.ACTIVE)
+
+def target_records(account, project_id, client=None):
+    return records(client or iam_v2.IAMClient(credentials=credentials(account)), project_id)
+
+def records(client, project_id):
+    """Pipeline records (core/pipeline.py) of every service account in the project."""
+    recorder = get_recorder()
+    pager = client.list_service_accounts(name=f"projects/{project_id}")
+    for page in recorder.timed_iter('list', pager.pages, operation='iam.list_service_accounts'):
+        for sa in page.accounts:
+            yield Principal(sa.unique_id, sa.email, 'user')
+            doc = {'email': sa.email, 'unique_id': sa.unique_id}
+            yield Policy(sa.unique_id, "GCP Service Account Policy", doc)
+
+def set_policy(policy_obj, new_doc):
+    """GCP uses a "Read-Modify-Write" pattern on the project IAM policy."""
+    info = get_credentials(policy_obj.entity.cloud_account_id).extra_config.get('service_account_json')
+    creds = service_account.Credentials.from_service_account_info(info)
+    client = resourcemanager_v3.ProjectsClient(credentials=creds)
+    try:
+        resource = f"projects/{info.get('project_id')}"
+        current_policy = client.get_iam_policy(resource=resource)
+        # Update bindings based on your new_doc logic
+        # (Simplified for MVP: Overwriting bindings)
+        current_policy.bindings.clear()
+        for b in new_doc.get('bindings', []):
+            current_policy.bindings.append(b)
+
+        client.set_iam_policy(resource=resource, policy=current_policy)
+        return True
+    except Exception:
+        logger.warning("Writing policy %s to GCP failed", policy_obj.id, exc_info=True)
+        return False
+
+def delete_policy(policy_obj):
+    return False # Not supported yet
@@ -0,0 +1,108 @@
+"""
+Read replicas.
+
+`ReplicaRouter` (DATABASE_ROUTERS) sends every write, and by default every
+read, to `default`. Reads go to a replica only inside `replica_reads()`.
+`ReplicaReadMixin` opens that scope for a viewset's read-only actions
+(`replica_actions`), so dashboard reads stop competing with sync write
+bursts on the primary. Celery tasks and anything else outside a request
+always use the primary.
+
+Replication lags a little, so a client that just wrote must not read from a
+replica straight away. `ReplicaPinMiddleware` sets a short-lived cookie on
+every successful write, and requests carrying it read from the primary
+until it expires (PIN_SECONDS, which should exceed the replication lag).
+
+Every database alias other than `default` is treated as a replica unless
+REPLICA_ROUTING['ALIASES'] lists them. With no replicas configured all of
+this is a no-op.
+"""
+import contextvars
+import random
+from contextlib import contextmanager
+
+from django.conf import settings
+
+DEFAULTS = {
+    'ALIASES': None,           # Replica aliases; None = every alias in DATABASES except 'default'
+    'PIN_SECONDS': 15,         # Read from the primary for this long after a write
+    'COOKIE': 'db_pin',
+}
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_reads = contextvars.ContextVar('replica_reads', default=False)
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'REPLICA_ROUTING', {})}
+
+
+def replica_aliases():
+    aliases = get_config()['ALIASES']
+    if aliases is None:
+        aliases = [alias for alias in settings.DATABASES if alias != 'default']
+    return aliases
+
+
+@contextmanager
+def replica_reads(enabled=True):
+    """Reads inside this block may be served by a replica."""
+    token = _reads.set(enabled and bool(replica_aliases()))
+    try:
+        yield
+    finally:
+        _reads.reset(token)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if _reads.get():
+            return random.choice(replica_aliases())
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get the schema through replication
+        return db == 'default'
+
+
+def is_pinned(request):
+    return get_config()['COOKIE'] in request.COOKIES
+
+
+class ReplicaPinMiddleware:
+    """Pins a client to the primary for PIN_SECONDS after each successful write."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if request.method not in SAFE_METHODS and response.status_code < 400 and replica_aliases():
+            config = get_config()
+            response.set_cookie(config['COOKIE'], '1', max_age=config['PIN_SECONDS'], httponly=True, samesite='Lax')
+        return response
+
+
+class ReplicaReadMixin:
+    """ViewSet mixin: `replica_actions` read from a replica unless the client is pinned to the primary."""
+    replica_actions = ('list', 'retrieve')
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if request.method in SAFE_METHODS and self.action in self.replica_actions and not is_pinned(request):
+            self._replica_reads = replica_reads()
+            self._replica_reads.__enter__()
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        scope = self.__dict__.pop('_replica_reads', None)
+        if scope is not None:
+            scope.__exit__(None, None, None)
+        return super().finalize_response(request, response, *args, **kwargs)
@@ -1,3 +1,15 @@
+import hashlib
+import json
+
+# Bump when the rules change so stored scan results (core/documents.py) are redone
+SCANNER_VERSION = 1
+
+
+def statement_hash(statement):
+    """Stable hash of one policy statement, independent of key order."""
+    return hashlib.sha256(json.dumps(statement, sort_keys=True, separators=(',', ':')).encode()).hexdigest()[:32]
+
+
 class SecurityScanner:
     def __init__(self, doc):
         self.doc = doc or {}
@@ -6,33 +18,62 @@ class SecurityScanner:
 
     def scan_aws(self):
         """AWS IAM Policy Scanner"""
+        for stmt in self.aws_statements():
+            self.scan_aws_statement(stmt)
+
+        return self.normalize_score(), self.findings
+
+    def scan_aws_statements(self, known=None):
+        """
+        Same result as scan_aws, built statement by statement. `known` maps
+        statement_hash -> [score, findings] from an earlier scan; those
+        statements are not evaluated again. Returns (score, findings, results)
+        where results covers every statement of this document.
+        """
+        known = known or {}
+        results = {}
+        for stmt in self.aws_statements():
+            key = statement_hash(stmt)
+            if key not in results:
+                if key in known:
+                    results[key] = known[key]
+                else:
+                    part = SecurityScanner(None)
+                    part.scan_aws_statement(stmt)
+                    results[key] = [part.risk_score, part.findings]
+            score, findings = results[key]
+            self.risk_score += score
+            self.findings.extend(findings)
+
+        return self.normalize_score(), self.findings, results
+
+    def aws_statements(self):
         statements = self.doc.get('Statement', [])
         if isinstance(statements, dict): statements = [statements]
+        return statements
 
-        for stmt in statements:
-            if stmt.get('Effect') == 'Allow':
-                actions = stmt.get('Action', [])
-                if isinstance(actions, str): actions = [actions]
-                resource = stmt.get('Resource', '')
-
-                # 1. Critical: Wildcard Admin
-                if "*" in actions and resource == "*":
-                    self.add_finding("Critical: Full Administrator Access (Action: *, Resource: *)", 95)
-
-                # 2. High: Privilege Escalation Vectors
-                priv_esc_actions = [
-                    'iam:PutUserPolicy', 'iam:AttachUserPolicy', 
-                    'iam:CreatePolicyVersion', 'iam:PassRole'
-                ]
-                if any(a in actions for a in priv_esc_actions):
-                    self.add_finding("High: Privilege Escalation potential detected.", 80)
-
-                # 3. Medium: Data Exfiltration risk
-                if "s3:*" in actions or "s3:GetObject" in actions:
-                    if resource == "*":
-                        self.add_finding("Medium: Global S3 Read/Write access.", 50)
+    def scan_aws_statement(self, stmt):
+        if stmt.get('Effect') == 'Allow':
+            actions = stmt.get('Action', [])
+            if isinstance(actions, str): actions = [actions]
+            resource = stmt.get('Resource', '')
 
-        return self.normalize_score(), self.findings
+            # 1. Critical: Wildcard Admin
+            if "*" in actions and resource == "*":
+                self.add_finding("Critical: Full Administrator Access (Action: *, Resource: *)", 95)
+
+            # 2. High: Privilege Escalation Vectors
+            priv_esc_actions = [
+                'iam:PutUserPolicy', 'iam:AttachUserPolicy', 
+                'iam:CreatePolicyVersion', 'iam:PassRole'
+            ]
+            if any(a in actions for a in priv_esc_actions):
+                self.add_finding("High: Privilege Escalation potential detected.", 80)
+
+            # 3. Medium: Data Exfiltration risk
+            if "s3:*" in actions or "s3:GetObject" in actions:
+                if resource == "*":
+                    self.add_finding("Medium: Global S3 Read/Write access.", 50)
 
     def scan_azure(self):
         """Azure RBAC Scanner"""
@@ -71,4 +112,25 @@ class SecurityScanner:
         """Placeholder for LLM Integration"""
         # Here you would send self.doc to an LLM like Gemini or GPT-4
         # return "AI Insight: This policy allows user X to delete the entire production DB."
-        pass
\ No newline at end of file
+        pass
+
+# Module-level so the sync pipeline's scan pool (core/pipeline.py) can run
+# them: this module doesn't import Django.
+
+def scan_document(document, platform, known=None):
+    """
+    Scans a document, reusing `known` per-statement results where the
+    platform supports it. Returns (score, findings, statement_results).
+    """
+    scanner = SecurityScanner(document)
+    if platform == 'aws':
+        return scanner.scan_aws_statements(known)
+    if platform == 'azure':
+        score, findings = scanner.scan_azure()
+        return score, findings, {}
+    return 0, [], {}
+
+
+def scan_documents(items):
+    """`scan_document` over a list of (document, platform) pairs."""
+    return [scan_document(document, platform) for document, platform in items]
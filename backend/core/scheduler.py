@@ -0,0 +1,166 @@
+"""
+Adaptive sync scheduling, driven by Celery beat.
+
+Every tick `claim_due_syncs` picks the accounts whose `next_sync_at` has
+passed and hands them back to the beat task to dispatch, while keeping the
+number of in-flight syncs per provider under a cap. When a sync finishes,
+`record_sync_result` moves the account's interval up or down depending on
+how much changed and how big the account is, or backs off if it failed.
+
+Each tenant (the user owning the accounts) has its own in-flight cap, and
+free slots go round-robin across tenants: every tenant's most overdue
+account first, then every tenant's second, and so on. A tenant with
+thousands of accounts therefore can't fill the sync workers on its own.
+"""
+import math
+import random
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Count, F, OuterRef, Q, Subquery, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+
+from .models import CloudAccount, IAMPolicy, SyncRun
+from .workloads import get_config as get_workload_config
+
+DEFAULTS = {
+    'TICK_SECONDS': 60,              # How often beat runs the dispatcher
+    'MIN_INTERVAL': 900,
+    'MAX_INTERVAL': 86400,
+    'MAX_BACKOFF': 86400,            # Cap for failing accounts
+    'HIGH_CHANGE_RATE': 0.05,        # >5% of policies changed -> sync twice as often
+    'MAX_IN_FLIGHT_PER_PROVIDER': {'aws': 10, 'azure': 10, 'gcp': 10},
+    'MAX_IN_FLIGHT_PER_TENANT': 3,
+    'STALE_AFTER': 7200,             # In-flight markers older than this are treated as dead
+}
+
+# Golden ratio conjugate: consecutive account ids land far apart in [0, 1)
+_GOLDEN = (math.sqrt(5) - 1) / 2
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'SYNC_SCHEDULER', {})}
+
+
+def stagger_offset(account_id, interval):
+    """Deterministic slot inside the interval so accounts don't all fire at once."""
+    fraction = (account_id * _GOLDEN) % 1
+    return timedelta(seconds=int(fraction * interval))
+
+
+def next_interval(current, changed, total, config=None):
+    """
+    Adapt the interval to the observed change rate, bounded below by a
+    floor that grows with account size (big accounts are expensive to crawl).
+    """
+    config = config or get_config()
+    rate = changed / total if total else 0
+
+    if rate >= config['HIGH_CHANGE_RATE']:
+        interval = current / 2
+    elif changed == 0:
+        interval = current * 1.5
+    else:
+        interval = current
+
+    # 1k policies -> 1x the minimum, 100k -> 3x, 10M -> 5x
+    size_floor = config['MIN_INTERVAL'] * max(1, math.log10(max(total, 1)) - 2)
+    floor = min(size_floor, config['MAX_INTERVAL'])
+    return int(min(max(interval, floor), config['MAX_INTERVAL']))
+
+
+def backoff_delay(failures, config=None):
+    """Exponential backoff with a little jitter so failing accounts don't retry in lockstep."""
+    config = config or get_config()
+    delay = min(config['MIN_INTERVAL'] * 2 ** max(failures - 1, 0), config['MAX_BACKOFF'])
+    return int(delay * random.uniform(0.9, 1.1))
+
+
+def claim_due_syncs(now=None):
+    """
+    Returns a list of (account_id, platform, countdown) for the beat task to dispatch.
+    Accounts are claimed by setting `sync_started_at`, so two overlapping ticks
+    can never start the same account twice.
+    """
+    config = get_config()
+    now = now or timezone.now()
+    stale_before = now - timedelta(seconds=config['STALE_AFTER'])
+    idle = Q(sync_started_at__isnull=True) | Q(sync_started_at__lt=stale_before)
+
+    # 1. Give new accounts a staggered first slot
+    unscheduled = list(CloudAccount.objects.filter(is_active=True, next_sync_at__isnull=True).only('id', 'sync_interval'))
+    for account in unscheduled:
+        account.next_sync_at = now + stagger_offset(account.id, account.sync_interval)
+    CloudAccount.objects.bulk_update(unscheduled, ['next_sync_at'])
+
+    # 2. Count what is already running per provider and per tenant
+    in_flight = CloudAccount.objects.filter(sync_started_at__gte=stale_before)
+    running = dict(in_flight.values('platform').annotate(n=Count('id')).values_list('platform', 'n'))
+    tenants = dict(in_flight.values('user_id').annotate(n=Count('id')).values_list('user_id', 'n'))
+    caps = config['MAX_IN_FLIGHT_PER_PROVIDER']
+    tenant_cap = config['MAX_IN_FLIGHT_PER_TENANT']
+
+    # 3. Pick the most overdue accounts that fit under their provider and tenant caps, round-robin over tenants
+    due = CloudAccount.objects.filter(is_active=True, next_sync_at__lte=now).filter(idle)
+    picked = []
+    for platform, cap in caps.items():
+        free = cap - running.get(platform, 0)
+        if free <= 0:
+            continue
+        # At most tenant_cap candidates per tenant, ranked by how overdue they are within the tenant
+        candidates = due.filter(platform=platform).annotate(
+            rank=Window(RowNumber(), partition_by=[F('user_id')], order_by=F('next_sync_at').asc())
+        ).filter(rank__lte=tenant_cap).order_by('rank', 'next_sync_at').values_list('id', 'user_id')
+        for account_id, user_id in candidates:
+            if free <= 0:
+                break
+            if tenants.get(user_id, 0) >= tenant_cap:
+                continue
+            if CloudAccount.objects.filter(pk=account_id).filter(idle).update(sync_started_at=now):
+                picked.append((account_id, platform))
+                tenants[user_id] = tenants.get(user_id, 0) + 1
+                free -= 1
+
+    # 4. Spread the starts over the tick instead of firing them together
+    spacing = config['TICK_SECONDS'] / len(picked) if picked else 0
+    return [(account_id, platform, round(i * spacing, 2)) for i, (account_id, platform) in enumerate(picked)]
+
+
+def sync_kinds(account_ids):
+    """
+    'full' or 'incremental' per account id, for queue routing. Accounts
+    without a successful sync yet scan and store every document, and ones
+    whose last sync ran long are expected to again; both go to the full
+    queue so they don't delay the many short syncs.
+    """
+    long_ms = get_workload_config()['LONG_SYNC_SECONDS'] * 1000
+    last = SyncRun.objects.filter(cloud_account=OuterRef('pk'), status='success').order_by('-started_at')
+    durations = CloudAccount.objects.filter(id__in=account_ids).annotate(
+        last_ms=Subquery(last.values('duration_ms')[:1])
+    ).values_list('id', 'last_ms')
+    return {
+        account_id: 'full' if last_ms is None or last_ms > long_ms else 'incremental'
+        for account_id, last_ms in durations
+    }
+
+
+def record_sync_result(account, success, changed=0):
+    """
+    Updates the schedule after a sync finishes and releases the in-flight
+    slot. The caller is responsible for saving the account.
+    """
+    config = get_config()
+    now = timezone.now()
+
+    if success:
+        total = IAMPolicy.objects.filter(cloud_account=account).count()
+        account.sync_interval = next_interval(account.sync_interval, changed, total, config)
+        account.consecutive_failures = 0
+        account.last_change_count = changed
+        account.next_sync_at = now + timedelta(seconds=account.sync_interval)
+    else:
+        account.consecutive_failures += 1
+        account.next_sync_at = now + timedelta(seconds=backoff_delay(account.consecutive_failures, config))
+
+    account.sync_started_at = None
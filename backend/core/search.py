@@ -0,0 +1,157 @@
+"""
+Policy search.
+
+Every PolicyDocument is projected once, when it is first stored, into
+PolicyStatement rows: one per (statement, action, resource, condition key).
+Searches run against that table instead of loading documents into Python.
+
+Query values without wildcards ask "does the policy grant this?", so
+`action=iam:PassRole` also finds `iam:*`, `iam:Pass*` and `*`. Values with
+wildcards are matched as patterns against the text of the policy, so
+`action=s3:Delete*` finds `s3:DeleteObject` and `s3:DeleteBucket`. A bare
+`*` means the literal `*`, which is how to find wildcard resources.
+
+Wildcard patterns are indexed by their literal prefix, like ActionGrant
+(see core/effective.py). Only patterns with a wildcard in the middle need
+an fnmatch check in Python, and those are rare.
+
+Documents are stored compressed (core/storage.py), so free-form containment
+queries (`contains`) run against a second projection, DocumentContent,
+which holds each document as plain JSON. On PostgreSQL that is jsonb with a
+GIN index, and `@>` answers the query without reading documents into
+Python. Databases without JSON containment lookups (SQLite) load the
+candidates' content and match it in Python.
+"""
+import re
+from fnmatch import fnmatchcase
+
+from django.db import connection
+from django.db.models import Q
+
+from .effective import WILDCARDS, _as_list, _prefix
+from .models import DocumentContent, PolicyStatement
+from .storage import json_contains
+
+BATCH_SIZE = 5000
+
+
+def _kind(pattern):
+    """'exact', 'prefix' (text then a single trailing *) or 'glob'."""
+    if not any(w in pattern for w in WILDCARDS):
+        return 'exact'
+    if pattern.endswith('*') and not any(w in pattern[:-1] for w in WILDCARDS):
+        return 'prefix'
+    return 'glob'
+
+
+def statement_rows(document, platform):
+    """Yields (statement_index, effect, action, resource, condition_key) for a policy document."""
+    document = document or {}
+
+    if platform == 'gcp':
+        # A binding grants one role on the project
+        if document.get('role'):
+            yield 0, 'allow', document['role'].lower(), '*', ''
+        return
+
+    if platform == 'azure':
+        for action in _as_list(document.get('actions')):
+            yield 0, 'allow', action.lower(), '*', ''
+        return
+
+    statements = document.get('Statement', [])
+    if isinstance(statements, dict):
+        statements = [statements]
+    for index, stmt in enumerate(statements):
+        effect = str(stmt.get('Effect', '')).lower()
+        if effect not in ('allow', 'deny'):
+            continue
+        condition_keys = sorted({key.lower() for operator in (stmt.get('Condition') or {}).values() if isinstance(operator, dict) for key in operator}) or ['']
+        for action in _as_list(stmt.get('Action')):
+            for resource in _as_list(stmt.get('Resource')) or ['*']:
+                for condition_key in condition_keys:
+                    yield index, effect, action.lower(), resource, condition_key
+
+
+def project_documents(documents):
+    """Writes the PolicyStatement rows and the DocumentContent of newly stored PolicyDocuments."""
+    rows, contents = [], []
+    for document in documents:
+        contents.append(DocumentContent(document_id=document.hash, content=document.document))
+        for index, effect, action, resource, condition_key in statement_rows(document.document, document.platform):
+            rows.append(PolicyStatement(
+                document_id=document.hash,
+                statement_index=index,
+                effect=effect,
+                action=action[:255],
+                action_prefix=_prefix(action)[:255],
+                action_kind=_kind(action),
+                resource=resource[:1024],
+                resource_prefix=_prefix(resource)[:1024],
+                resource_kind=_kind(resource),
+                condition_key=condition_key[:255],
+            ))
+    PolicyStatement.objects.bulk_create(rows, batch_size=BATCH_SIZE)
+    DocumentContent.objects.bulk_create(contents, batch_size=BATCH_SIZE)
+    return len(rows)
+
+
+def _covering(field, value, statements):
+    """Statements whose `field` pattern covers the concrete `value`."""
+    prefixes = {value[:i] for i in range(len(value) + 1)}
+    condition = Q(**{field: value}) | Q(**{f"{field}_kind": 'prefix', f"{field}_prefix__in": prefixes})
+
+    # Patterns like "s3:*Object" can't be answered by the prefix alone
+    globs = statements.filter(**{f"{field}_kind": 'glob', f"{field}_prefix__in": prefixes}).values_list('id', field)
+    matched = [row_id for row_id, pattern in globs if fnmatchcase(value, pattern)]
+    if matched:
+        condition |= Q(id__in=matched)
+    return statements.filter(condition)
+
+
+def _glob_regex(pattern):
+    """Anchored regex for a glob of * and ?. Unlike fnmatch.translate's, PostgreSQL reads it the way Python does."""
+    return '^' + ''.join('.*' if char == '*' else '.' if char == '?' else re.escape(char) for char in pattern) + '$'
+
+
+def _matching(field, pattern, statements):
+    """Statements whose `field` text matches the glob `pattern`."""
+    prefix = _prefix(pattern)
+    if _kind(pattern) == 'prefix':
+        return statements.filter(**{f"{field}__startswith": prefix})
+    return statements.filter(**{f"{field}__startswith": prefix, f"{field}__regex": _glob_regex(pattern)})
+
+
+def search_statements(action=None, resource=None, effect=None, condition_key=None):
+    """PolicyStatement queryset for the given filters (any of them may be None)."""
+    statements = PolicyStatement.objects.all()
+    if effect:
+        statements = statements.filter(effect=effect.lower())
+    if condition_key:
+        statements = statements.filter(condition_key=condition_key.lower())
+
+    for field, value in (('action', action.lower() if action else None), ('resource', resource)):
+        if not value:
+            continue
+        if value == '*':
+            statements = statements.filter(**{field: '*'})
+        elif _kind(value) == 'exact':
+            statements = _covering(field, value, statements)
+        else:
+            statements = _matching(field, value, statements)
+    return statements
+
+
+def documents_containing(pattern, documents=None):
+    """
+    Hashes of the PolicyDocuments (of the `documents` queryset, default all)
+    whose document contains the JSON `pattern`: a subquery on databases with
+    JSON containment lookups, a list elsewhere.
+    """
+    contents = DocumentContent.objects.all()
+    if documents is not None:
+        contents = contents.filter(document__in=documents)
+    if connection.features.supports_json_field_contains:
+        return contents.filter(content__contains=pattern).values('document_id')
+    rows = contents.values_list('document_id', 'content').iterator(chunk_size=BATCH_SIZE)
+    return [digest for digest, content in rows if json_contains(content, pattern)]
@@ -1,11 +1,12 @@
 from rest_framework import serializers
-from .models import CloudAccount, IAMPolicy
+from .models import CloudAccount, CloudAccountTarget, IAMPolicy, SyncRun, EffectivePermissionSet, EscalationPath, IAMPolicyVersion
 from django.contrib.auth import get_user_model
+from .profiling import ProfiledSerializerMixin
 
 
 User = get_user_model()
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(ProfiledSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ('id', 'email', 'username', 'is_2fa_enabled', 'date_joined')
@@ -21,19 +22,38 @@ class UserSerializer(serializers.ModelSerializer):
         )
         return user
 
-class CloudAccountSerializer(serializers.ModelSerializer):
+class CloudAccountSerializer(ProfiledSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = CloudAccount
-        fields = ['id', 'name', 'platform', 'is_active', 'access_key', 'secret_key', 'extra_config', 'last_sync_status']
+        fields = ['id', 'name', 'platform', 'is_active', 'enumerate_targets', 'access_key', 'secret_key', 'extra_config', 'last_sync_status']
+        # Credentials can be set but are never returned (and never decrypted for a response)
         extra_kwargs = {
-            'secret_key': {'write_only': True}
+            'access_key': {'write_only': True},
+            'secret_key': {'write_only': True},
+            'extra_config': {'write_only': True},
         }
 
 
-class IAMPolicySerializer(serializers.ModelSerializer):
+class CloudAccountTargetSerializer(ProfiledSerializerMixin, serializers.ModelSerializer):
+    class Meta:
+        model = CloudAccountTarget
+        fields = [
+            'id', 'target_id', 'name', 'is_active', 'discovered_at', 'last_seen_at',
+            'last_sync_status', 'last_sync_at', 'last_error', 'principal_count', 'policy_count', 'duration_ms'
+        ]
+        # Targets come from enumeration; only whether they are synced can be changed
+        read_only_fields = [field for field in fields if field != 'is_active']
+
+
+class IAMPolicySerializer(ProfiledSerializerMixin, serializers.ModelSerializer):
     # This pulls the name of the User or Role the policy belongs to
     entity_name = serializers.ReadOnlyField(source='entity.name')
     platform = serializers.ReadOnlyField(source='entity.cloud_account.platform')
+    # Documents live in the shared PolicyDocument table; these keep the old flat shape.
+    # On update the view stores the document and passes the PolicyDocument to save().
+    document = serializers.JSONField(source='policy_document.document')
+    finding_details = serializers.ReadOnlyField(source='policy_document.finding_details')
+    document_hash = serializers.ReadOnlyField(source='policy_document_id')
 
     class Meta:
         model = IAMPolicy
@@ -46,6 +66,7 @@ class IAMPolicySerializer(serializers.ModelSerializer):
             'risk_score', 
             'is_vulnerable', 
             'finding_details', 
+            'document_hash',
             'updated_at'
         ]
         # We mark these as read_only because they are generated by our 
@@ -56,4 +77,64 @@ class IAMPolicySerializer(serializers.ModelSerializer):
         """Ensure the policy document is a valid dictionary (JSON)."""
         if not isinstance(value, dict):
             raise serializers.ValidationError("Policy document must be a valid JSON object.")
-        return value
\ No newline at end of file
+        return value
+
+
+class IAMPolicyVersionSerializer(ProfiledSerializerMixin, serializers.ModelSerializer):
+    added_count = serializers.SerializerMethodField()
+    removed_count = serializers.SerializerMethodField()
+
+    class Meta:
+        model = IAMPolicyVersion
+        fields = ['version', 'source', 'risk_score', 'finding_details', 'added_count', 'removed_count', 'created_at']
+        read_only_fields = fields
+
+    def get_added_count(self, obj):
+        return len(obj.added)
+
+    def get_removed_count(self, obj):
+        return len(obj.removed)
+
+class SyncRunSerializer(ProfiledSerializerMixin, serializers.ModelSerializer):
+    class Meta:
+        model = SyncRun
+        fields = [
+            'id',
+            'status',
+            'source',
+            'started_at',
+            'finished_at',
+            'duration_ms',
+            'phase_timings',
+            'api_calls',
+            'throttle_count',
+            'retry_count',
+            'rows_written',
+            'rows_skipped',
+            'peak_rss_kb',
+            'pipeline_stats',
+            'target_stats',
+            'error'
+        ]
+        read_only_fields = fields
+
+
+
+class EffectivePermissionSetSerializer(ProfiledSerializerMixin, serializers.ModelSerializer):
+    entity_name = serializers.ReadOnlyField(source='entity.name')
+    entity_type = serializers.ReadOnlyField(source='entity.entity_type')
+
+    class Meta:
+        model = EffectivePermissionSet
+        fields = ['entity', 'entity_name', 'entity_type', 'allow', 'deny', 'computed_at']
+        read_only_fields = fields
+
+class EscalationPathSerializer(ProfiledSerializerMixin, serializers.ModelSerializer):
+    entity_name = serializers.ReadOnlyField(source='entity.name')
+    entity_type = serializers.ReadOnlyField(source='entity.entity_type')
+
+    class Meta:
+        model = EscalationPath
+        fields = ['entity', 'entity_name', 'entity_type', 'cloud_account', 'hops', 'path', 'computed_at']
+        read_only_fields = fields
+
@@ -0,0 +1,238 @@
+"""
+Compressed JSON columns.
+
+A PolicyDocument's body (the document, its findings and the per-statement
+scan results) is most of the table and of its TOAST I/O. `CompressedJSONField`
+stores such values as bytes: zstd-compressed when the `zstandard` package
+is installed and MODE is 'zstd', UTF-8 JSON otherwise. Both kinds can sit
+in the same column, and each value is read back according to how it was
+written.
+
+Policy JSON is small and repetitive ("Effect", "Action", "arn:aws:iam::",
+"Microsoft.Compute/...") and compresses poorly one value at a time. A
+dictionary trained on our own documents (`train_dictionary`, run by
+`manage.py compress_documents --train`) holds those common strings once, so
+each value only stores what is particular to it. Dictionaries are kept in
+the database and never deleted: every zstd frame names the dictionary it was
+written with, so old rows stay readable after a new one is trained.
+
+Values are decoded when the attribute is first read, not when the row is
+loaded. Code that loads PolicyDocuments for their scores (e.g.
+`resolve_document` during a sync) never decompresses their bodies, and
+saving a row whose body wasn't read writes the stored bytes back as they
+are. `values()` and `values_list()` return the stored bytes (`Encoded`);
+pass them through `decode`. The columns hold bytes, so there are no JSON
+lookups on them; containment queries use DocumentContent (core/search.py).
+"""
+import json
+import threading
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import models
+from django.db.models.query_utils import DeferredAttribute
+
+try:
+    import zstandard
+except ImportError:  # Optional: `pip install zstandard`; without it new values are stored as plain JSON
+    zstandard = None
+
+DEFAULTS = {
+    'MODE': 'zstd',         # 'zstd' or 'json' (uncompressed); existing values are readable either way
+    'LEVEL': 3,             # zstd level; decompression speed hardly depends on it
+    'MIN_SIZE': 64,         # Values shorter than this (in bytes of JSON) are stored as JSON
+    'DICT_SIZE': 64 * 1024, # Bytes of a trained dictionary
+    'DICT_TTL': 300,        # Seconds before a process looks for a newer dictionary to compress with
+}
+
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'  # Start of every zstd frame; JSON text never starts with these bytes
+
+_local = threading.local()      # zstd (de)compressors aren't thread-safe, so each thread keeps its own
+_dictionaries = {}              # dict id -> ZstdCompressionDict; immutable once trained
+_current = [None, 0.0]          # [dict id or None, when it was looked up]
+_lock = threading.Lock()
+_CURRENT = object()             # `encode` default: compress with the current dictionary
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'DOCUMENT_STORAGE', {})}
+
+
+class Encoded(bytes):
+    """A stored value that hasn't been decoded yet."""
+    __slots__ = ()
+
+
+# --- DICTIONARIES ---
+
+def _dictionary(dict_id):
+    """The dictionary with `dict_id`, loaded from the database once per process."""
+    with _lock:
+        if dict_id in _dictionaries:
+            return _dictionaries[dict_id]
+    data = apps.get_model('core', 'CompressionDictionary').objects.filter(id=dict_id).values_list('data', flat=True).first()
+    if data is None:
+        raise ImproperlyConfigured(f"Stored value was compressed with dictionary {dict_id}, which isn't in the database")
+    dictionary = zstandard.ZstdCompressionDict(bytes(data))
+    with _lock:
+        _dictionaries[dict_id] = dictionary
+    return dictionary
+
+
+def current_dictionary(config=None):
+    """Id of the newest dictionary, looked up at most once per DICT_TTL; None before one is trained."""
+    config = config or get_config()
+    now = time.monotonic()
+    with _lock:
+        if _current[1] and now - _current[1] < config['DICT_TTL']:
+            return _current[0]
+    dict_id = apps.get_model('core', 'CompressionDictionary').objects.order_by('-created_at').values_list('id', flat=True).first()
+    with _lock:
+        _current[:] = [dict_id, now]
+    return dict_id
+
+
+def train_dictionary(samples, config=None):
+    """
+    Trains a dictionary on `samples` (decoded JSON values), stores it and
+    makes it the one new values are compressed with. Returns its id. A few
+    hundred samples are enough; zstd refuses to train on too few.
+    """
+    if zstandard is None:
+        raise ImproperlyConfigured("Training a dictionary needs the zstandard package")
+    config = config or get_config()
+    encoded = [_dumps(sample) for sample in samples]
+    try:
+        dictionary = zstandard.train_dictionary(config['DICT_SIZE'], encoded)
+    except zstandard.ZstdError as e:
+        raise ValueError(f"Can't train a dictionary on {len(encoded)} samples ({e}); store more documents first") from None
+
+    model = apps.get_model('core', 'CompressionDictionary')
+    model.objects.create(id=dictionary.dict_id(), data=dictionary.as_bytes(), samples=len(encoded))
+    with _lock:
+        _dictionaries[dictionary.dict_id()] = dictionary
+        _current[:] = [dictionary.dict_id(), time.monotonic()]
+    return dictionary.dict_id()
+
+
+def _compressor(dict_id, level):
+    compressors = _local.__dict__.setdefault('compressors', {})
+    key = (dict_id, level)
+    if key not in compressors:
+        dictionary = _dictionary(dict_id) if dict_id else None
+        compressors[key] = zstandard.ZstdCompressor(level=level, dict_data=dictionary)
+    return compressors[key]
+
+
+def _decompressor(dict_id):
+    decompressors = _local.__dict__.setdefault('decompressors', {})
+    if dict_id not in decompressors:
+        dictionary = _dictionary(dict_id) if dict_id else None
+        decompressors[dict_id] = zstandard.ZstdDecompressor(dict_data=dictionary)
+    return decompressors[dict_id]
+
+
+# --- CODEC ---
+
+def _dumps(value):
+    return json.dumps(value, separators=(',', ':'), ensure_ascii=False).encode()
+
+
+def encode(value, config=None, dict_id=_CURRENT):
+    """
+    Bytes to store for a JSON value. `dict_id` overrides the dictionary
+    (None compresses without one); by default the current one is used.
+    """
+    raw = _dumps(value)
+    config = config or get_config()
+    if zstandard is None or config['MODE'] != 'zstd' or len(raw) < config['MIN_SIZE']:
+        return raw
+    if dict_id is _CURRENT:
+        dict_id = current_dictionary(config)
+    compressed = _compressor(dict_id, config['LEVEL']).compress(raw)
+    return compressed if len(compressed) < len(raw) else raw
+
+
+def decode(value):
+    """The JSON value of stored bytes. Anything else (e.g. an already decoded value) is returned as is."""
+    if not isinstance(value, (bytes, memoryview)):
+        return value
+    data = bytes(value)
+    if data[:4] == ZSTD_MAGIC:
+        if zstandard is None:
+            raise ImproperlyConfigured("Stored value is zstd-compressed; install the zstandard package to read it")
+        data = _decompressor(zstandard.get_frame_parameters(data).dict_id).decompress(data)
+    return json.loads(data)
+
+
+def stored_dictionary(value):
+    """The dictionary id a stored value was compressed with: 0 for none, None if it isn't compressed."""
+    data = bytes(value)
+    if data[:4] != ZSTD_MAGIC or zstandard is None:
+        return None
+    return zstandard.get_frame_parameters(data).dict_id
+
+
+def json_contains(value, pattern):
+    """PostgreSQL's jsonb `value @> pattern`, for decoded JSON."""
+    if isinstance(value, list) and not isinstance(pattern, (dict, list)):
+        # Only at the top level does an array contain a scalar element
+        return any(_contains(element, pattern) for element in value)
+    return _contains(value, pattern)
+
+
+def _contains(value, pattern):
+    if isinstance(pattern, dict):
+        return isinstance(value, dict) and all(key in value and _contains(value[key], item) for key, item in pattern.items())
+    if isinstance(pattern, list):
+        return isinstance(value, list) and all(any(_contains(element, item) for element in value) for item in pattern)
+    # True == 1 in Python but not in JSON
+    return not isinstance(value, (dict, list)) and isinstance(value, bool) == isinstance(pattern, bool) and value == pattern
+
+
+# --- FIELD ---
+
+class _LazyValue(DeferredAttribute):
+    """Decodes the stored bytes on first access and keeps the result on the instance."""
+
+    def __get__(self, instance, cls=None):
+        if instance is None:
+            return self
+        value = super().__get__(instance, cls)
+        if isinstance(value, Encoded):
+            value = decode(value)
+            instance.__dict__[self.field.attname] = value
+        return value
+
+    def __set__(self, instance, value):
+        instance.__dict__[self.field.attname] = value
+
+
+class CompressedJSONField(models.BinaryField):
+    """A JSON value stored compressed (see the module docstring). Reads and writes like a JSONField."""
+    descriptor_class = _LazyValue
+
+    def from_db_value(self, value, expression, connection):
+        return None if value is None else Encoded(value)
+
+    def pre_save(self, model_instance, add):
+        # Reading the attribute would decode a value that hasn't been read; write its stored bytes instead
+        value = model_instance.__dict__.get(self.attname)
+        return value if isinstance(value, Encoded) else super().pre_save(model_instance, add)
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        if value is None:
+            return None
+        if not isinstance(value, Encoded):
+            # Values that were read back unchanged are written as stored
+            value = encode(value)
+        return connection.Database.Binary(value)
+
+    def to_python(self, value):
+        # Fixtures carry the JSON text written by value_to_string
+        return json.loads(value) if isinstance(value, str) else decode(value)
+
+    def value_to_string(self, obj):
+        return json.dumps(self.value_from_object(obj))
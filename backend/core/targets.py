@@ -0,0 +1,254 @@
+"""
+Multi-target syncs.
+
+A CloudAccount with `enumerate_targets` stands for a whole organization:
+its credentials are used to list the member accounts it can reach and each
+of them is crawled with the same fetcher a single account uses.
+
+- AWS: the active accounts of the Organization, each through the role
+  Organizations creates in it (extra_config 'organization_role', default
+  OrganizationAccountAccessRole); the account holding the keys is crawled
+  directly
+- Azure: every enabled subscription visible to the service principal. A
+  principal's id is the same in every subscription, so its entities are
+  keyed `<subscription>/<principalId>`, one per subscription
+- GCP: every active project under extra_config 'organization_id' or
+  'folder_id', including nested folders
+
+Targets are recorded as CloudAccountTarget rows; setting `is_active` to
+False on one leaves it out of later syncs. Up to WORKERS targets are
+crawled at once, each in its own thread, and their records are merged into
+a single sync pipeline (core/pipeline.py), so entities and policies land
+under the parent account and are written by one connection. A principal's
+records are handed over together, which keeps the pipeline's rule that a
+policy follows its principal.
+
+All crawl threads share one token bucket of RATE requests per second (BURST
+at once), applied to every API request the recorder sees
+(`SyncRecorder.pace`). A target that fails is recorded as failed and the
+others carry on; the sync only fails if every target did. Results per
+target are kept on its row and rolled up on the SyncRun (`target_stats`).
+"""
+import contextvars
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+from .metrics import get_recorder
+from .models import CloudAccountTarget
+from .pipeline import Policy, Principal, run_pipeline
+from .providers import get_provider
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'WORKERS': 8,           # Targets crawled at once
+    'RATE': 100,            # API requests per second across all targets of an account; None = unlimited
+    'BURST': 50,            # Requests that may go out at once after a quiet spell
+    'CHUNK_SIZE': 100,      # Records a crawl thread hands over at a time (whole principals only)
+    'QUEUE_SIZE': 16,       # Chunks the crawl threads may get ahead of the pipeline
+}
+
+_DONE = object()  # Put on the queue by a crawl thread when its target is finished
+
+
+class TargetError(Exception):
+    pass
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'SYNC_TARGETS', {})}
+
+
+class RateLimiter:
+    """
+    Token bucket shared by threads. Each request takes a token; when there
+    are none left the caller sleeps until its turn, so callers are served
+    in order at `rate` per second.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.waited = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            self.waited += wait
+        if wait:
+            time.sleep(wait)
+
+
+def discover(account, client=None):
+    """Enumerates the account's targets, records new and renamed ones, and returns the active ones to sync."""
+    found = dict(get_provider(account.platform).targets(account, client))
+    now = timezone.now()
+    existing = {target.target_id: target for target in account.targets.all()}
+
+    created = [
+        CloudAccountTarget(cloud_account=account, target_id=target_id, name=name or '', last_seen_at=now)
+        for target_id, name in found.items() if target_id not in existing
+    ]
+    CloudAccountTarget.objects.bulk_create(created)
+    seen = [target for target_id, target in existing.items() if target_id in found]
+    for target in seen:
+        target.name = found[target.target_id] or target.name
+        target.last_seen_at = now
+    CloudAccountTarget.objects.bulk_update(seen, ['name', 'last_seen_at'])
+
+    return sorted((target for target in created + seen if target.is_active), key=lambda target: target.target_id)
+
+
+def sync_targets(account, clients=None):
+    """
+    Syncs every active target of `account` into it. Returns the number of
+    changed policies. `clients` ({'targets': client, target_id: client, ...})
+    replaces the SDK clients, e.g. with the benchmark fakes.
+    """
+    recorder = get_recorder()
+    config = get_config()
+    clients = clients or {}
+
+    # 1. Enumerate the member accounts
+    with recorder.phase('list'):
+        targets = discover(account, clients.get('targets'))
+    if not targets:
+        raise TargetError(f"{account.name} has no active targets to sync")
+
+    # 2. Crawl them in parallel into one pipeline, at a shared request rate
+    recorder.limiter = RateLimiter(config['RATE'], config['BURST']) if config['RATE'] else None
+    fan_out = FanOut(account, targets, clients, config)
+    try:
+        changed = run_pipeline(account, fan_out.records())
+    finally:
+        fan_out.close()
+        waited = recorder.limiter.waited if recorder.limiter else 0.0
+        recorder.limiter = None
+
+    # 3. Per-target results, rolled up for the SyncRun
+    errors = fan_out.save_results()
+    recorder.targets = {
+        'targets': len(targets),
+        'failed': len(errors),
+        'principals': sum(target.principal_count for target in targets),
+        'policies': sum(target.policy_count for target in targets),
+        'rate_limited_ms': round(waited * 1000, 1),  # Summed over the crawl threads
+        'errors': errors,
+    }
+    if len(errors) == len(targets):
+        raise TargetError(f"All {len(targets)} targets of {account.name} failed, e.g. {next(iter(errors.values()))}")
+    if errors:
+        logger.warning("%s: %d of %d targets failed: %s", account.name, len(errors), len(targets), ', '.join(errors))
+    return changed
+
+
+class FanOut:
+    """Crawls targets on a thread pool and merges their records into one stream."""
+
+    def __init__(self, account, targets, clients, config):
+        self.account = account
+        self.targets = targets
+        self.clients = clients
+        self.config = config
+        self.provider = get_provider(account.platform)
+        self.chunks = queue.Queue(config['QUEUE_SIZE'])
+        self.stopping = threading.Event()
+        self.results = {}  # target pk -> (error or None, principals, policies, seconds)
+        self.executor = None
+
+    def records(self):
+        """The records of every target. Runs in the pipeline's fetch thread."""
+        self.executor = ThreadPoolExecutor(
+            max_workers=max(1, min(self.config['WORKERS'], len(self.targets))),
+            thread_name_prefix=f"sync-target-{self.account.id}",
+        )
+        for target in self.targets:
+            # A context can only be entered by one thread at a time, so each crawl gets its own copy
+            self.executor.submit(contextvars.copy_context().run, self._crawl, target)
+        remaining = len(self.targets)
+        try:
+            while remaining:
+                chunk = self.chunks.get()
+                if chunk is _DONE:
+                    remaining -= 1
+                    continue
+                yield from chunk
+        finally:
+            self.close()
+
+    def close(self):
+        """Stops the crawls (if the pipeline gave up early) and waits for the threads."""
+        self.stopping.set()
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+
+    def _crawl(self, target):
+        started = time.perf_counter()
+        chunk, principals, policies, error = [], 0, 0, None
+        try:
+            for record in self.provider.target_records(self.account, target.target_id, self.clients.get(target.target_id)):
+                if self.stopping.is_set():
+                    return
+                if isinstance(record, Principal):
+                    # Chunks end between principals, so a principal's records are never interleaved with another target's
+                    if len(chunk) >= self.config['CHUNK_SIZE']:
+                        self._put(chunk)
+                        chunk = []
+                    record.target = target.id
+                    principals += 1
+                elif isinstance(record, Policy):
+                    policies += 1
+                chunk.append(record)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            logger.warning("%s: target %s failed: %s", self.account.name, target.target_id, error)
+        finally:
+            # What was crawled before a failure is still synced
+            if chunk:
+                self._put(chunk)
+            self.results[target.id] = (error, principals, policies, time.perf_counter() - started)
+            self._put(_DONE)
+            # Credentials are read through the database in this thread; don't leave its connection behind
+            connections.close_all()
+
+    def _put(self, item):
+        # Gives up when the pipeline has stopped taking records
+        while not self.stopping.is_set():
+            try:
+                self.chunks.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def save_results(self):
+        """Stores each target's outcome on its row. Returns {target_id: error} of the failed ones."""
+        now = timezone.now()
+        errors = {}
+        for target in self.targets:
+            error, principals, policies, seconds = self.results.get(target.id, ('Not crawled', 0, 0, 0.0))
+            target.last_sync_status = error is None
+            target.last_sync_at = now
+            target.last_error = error or ''
+            target.principal_count = principals
+            target.policy_count = policies
+            target.duration_ms = int(seconds * 1000)
+            if error is not None:
+                errors[target.target_id] = error
+        CloudAccountTarget.objects.bulk_update(
+            self.targets, ['last_sync_status', 'last_sync_at', 'last_error', 'principal_count', 'policy_count', 'duration_ms']
+        )
+        return errors
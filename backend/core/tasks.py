@@ -1,33 +1,66 @@
-import boto3
+import logging
+import random
+
 from celery import shared_task
+from celery.exceptions import TimeoutError as TaskTimeoutError
 from django.utils import timezone
-from .models import CloudAccount, IAMEntity, IAMPolicy
-from .scanner import SecurityScanner  # We'll put the scanner logic in a separate file next
+from .models import CloudAccount, IAMPolicy, SyncRun
+from .metrics import SyncRecorder, get_recorder
+from .scheduler import claim_due_syncs, record_sync_result, sync_kinds
+from .effective import refresh_entities
+from .escalation import refresh_account_graph
+from .documents import document_hash, previous_document, rescan_outdated, resolve_document, store_unscanned
+from .scanner import SCANNER_VERSION
+from .versions import latest_version, record_version
+from .access import get_config as get_access_config, is_due, refresh_service_access
+from .history import drop_expired, ensure_partitions, finding_record, record_findings, roll_up_account
+from .workloads import get_config as get_workload_config, sync_queue, time_limits
+from .credentials import without_credentials
+# Cloud SDKs are imported by core/providers/ on first use, not here
+from .providers import get_provider
+from .utils import delete_policy_in_cloud, set_policy_in_cloud
 
-# --- AZURE & GCP SDK IMPORTS ---
-from azure.identity import ClientSecretCredential
-from azure.mgmt.authorization import AuthorizationManagementClient
-from google.oauth2 import service_account
-from google.cloud import iam_v2
+logger = logging.getLogger(__name__)
 
 @shared_task
-def sync_cloud_iam(account_id):
-    """The master background task to sync and scan cloud accounts."""
+def sync_cloud_iam(account_id, snapshot=None):
+    """
+    The master background task to sync and scan cloud accounts. `snapshot`
+    ({'path': ..., 'definitions': ..., 'remove': ...}) syncs from an
+    exported dump instead of the cloud API (core/snapshots.py).
+    """
+    recorder = SyncRecorder()
+    if snapshot is not None:
+        # Imported here: core/snapshots.py imports this module (through core/pipeline.py)
+        from .snapshots import Snapshot
+        snapshot = Snapshot(**snapshot)
     try:
-        account = CloudAccount.objects.get(id=account_id)
-        
-        # 1. Routing to the correct fetcher
-        if account.platform == 'aws':
-            fetch_aws_iam_data(account)
-        elif account.platform == 'azure':
-            fetch_azure_iam_data(account)
-        elif account.platform == 'gcp':
-            fetch_gcp_iam_data(account)
-        
+        # Providers read credentials through core/credentials.py; saves below skip the deferred columns
+        account = without_credentials(CloudAccount.objects).get(id=account_id)
+        # A snapshot only releases the in-flight slot if it took it; the schedule is for API syncs
+        claimed = not account.sync_started_at
+        if claimed:
+            account.sync_started_at = timezone.now()
+            account.save(update_fields=['sync_started_at'])
+        run = SyncRun.objects.create(cloud_account=account, source='snapshot' if snapshot else 'api')
+
+        # 1. Fetch, scan and index
+        with recorder.activate():
+            changed = sync_account(account, snapshot=snapshot)
+
         # 2. Update Status for the "Green Light" dashboard
         account.last_sync_status = True
         account.last_sync_at = timezone.now()
+        if snapshot is None:
+            record_sync_result(account, success=True, changed=changed)
+        elif claimed:
+            account.sync_started_at = None
         account.save()
+        recorder.finish(run, 'success')
+
+        # 3. Unused-permission analysis is slow and not urgent, so it runs after the sync at low priority
+        if account.platform == 'aws' and snapshot is None:
+            analyze_service_access.apply_async(args=[account.id], priority=get_access_config()['PRIORITY'])
         
         return f"Successfully synced and scanned {account.name}"
 
@@ -35,94 +68,226 @@ def sync_cloud_iam(account_id):
         # Mark as "Red Light" if sync fails
         if 'account' in locals():
             account.last_sync_status = False
+            if snapshot is None:
+                record_sync_result(account, success=False)
+            elif claimed:
+                account.sync_started_at = None
             account.save()
+        if 'run' in locals():
+            recorder.finish(run, 'failed', error=str(e))
         return f"Error syncing {account_id}: {str(e)}"
 
-# --- PLATFORM SPECIFIC FETCHERS ---
+    finally:
+        if snapshot is not None and snapshot.remove:
+            snapshot.delete_files()
 
-def fetch_aws_iam_data(account):
-    session = boto3.Session(
-        aws_access_key_id=account.access_key,
-        aws_secret_access_key=account.secret_key,
-        region_name='us-east-1'
-    )
-    iam = session.client('iam')
-    paginator = iam.get_paginator('list_users')
-
-    for page in paginator.paginate():
-        for user_data in page['Users']:
-            entity, _ = IAMEntity.objects.update_or_create(
-                arn_or_id=user_data['Arn'],
-                defaults={
-                    'cloud_account': account,
-                    'name': user_data['UserName'],
-                    'entity_type': 'user',
-                    'created_at_in_cloud': user_data['CreateDate']
-                }
-            )
-            # Fetch Policy & Scan
-            policies = iam.list_attached_user_policies(UserName=user_data['UserName'])
-            for p in policies['AttachedPolicies']:
-                policy_info = iam.get_policy(PolicyArn=p['PolicyArn'])
-                doc = iam.get_policy_version(
-                    PolicyArn=p['PolicyArn'], 
-                    VersionId=policy_info['Policy']['DefaultVersionId']
-                )['PolicyVersion']['Document']
-                
-                # Perform Security Scan
-                run_security_scan(entity, p['PolicyName'], doc, 'aws')
-
-def fetch_azure_iam_data(account):
-    creds = ClientSecretCredential(
-        tenant_id=account.extra_config.get('tenant_id'),
-        client_id=account.access_key,
-        client_secret=account.secret_key
+
+def sync_account(account, client=None, snapshot=None):
+    """
+    Runs the fetcher for the account's platform, or for each of its member
+    accounts if it enumerates targets, or ingests `snapshot` instead, then
+    updates the derived indexes for whatever changed. Returns the number of
+    changed policies.
+    """
+    recorder = get_recorder()
+
+    # 1. Routing to the correct fetcher (imports that provider's SDK the first time)
+    if snapshot is not None:
+        changed = snapshot.ingest(account)
+    elif account.enumerate_targets:
+        # Imported here: core/targets.py imports this module (through core/pipeline.py)
+        from .targets import sync_targets
+        changed = sync_targets(account, client)
+    else:
+        changed = get_provider(account.platform).fetch(account, client)
+
+    # 2. Keep the effective-permission index in step with what changed
+    with recorder.phase('index'):
+        refresh_entities(recorder.changed_entity_ids)
+
+    # 3. Escalation paths only move when permissions or trust policies did
+    if recorder.changed_entity_ids:
+        with recorder.phase('graph'):
+            refresh_account_graph(account, recorder.changed_entity_ids)
+
+    # 4. Append this run's scan results to the history and refresh the trend rollups
+    with recorder.phase('history'):
+        record_findings(recorder.findings)
+        roll_up_account(account)
+    return changed
+
+
+def dispatch_sync(account_id, platform, kind, countdown=0, snapshot=None):
+    """Queues a sync on its provider's incremental or full queue, under that workload's time limits."""
+    return sync_cloud_iam.apply_async(
+        args=[account_id], kwargs={'snapshot': snapshot} if snapshot else None, countdown=countdown,
+        queue=sync_queue(platform, kind), **time_limits(f"sync-{kind}")
     )
-    auth_client = AuthorizationManagementClient(creds, account.extra_config.get('subscription_id'))
-    
-    for assign in auth_client.role_assignments.list_for_subscription():
-        entity, _ = IAMEntity.objects.update_or_create(
-            arn_or_id=assign.principal_id,
-            defaults={'cloud_account': account, 'name': f"Azure-Principal-{assign.principal_id[:8]}", 'entity_type': 'user'}
-        )
-        role_def = auth_client.role_definitions.get_by_id(assign.role_definition_id)
-        doc = {'actions': role_def.permissions[0].actions if role_def.permissions else []}
-        run_security_scan(entity, role_def.role_name, doc, 'azure')
-
-def fetch_gcp_iam_data(account):
-    info = account.extra_config.get('service_account_json')
-    creds = service_account.Credentials.from_service_account_info(info)
-    client = iam_v2.IAMClient(credentials=creds)
-    project_id = info.get('project_id')
-    
-    for sa in client.list_service_accounts(name=f"projects/{project_id}"):
-        entity, _ = IAMEntity.objects.update_or_create(
-            arn_or_id=sa.unique_id,
-            defaults={'cloud_account': account, 'name': sa.email, 'entity_type': 'user'}
-        )
-        doc = {'email': sa.email, 'unique_id': sa.unique_id}
-        run_security_scan(entity, "GCP Service Account Policy", doc, 'gcp')
+
+
+@shared_task
+def schedule_syncs():
+    """Celery beat entry point: starts every account that is due, staggered over the tick."""
+    planned = claim_due_syncs()
+    kinds = sync_kinds([account_id for account_id, _, _ in planned])
+    for account_id, platform, countdown in planned:
+        dispatch_sync(account_id, platform, kinds[account_id], countdown)
+    return f"Dispatched {len(planned)} syncs"
+
+@shared_task
+def rescan_documents(batch_size=500):
+    """Celery beat entry point: rescans documents stored by an older scanner version."""
+    total = 0
+    while rescanned := rescan_outdated(batch_size):
+        total += rescanned
+    return f"Rescanned {total} documents"
+
+@shared_task
+def maintain_findings_history():
+    """Celery beat entry point: creates upcoming history partitions and applies retention."""
+    created = ensure_partitions()
+    removed = drop_expired()
+    return f"Created {len(created)} partitions, dropped {len(removed['partitions_dropped'])}, deleted {removed['records_deleted']} records"
+
+@shared_task
+def analyze_service_access(account_id):
+    """Low-priority follow-up to an AWS sync: refreshes service last-accessed data (core/access.py)."""
+    account = without_credentials(CloudAccount.objects).get(id=account_id)
+    if not is_due(account):
+        return f"Service access for {account.name} is recent enough"
+    provider = get_provider('aws')
+
+    def iam_for(target_id):
+        # Principals crawled from a member account are only known to that account's IAM
+        return provider.client(account) if target_id is None else provider.target_client(account, target_id)
+
+    analyzed, failed = refresh_service_access(account, iam_for)
+    return f"Analyzed service access for {analyzed} principals of {account.name} ({failed} failed)"
+
+@shared_task
+def refresh_escalation(account_id, entity_ids):
+    """Follow-up to a policy edit: updates the escalation paths the edited entities can change (core/escalation.py)."""
+    account = without_credentials(CloudAccount.objects).get(id=account_id)
+    changed = refresh_account_graph(account, entity_ids)
+    return f"Updated {changed} escalation paths of {account.name}"
+
+# --- INTERACTIVE CLOUD WRITES ---
+# The policy editor waits a few seconds for these (see `wait_interactive`),
+# so they run on their own queue instead of behind syncs. Once the cloud
+# accepts a write they also apply it to the local copy, so a write that
+# outlives the wait still shows up before the next sync.
+
+class StillRunning(Exception):
+    """An interactive task outlived INTERACTIVE_WAIT; it carries on as `task_id`."""
+
+    def __init__(self, task_id):
+        super().__init__(task_id)
+        self.task_id = task_id
+
+@shared_task
+def push_policy(policy_id, document):
+    policy = without_credentials(IAMPolicy.objects.select_related('entity__cloud_account'), 'entity__cloud_account').get(id=policy_id)
+    if not set_policy_in_cloud(policy, document):
+        return False
+    apply_policy_edit(policy, document)
+    return True
+
+@shared_task
+def remove_policy(policy_id):
+    policy = without_credentials(IAMPolicy.objects.select_related('entity__cloud_account'), 'entity__cloud_account').get(id=policy_id)
+    if not delete_policy_in_cloud(policy):
+        return False
+    policy.delete()
+    if refresh_entities([policy.entity_id]):
+        refresh_escalation.delay(policy.cloud_account_id, [policy.entity_id])
+    return True
+
+def apply_policy_edit(policy, document):
+    """Stores an edited document on the local copy of `policy`, with its scan, findings, version and permission indexes."""
+    platform = policy.entity.cloud_account.platform
+    replaced = previous_document(policy.policy_document_id)
+    try:
+        # Known documents aren't scanned again; new ones reuse results for unchanged statements
+        policy_document = resolve_document(document, platform, known=replaced['statement_results'] if replaced else None)
+    except Exception:
+        # Fallback so the save doesn't fail if the scanner has a bug
+        logger.warning("Scanning the edited document of policy %s failed", policy.id, exc_info=True)
+        policy_document = store_unscanned(document, platform, random.randint(10, 90), {"issues": ["Scan failed, using default assessment"]})
+    document_changed = policy_document.hash != policy.policy_document_id
+
+    policy.policy_document = policy_document
+    policy.risk_score = policy_document.risk_score
+    policy.is_vulnerable = policy_document.is_vulnerable
+    policy.save(update_fields=['policy_document', 'risk_score', 'is_vulnerable', 'updated_at'])
+    record_findings([finding_record(policy, policy_document, platform)])
+    if document_changed:
+        record_version(policy, document, platform, policy_document.risk_score, policy_document.finding_details, 'edit', latest_version(policy.id), replaced)
+    # Escalation paths can take a while on a big account, so they are updated in the background
+    if refresh_entities([policy.entity_id]):
+        refresh_escalation.delay(policy.cloud_account_id, [policy.entity_id])
+
+def wait_interactive(task, *args):
+    """
+    Runs an interactive task and waits up to INTERACTIVE_WAIT seconds for its
+    result, then raises StillRunning. A task no worker has started within
+    INTERACTIVE_EXPIRES is dropped, so a write can't land long after it was
+    asked for.
+    """
+    config = get_workload_config()
+    result = task.apply_async(args=args, expires=config['INTERACTIVE_EXPIRES'])
+    try:
+        return result.get(timeout=config['INTERACTIVE_WAIT'])
+    except TaskTimeoutError:
+        raise StillRunning(result.id)
 
 # --- THE SCANNER HOOK ---
 
-def run_security_scan(entity, policy_name, document, platform):
-    """Helper to run the scanner and save results."""
-    scanner = SecurityScanner(document)
-    
-    if platform == 'aws':
-        score, findings = scanner.scan_aws()
-    elif platform == 'azure':
-        score, findings = scanner.scan_azure()
-    else:
-        score, findings = 0, []
-
-    IAMPolicy.objects.update_or_create(
-        entity=entity,
-        name=policy_name,
-        defaults={
-            'document': document,
-            'risk_score': score,
-            'finding_details': {"issues": findings},
-            'is_vulnerable': score > 50
-        }
-    )
\ No newline at end of file
+def run_security_scan(entity, policy_name, document, platform, policy_type='managed', digest=None, result=None):
+    """
+    Helper to attach a document to an entity. Documents are stored and
+    scanned once per distinct content (core/documents.py), so an unchanged
+    or already-known document is not scanned again. A changed document gets
+    a new version in the policy's history. Returns True if the policy is
+    new or its document changed. The sync pipeline passes the `digest` it
+    already computed and, for new documents, the scan `result` from its pool.
+    """
+    recorder = get_recorder()
+    previous = IAMPolicy.objects.filter(entity=entity, name=policy_name).values(
+        'id', 'policy_document_id', 'risk_score', 'policy_document__risk_score', 'policy_document__scanner_version', 'cloud_account_id', 'user_id'
+    ).first()
+    digest = digest or document_hash(document, platform)
+    document_changed = previous is None or previous['policy_document_id'] != digest
+    if not document_changed and previous['policy_document__scanner_version'] == SCANNER_VERSION \
+            and previous['risk_score'] == previous['policy_document__risk_score'] \
+            and (previous['cloud_account_id'], previous['user_id']) == (entity.cloud_account_id, entity.user_id):
+        recorder.rows_skipped += 1
+        return False
+
+    # The outgoing document is kept as the first version of policies that have no history yet
+    replaced = previous_document(previous['policy_document_id']) if previous and document_changed else None
+
+    with recorder.phase('scan'):
+        policy_document = resolve_document(document, platform, digest, replaced['statement_results'] if replaced else None, recorder.documents, result)
+
+    with recorder.phase('persist'):
+        policy, _ = IAMPolicy.objects.update_or_create(
+            entity=entity,
+            name=policy_name,
+            defaults={
+                'policy_document': policy_document,
+                'risk_score': policy_document.risk_score,
+                'is_vulnerable': policy_document.is_vulnerable,
+                'policy_type': policy_type,
+                'cloud_account_id': entity.cloud_account_id,
+                'user_id': entity.user_id
+            }
+        )
+        recorder.rows_written += 1
+        recorder.findings.append(finding_record(policy, policy_document, platform))
+        if document_changed:
+            latest = latest_version(previous['id']) if previous else None
+            record_version(policy, document, platform, policy_document.risk_score, policy_document.finding_details, 'sync', latest, replaced)
+
+    if document_changed:
+        recorder.changed_entity_ids.add(entity.id)
+    return document_changed
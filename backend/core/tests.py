@@ -1,3 +1,1395 @@
-from django.test import TestCase
+import datetime
+import decimal
+import errno
+import io
+import json
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import unittest
+import uuid
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+import boto3
+from botocore.stub import Stubber
+from celery.exceptions import TimeoutError as TaskTimeoutError
+from django.core.management import call_command
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from . import credentials, storage
+from .providers import aws as aws_provider, azure as azure_provider
+from .access import collect, get_config as get_access_config
+from .benchmarks.fakes import FakeAuthorizationClient, FakeIAMClient, FakeOrg, OrgSpec
+from .documents import document_hash, resolve_document
+from .scanner import SCANNER_VERSION, scan_document, scan_documents
+from .effective import refresh_entities, who_can
+from .escalation import refresh_account_graph
+from .generators import aws_policy_document
+from .history import SEVERITIES, drop_expired, roll_up_account, trend
+from .metrics import SyncRecorder
+from .profiling import RequestProfilingMiddleware
+from .replicas import ReplicaPinMiddleware, ReplicaRouter, replica_reads
+from . import renderers
+from .models import (
+    CloudAccount, CloudAccountTarget, EscalationEdge, EscalationPath, FindingRecord, FindingRollup, IAMEntity, IAMPolicy, IAMPolicyVersion, PolicyDocument,
+    PolicyStatement, ServiceLastAccessed, SyncRun, User,
+)
+from .pipeline import Membership, Pipeline, Policy, Principal, get_config as get_pipeline_config
+from .search import search_statements
+from .scheduler import DEFAULTS as SCHEDULER_DEFAULTS, backoff_delay, claim_due_syncs, next_interval, record_sync_result
+from .snapshots import Snapshot, SnapshotError, save_upload
+from .targets import sync_targets
+from .utils import delete_policy_in_cloud, set_policy_in_cloud
+from .tasks import StillRunning, analyze_service_access, push_policy, run_security_scan, sync_cloud_iam, wait_interactive
+from .versions import SNAPSHOT_EVERY, diff_versions, document_at, latest_version, record_version
+from .workloads import get_config as get_workload_config
+
+
+def _account(platform='aws', email='owner@example.com'):
+    user = User.objects.create_user(email=email, password='x')
+    return CloudAccount.objects.create(user=user, name=f"Test {platform}", platform=platform)
+
+
+def _entity(account, name, entity_type='user'):
+    return IAMEntity.objects.create(
+        cloud_account=account, user=account.user, name=name, entity_type=entity_type,
+        arn_or_id=f"arn:aws:iam::111111111111:{entity_type}/{name}",
+    )
+
+
+def _policy(entity, name, document):
+    stored = resolve_document(document, entity.cloud_account.platform)
+    return IAMPolicy.objects.create(
+        entity=entity, cloud_account=entity.cloud_account, user=entity.user, name=name, policy_document=stored,
+        risk_score=stored.risk_score, is_vulnerable=stored.is_vulnerable,
+    )
+
+
+def _aws(*statements, version='2012-10-17'):
+    return {'Version': version, 'Statement': list(statements)}
+
+
+def _allow(action, resource='*'):
+    return {'Effect': 'Allow', 'Action': action, 'Resource': resource}
+
+
+def _deny(action, resource='*', **condition):
+    statement = {'Effect': 'Deny', 'Action': action, 'Resource': resource}
+    if condition:
+        statement['Condition'] = {'Bool': condition}
+    return statement
+
+
+class PolicyVersionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        account = _account()
+        cls.policy = _policy(_entity(account, 'alice'), 'inline-1', _aws(_allow('s3:GetObject')))
+
+    def _record(self, document, score=0):
+        return record_version(self.policy, document, 'aws', score, {'issues': []}, 'sync', latest_version(self.policy.id))
+
+    def test_documents_are_rebuilt_across_snapshots(self):
+        documents = [_aws(*(_allow(f"s3:Action{i}") for i in range(n % 4 + 1)), _allow(f"ec2:Run{n}")) for n in range(SNAPSHOT_EVERY * 2 + 3)]
+        versions = [self._record(document) for document in documents]
+
+        # Only the first and every SNAPSHOT_EVERY-th version after it hold all statement bodies
+        snapshots = list(IAMPolicyVersion.objects.filter(policy=self.policy).exclude(snapshot=None).order_by('version').values_list('version', flat=True))
+        self.assertEqual(snapshots, [1, SNAPSHOT_EVERY + 1, 2 * SNAPSHOT_EVERY + 1])
+        for version, document in zip(versions, documents):
+            self.assertEqual(document_at(version), document)
+
+    def test_previous_document_is_kept_as_first_version(self):
+        previous = {'document': _aws(_allow('s3:GetObject')), 'risk_score': 10, 'finding_details': {'issues': []}}
+        version = record_version(self.policy, _aws(_allow('s3:*')), 'aws', 40, {'issues': []}, 'edit', None, previous)
+
+        self.assertEqual(version.version, 2)
+        self.assertEqual(document_at(IAMPolicyVersion.objects.get(policy=self.policy, version=1)), previous['document'])
+
+    def test_diff(self):
+        kept, dropped, added = _allow('s3:GetObject'), _allow('s3:DeleteObject'), _allow('iam:PassRole')
+        old = self._record(_aws(kept, dropped), score=20)
+        new = self._record(_aws(kept, added, version='2008-10-17'), score=70)
+
+        diff = diff_versions(old, new)
+        self.assertEqual(diff['added'], [added])
+        self.assertEqual(diff['removed'], [dropped])
+        self.assertEqual(diff['unchanged'], 1)
+        self.assertEqual(diff['fields_changed'], {'Version': ['2012-10-17', '2008-10-17']})
+        self.assertEqual(diff['risk_score'], [20, 70])
+
+    def test_document_without_statement_list(self):
+        # GCP bindings have no statement list and are versioned as a single statement
+        old = record_version(self.policy, {'role': 'roles/viewer'}, 'gcp', 0, {}, 'sync', None)
+        new = record_version(self.policy, {'role': 'roles/owner'}, 'gcp', 90, {}, 'sync', old)
+
+        self.assertEqual(document_at(new), {'role': 'roles/owner'})
+        self.assertEqual(diff_versions(old, new)['added'], [{'role': 'roles/owner'}])
+
+
+class WhoCanTests(TestCase):
+    BUCKET = 'arn:aws:s3:::reports/*'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.account = _account()
+        cls.user = _entity(cls.account, 'alice')
+        _policy(cls.user, 'read', _aws(_allow('s3:GetObject'), _allow('iam:*')))
+
+    def _who_can(self, action, resource='*', **options):
+        refresh_entities([self.user.id])
+        return who_can(action, resource, [self.account.id], **options)
+
+    def test_allow(self):
+        self.assertEqual(self._who_can('s3:GetObject'), {self.user.id: False})
+        self.assertEqual(self._who_can('S3:GETOBJECT', self.BUCKET), {self.user.id: False})
+        self.assertEqual(self._who_can('s3:PutObject'), {})
+
+    def test_deny_wins_over_allow(self):
+        _policy(self.user, 'deny', _aws(_deny('s3:GetObject')))
+        self.assertEqual(self._who_can('s3:GetObject'), {})
+
+    def test_wildcard_deny_wins_over_exact_allow(self):
+        _policy(self.user, 'deny', _aws(_deny('s3:*')))
+        self.assertEqual(self._who_can('s3:GetObject'), {})
+        self.assertEqual(self._who_can('iam:CreateUser'), {self.user.id: False})
+
+    def test_group_deny_applies_to_members(self):
+        group = _entity(self.account, 'auditors', 'group')
+        self.user.groups.add(group)
+        _policy(group, 'deny', _aws(_deny('iam:*')))
+        self.assertEqual(self._who_can('iam:CreateUser'), {})
+
+    def test_deny_on_one_resource(self):
+        _policy(self.user, 'deny', _aws(_deny('s3:GetObject', self.BUCKET)))
+        self.assertEqual(self._who_can('s3:GetObject', 'arn:aws:s3:::reports/q1.csv'), {})
+        self.assertEqual(self._who_can('s3:GetObject', 'arn:aws:s3:::public/index.html'), {self.user.id: False})
+        # A Deny on one bucket doesn't deny "on *"; the Allow on * still covers other resources
+        self.assertEqual(self._who_can('s3:GetObject'), {self.user.id: False})
+
+    def test_conditional_deny_does_not_deny(self):
+        _policy(self.user, 'deny', _aws(_deny('s3:GetObject', **{'aws:SecureTransport': 'false'})))
+        self.assertEqual(self._who_can('s3:GetObject'), {self.user.id: False})
+
+    def test_conditional_allow(self):
+        _policy(self.user, 'conditional', _aws({**_allow('s3:PutObject'), 'Condition': {'Bool': {'aws:MultiFactorAuthPresent': 'true'}}}))
+        self.assertEqual(self._who_can('s3:PutObject'), {self.user.id: True})
+        self.assertEqual(self._who_can('s3:PutObject', include_conditional=False), {})
+
+
+class EscalationGraphTests(TestCase):
+    def setUp(self):
+        self.account = _account()
+        trusting = {'Statement': [{'Effect': 'Allow', 'Action': 'sts:AssumeRole', 'Principal': {'AWS': '111111111111'}}]}
+        self.deploy = _entity(self.account, 'deploy', 'role')
+        self.mid = _entity(self.account, 'mid', 'role')
+        IAMEntity.objects.filter(id__in=[self.deploy.id, self.mid.id]).update(trust_policy=trusting)
+        self.alice, self.bob, self.carol = (_entity(self.account, name) for name in ('alice', 'bob', 'carol'))
+
+        self.admin = _policy(self.deploy, 'admin', _aws(_allow('iam:*')))
+        _policy(self.mid, 'pass', _aws(_allow('iam:PassRole', self.deploy.arn_or_id)))
+        _policy(self.alice, 'assume', _aws(_allow('sts:AssumeRole', self.deploy.arn_or_id)))
+        _policy(self.bob, 'pass', _aws(_allow('iam:PassRole', 'arn:aws:iam::*:role/dep*')))
+        _policy(self.carol, 'assume', _aws(_allow('sts:AssumeRole', self.mid.arn_or_id)))
+        refresh_entities(IAMEntity.objects.values_list('id', flat=True))
+        refresh_account_graph(self.account)
+
+    def _graph(self):
+        paths = {entity_id: (hops, path) for entity_id, hops, path in EscalationPath.objects.values_list('entity_id', 'hops', 'path')}
+        return paths, set(EscalationEdge.objects.values_list('source_id', 'target_id', 'target_pattern', 'kind'))
+
+    def _assert_incremental_matches_full(self, *changed):
+        refresh_entities([entity.id for entity in changed])
+        refresh_account_graph(self.account, [entity.id for entity in changed])
+        incremental = self._graph()
+        refresh_account_graph(self.account)
+        self.assertEqual(incremental, self._graph())
+
+    def test_shortest_paths(self):
+        paths, _ = self._graph()
+        self.assertEqual({entity_id: hops for entity_id, (hops, _) in paths.items()}, {
+            self.deploy.id: 0, self.alice.id: 1, self.bob.id: 1, self.mid.id: 1, self.carol.id: 2,
+        })
+        self.assertEqual([(step['name'], step['via']) for step in paths[self.carol.id][1]], [('carol', None), ('mid', 'assume'), ('deploy', 'pass_role')])
+        self.assertEqual(paths[self.carol.id][1][-1]['grant'], 'iam:* on *')
+
+    # On a graph this small every change affects most of it, which would fall back to a full rebuild
+    @mock.patch('core.escalation.FULL_REBUILD_SHARE', 1)
+    def test_incremental_refresh_matches_full_rebuild(self):
+        # The seed loses its admin grant: every path through it goes
+        self.admin.delete()
+        self._assert_incremental_matches_full(self.deploy)
+        self.assertFalse(EscalationPath.objects.exists())
+
+        # An entity off the old paths becomes the seed, and carol's path now continues along a stored one
+        _policy(self.mid, 'admin', _aws(_allow('iam:*')))
+        self._assert_incremental_matches_full(self.mid)
+        self.assertEqual(EscalationPath.objects.get(entity=self.carol).hops, 1)
+
+        # A role that stops trusting its account drops the assume edges into it, wildcard or not
+        _policy(self.deploy, 'admin', _aws(_allow('iam:*')))
+        self._assert_incremental_matches_full(self.deploy)
+        IAMEntity.objects.filter(id=self.deploy.id).update(trust_policy={'Statement': []})
+        self._assert_incremental_matches_full(self.deploy)
+        self.assertFalse(EscalationPath.objects.filter(entity=self.alice).exists())
+
+
+class SchedulerTests(TestCase):
+    def setUp(self):
+        self.now = timezone.now()
+
+    def _tenant(self, email, count, overdue_minutes):
+        """`count` AWS accounts of one tenant, the first one `overdue_minutes` overdue and each next one a minute less."""
+        user = User.objects.create_user(email=email, password='x')
+        return [
+            CloudAccount.objects.create(user=user, name=f"{email} {i}", platform='aws', next_sync_at=self.now - timedelta(minutes=overdue_minutes - i))
+            for i in range(count)
+        ]
+
+    def test_next_interval(self):
+        config = SCHEDULER_DEFAULTS
+        self.assertEqual(next_interval(3600, 10, 100, config), 1800)       # High change rate: twice as often
+        self.assertEqual(next_interval(3600, 0, 100, config), 5400)        # Nothing changed: back off
+        self.assertEqual(next_interval(3600, 1, 100, config), 3600)
+        self.assertEqual(next_interval(1000, 50, 100, config), config['MIN_INTERVAL'])
+        self.assertEqual(next_interval(1000, 5000, 100000, config), config['MIN_INTERVAL'] * 3)  # Big accounts have a higher floor
+        self.assertEqual(next_interval(80000, 0, 100, config), config['MAX_INTERVAL'])
+
+    def test_backoff_delay(self):
+        config = SCHEDULER_DEFAULTS
+        for failures, expected in [(1, 900), (2, 1800), (4, 7200), (20, config['MAX_BACKOFF'])]:
+            delay = backoff_delay(failures, config)
+            self.assertGreaterEqual(delay, int(expected * 0.9))
+            self.assertLessEqual(delay, int(expected * 1.1))
+
+    def test_record_sync_result(self):
+        account = self._tenant('owner@example.com', 1, 5)[0]
+        account.sync_started_at = self.now
+        with mock.patch('core.scheduler.random.uniform', return_value=1.0):
+            record_sync_result(account, success=False)
+            record_sync_result(account, success=False)
+        self.assertEqual(account.consecutive_failures, 2)
+        self.assertIsNone(account.sync_started_at)
+        self.assertAlmostEqual((account.next_sync_at - timezone.now()).total_seconds(), 2 * SCHEDULER_DEFAULTS['MIN_INTERVAL'], delta=5)
+
+        record_sync_result(account, success=True, changed=0)
+        self.assertEqual(account.consecutive_failures, 0)
+        self.assertAlmostEqual((account.next_sync_at - timezone.now()).total_seconds(), account.sync_interval, delta=5)
+
+    @override_settings(SYNC_SCHEDULER={'MAX_IN_FLIGHT_PER_PROVIDER': {'aws': 4}, 'MAX_IN_FLIGHT_PER_TENANT': 3})
+    def test_slots_go_round_robin_over_tenants(self):
+        big = self._tenant('big@example.com', 10, 60)
+        small = self._tenant('small@example.com', 2, 30)
+
+        picked = [account_id for account_id, _, _ in claim_due_syncs(self.now)]
+        # The big tenant's accounts are all more overdue, but each tenant gets its most overdue one first
+        self.assertEqual(picked, [big[0].id, small[0].id, big[1].id, small[1].id])
+        # Claimed accounts aren't handed out again while in flight
+        self.assertEqual(claim_due_syncs(self.now), [])
+
+    @override_settings(SYNC_SCHEDULER={'MAX_IN_FLIGHT_PER_PROVIDER': {'aws': 10}, 'MAX_IN_FLIGHT_PER_TENANT': 3})
+    def test_tenant_cap_counts_running_syncs(self):
+        big = self._tenant('big@example.com', 10, 60)
+        CloudAccount.objects.filter(id__in=[big[8].id, big[9].id]).update(sync_started_at=self.now)
+
+        picked = [account_id for account_id, _, _ in claim_due_syncs(self.now)]
+        self.assertEqual(picked, [big[0].id])
+
+    @override_settings(SYNC_SCHEDULER={'MAX_IN_FLIGHT_PER_PROVIDER': {'aws': 10}, 'STALE_AFTER': 7200})
+    def test_stale_claims_are_released(self):
+        account = self._tenant('owner@example.com', 1, 5)[0]
+        CloudAccount.objects.filter(id=account.id).update(sync_started_at=self.now - timedelta(hours=3))
+
+        self.assertEqual([account_id for account_id, _, _ in claim_due_syncs(self.now)], [account.id])
+
+
+
+@override_settings(METRICS_TOKEN='scrape-token')
+class MetricsTests(TestCase):
+    SAMPLE = re.compile(r'^[a-z_]+\{(?:[a-z_]+="(?:[^"\\]|\\.)*",?)*\} -?[0-9.e+-]+$')
+
+    def setUp(self):
+        self.account = _account()
+        SyncRun.objects.create(
+            cloud_account=self.account, status='success', duration_ms=1500, phase_timings={'list': 250.0},
+            api_calls={'iam.ListUsers': {'count': 2, 'total_ms': 40.0, 'max_ms': 30.0, 'errors': 0}}, throttle_count=3, retry_count=4,
+        )
+
+    def test_exposition_format(self):
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape-token')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        lines = response.content.decode().splitlines()
+        declared = set()
+        for line in lines:
+            if line.startswith('# HELP '):
+                declared.add(line.split()[2])
+            elif line.startswith('# TYPE '):
+                self.assertIn(line.split()[3], ('counter', 'gauge'))
+            else:
+                # Every sample is well-formed and follows its metric's HELP and TYPE
+                self.assertRegex(line, self.SAMPLE)
+                self.assertIn(line.split('{')[0], declared)
+        labels = f'account_id="{self.account.id}",platform="aws"'
+        self.assertIn('sentinel_sync_runs_total{platform="aws",status="success"} 1', lines)
+        self.assertIn(f'sentinel_sync_last_throttle_count{{{labels}}} 3', lines)
+        self.assertIn(f'sentinel_sync_last_api_calls{{{labels},operation="iam.ListUsers"}} 2', lines)
+
+    def test_needs_staff_or_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer guess').status_code, 401)
+        self.client.force_login(self.account.user)
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+
+        self.client.force_login(User.objects.create_superuser(email='ops@example.com', password='x'))
+        self.assertEqual(self.client.get('/metrics').status_code, 200)
+
+    @override_settings(METRICS_TOKEN='')
+    def test_empty_token_is_no_token(self):
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer ').status_code, 401)
+
+    def _sync(self, org):
+        fetch = aws_provider.fetch
+        with mock.patch.object(aws_provider, 'fetch', side_effect=lambda account, client=None: fetch(account, FakeIAMClient(org))), \
+                mock.patch('core.tasks.analyze_service_access.apply_async'):
+            sync_cloud_iam(self.account.id)
+        return SyncRun.objects.filter(cloud_account=self.account).order_by('-id').first()
+
+    def test_sync_records_a_run(self):
+        org = FakeOrg(OrgSpec(principals=20, policies=10, roles=5, throttle_rate=0.2))
+        run = self._sync(org)
+
+        self.assertEqual((run.status, run.source), ('success', 'api'))
+        self.assertGreater(run.duration_ms, 0)
+        self.assertLessEqual({'list', 'fetch', 'persist', 'index'}, set(run.phase_timings))
+        self.assertEqual(run.api_calls['iam.ListUsers']['count'], 1)
+        # Each throttled attempt of the fake is retried once
+        self.assertGreater(run.throttle_count, 0)
+        self.assertEqual(run.retry_count, run.throttle_count)
+        self.assertGreater(run.rows_written, 0)
+
+        # Nothing changed in the cloud: the second run only skips
+        again = self._sync(org)
+        self.assertEqual(again.rows_written, 0)
+        self.assertGreater(again.rows_skipped, 0)
+
+    def test_failed_sync_records_the_error(self):
+        with mock.patch.object(aws_provider, 'fetch', side_effect=RuntimeError('AccessDenied')):
+            sync_cloud_iam(self.account.id)
+        run = SyncRun.objects.filter(cloud_account=self.account).order_by('-id').first()
+        self.assertEqual((run.status, run.error), ('failed', 'AccessDenied'))
+        self.assertIsNotNone(run.finished_at)
+
+    def test_boto3_retries_and_throttles_are_counted(self):
+        recorder = SyncRecorder()
+        iam = recorder.instrument_boto3(boto3.client('iam', region_name='us-east-1', aws_access_key_id='test', aws_secret_access_key='test'))
+        with Stubber(iam) as stubber:
+            stubber.add_response('list_users', {'Users': [], 'ResponseMetadata': {'RetryAttempts': 2}})
+            iam.list_users()
+        # botocore asks its retry handler about every attempt; only throttling errors count
+        for code in ('Throttling', 'AccessDenied'):
+            iam.meta.events.emit(
+                'needs-retry.iam.ListUsers', response=(SimpleNamespace(status_code=400, headers={}), {'Error': {'Code': code}}),
+                attempts=1, operation=None, caught_exception=None, request_dict={'context': {}},
+            )
+
+        self.assertEqual((recorder.retries, recorder.throttles), (2, 1))
+        self.assertEqual(recorder.api_calls['iam.ListUsers']['count'], 1)
+
+
+
+@override_settings(API_PROFILING={'ENABLED': True})
+class ProfilingTests(TestCase):
+    TIMING = re.compile(r'^db;dur=[0-9.]+;desc="(\d+) queries", dup;desc="(\d+) duplicate queries", serialize;dur=[0-9.]+;desc="(\d+) queries", total;dur=[0-9.]+$')
+
+    def _timing(self, response):
+        match = self.TIMING.match(response['Server-Timing'])
+        self.assertIsNotNone(match, response['Server-Timing'])
+        return tuple(int(n) for n in match.groups())
+
+    def test_server_timing(self):
+        account = _account()
+        for name in ('alice', 'bob', 'carol'):
+            _policy(_entity(account, name), 'inline-1', _aws(_allow('s3:GetObject')))
+
+        response = self.client.get('/api/policies/', HTTP_X_PROFILE='1')
+        queries, duplicates, serializer_queries = self._timing(response)
+        self.assertGreater(queries, 0)
+        # select_related covers what the serializer reads, however many policies there are
+        self.assertEqual((duplicates, serializer_queries), (0, 0))
+
+        self.assertNotIn('Server-Timing', self.client.get('/api/policies/'))
+        with override_settings(API_PROFILING={'ENABLED': False}):
+            self.assertNotIn('Server-Timing', self.client.get('/api/policies/', HTTP_X_PROFILE='1'))
+
+    def test_duplicate_queries(self):
+        def n_plus_one(request):
+            for email in ('a@example.com', 'b@example.com', 'c@example.com'):
+                User.objects.filter(email=email).exists()
+            return HttpResponse()
+
+        with self.assertLogs('core.profiling', 'WARNING') as logs:
+            response = RequestProfilingMiddleware(n_plus_one)(RequestFactory().get('/n-plus-one', HTTP_X_PROFILE='1'))
+        self.assertEqual(self._timing(response), (3, 2, 0))
+        self.assertIn('GET /n-plus-one ran 2 duplicate queries (worst: 3x', logs.output[0])
+
+
+
+class BenchmarkFakeTests(TestCase):
+    def _fetch(self, provider, client, platform='aws'):
+        account = _account(platform)
+        recorder = SyncRecorder()
+        with recorder.activate():
+            provider.fetch(account, client)
+        return account, recorder
+
+    def test_org_is_deterministic(self):
+        spec = OrgSpec(principals=30, policies=12)
+        first, again, other = FakeOrg(spec), FakeOrg(spec), FakeOrg(OrgSpec(principals=30, policies=12, seed=7))
+        for field in ('documents', 'attachments', 'memberships', 'role_trust'):
+            self.assertEqual(getattr(first, field), getattr(again, field))
+        self.assertNotEqual(first.attachments, other.attachments)
+        # Attachments point into the org's own documents
+        self.assertEqual(len(first.documents), 12)
+        self.assertLessEqual(max(p for attached in first.attachments for p in attached), 11)
+
+    def test_aws_fake_serves_the_fetcher(self):
+        org = FakeOrg(OrgSpec(principals=20, policies=8, roles=6, page_size=7))
+        account, recorder = self._fetch(aws_provider, FakeIAMClient(org))
+
+        entities = IAMEntity.objects.filter(cloud_account=account)
+        self.assertEqual(entities.filter(entity_type='user').count(), 20)
+        self.assertEqual(entities.filter(entity_type='role').count(), 6)
+        self.assertEqual(entities.filter(entity_type='group').count(), len({g for groups in org.memberships for g in groups}))
+        # Pages of page_size, each one request
+        self.assertEqual(recorder.api_calls['iam.ListUsers']['count'], 3)
+        self.assertEqual(recorder.api_calls['iam.ListAttachedUserPolicies']['count'], 20)
+
+    def test_azure_fake_serves_the_fetcher(self):
+        org = FakeOrg(OrgSpec(principals=15, policies=6))
+        account, recorder = self._fetch(azure_provider, FakeAuthorizationClient(org), 'azure')
+
+        self.assertEqual(IAMEntity.objects.filter(cloud_account=account).count(), 15)
+        self.assertEqual(IAMPolicy.objects.filter(cloud_account=account).count(), sum(map(len, org.attachments)))
+        self.assertEqual(recorder.api_calls['authorization.role_definitions.get_by_id']['count'], sum(map(len, org.attachments)))
+
+    def test_throttles_are_retried_and_reported(self):
+        org = FakeOrg(OrgSpec(principals=10, policies=4, roles=2, throttle_rate=0.5))
+        _, recorder = self._fetch(aws_provider, FakeIAMClient(org))
+
+        self.assertGreater(recorder.throttles, 0)
+        self.assertEqual(recorder.retries, recorder.throttles)
+        # Every call still succeeds in the end
+        self.assertEqual(recorder.api_calls['iam.ListUsers']['errors'], 0)
+
+
+
+class SeedPoliciesTests(TestCase):
+    def _seed(self, *args):
+        call_command('seed_policies', '--seed', '3', '--batch-size', '4', *args, stdout=io.StringIO())
+        return set(PolicyDocument.objects.values_list('hash', flat=True))
+
+    def test_scale_mode(self):
+        digests = self._seed('--accounts', '3', '--entities', '10', '--policies-per-entity', '2')
+
+        self.assertEqual(sorted(CloudAccount.objects.values_list('platform', flat=True)), ['aws', 'azure', 'gcp'])
+        self.assertEqual(IAMEntity.objects.count(), 30)
+        self.assertEqual(IAMPolicy.objects.count(), 60)
+        # Common documents are stored once, and every stored document is searchable
+        self.assertLess(len(digests), 60)
+        self.assertEqual(set(PolicyStatement.objects.values_list('document_id', flat=True)), digests)
+        for policy in IAMPolicy.objects.select_related('policy_document'):
+            self.assertEqual(policy.risk_score, policy.policy_document.risk_score)
+
+    def test_seed_is_reproducible(self):
+        digests = self._seed('--accounts', '2', '--entities', '5')
+        self.assertEqual(self._seed('--accounts', '2', '--entities', '5'), digests)
+        self.assertEqual(IAMPolicy.objects.count(), 30)
+
+    def test_append(self):
+        self._seed('--accounts', '1', '--entities', '5')
+        self._seed('--accounts', '1', '--entities', '5', '--append')
+        self.assertEqual(CloudAccount.objects.count(), 2)
+        self.assertEqual(IAMEntity.objects.count(), 10)
+
+
+
+class DocumentTests(TestCase):
+    DOCUMENT = _aws(_allow('s3:GetObject'), _allow('iam:PassRole'))
+
+    def test_document_is_stored_and_scanned_once(self):
+        with mock.patch('core.documents.scan_document', wraps=scan_document) as scan:
+            first = resolve_document(self.DOCUMENT, 'aws')
+            again = resolve_document(json.loads(json.dumps(self.DOCUMENT)), 'aws')
+        self.assertEqual(first.hash, again.hash)
+        self.assertEqual(scan.call_count, 1)
+        self.assertEqual(PolicyDocument.objects.count(), 1)
+        # The same JSON is another document on another platform
+        self.assertNotEqual(document_hash(self.DOCUMENT, 'azure'), first.hash)
+
+        cache = {}
+        resolve_document(self.DOCUMENT, 'aws', cache=cache)
+        with self.assertNumQueries(0):
+            self.assertEqual(resolve_document(self.DOCUMENT, 'aws', cache=cache).hash, first.hash)
+
+    def test_outdated_scan_is_redone(self):
+        stored = resolve_document(self.DOCUMENT, 'aws')
+        PolicyDocument.objects.filter(hash=stored.hash).update(scanner_version=0, risk_score=1)
+
+        rescanned = resolve_document(self.DOCUMENT, 'aws')
+        self.assertEqual(rescanned.scanner_version, SCANNER_VERSION)
+        self.assertEqual(rescanned.risk_score, stored.risk_score)
+        self.assertEqual(PolicyDocument.objects.get(hash=stored.hash).risk_score, stored.risk_score)
+
+    def test_another_worker_stored_it_first(self):
+        stored = resolve_document(self.DOCUMENT, 'aws')
+        statements = PolicyStatement.objects.count()
+
+        # Both workers looked the document up before either stored it
+        with mock.patch.object(PolicyDocument, 'objects', **{'filter.return_value.first.return_value': None}):
+            raced = resolve_document(self.DOCUMENT, 'aws')
+        self.assertEqual(raced.hash, stored.hash)
+        self.assertEqual(PolicyDocument.objects.count(), 1)
+        self.assertEqual(PolicyStatement.objects.count(), statements)
+
+
+class PolicyDocumentMigrationTests(TransactionTestCase):
+    before, after = [('core', '0009_policydocument')], [('core', '0010_policydocument_data')]
+
+    def _migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        self._migrate(MigrationExecutor(connection).loader.graph.leaf_nodes())
+
+    def test_documents_are_moved_and_deduplicated(self):
+        apps = self._migrate(self.before)
+        user = apps.get_model('core', 'User').objects.create(email='owner@example.com', password='x')
+        accounts = {platform: apps.get_model('core', 'CloudAccount').objects.create(user=user, name=platform, platform=platform) for platform in ('aws', 'azure')}
+        IAMEntity, IAMPolicy = apps.get_model('core', 'IAMEntity'), apps.get_model('core', 'IAMPolicy')
+        shared = _aws(_allow('s3:GetObject'))
+        policies = {}
+        for name, platform, document in [('a', 'aws', shared), ('b', 'aws', shared), ('c', 'aws', _aws(_allow('s3:*'))), ('d', 'azure', shared)]:
+            entity = IAMEntity.objects.create(cloud_account=accounts[platform], name=name, arn_or_id=name, entity_type='user')
+            policies[name] = IAMPolicy.objects.create(entity=entity, name=name, document=document, risk_score=40, finding_details={'issues': [name]}).id
+
+        apps = self._migrate(self.after)
+        migrated = {policy.id: policy.policy_document for policy in apps.get_model('core', 'IAMPolicy').objects.select_related('policy_document')}
+        self.assertEqual(apps.get_model('core', 'PolicyDocument').objects.count(), 3)
+        self.assertEqual(migrated[policies['a']].hash, document_hash(shared, 'aws'))
+        self.assertEqual(migrated[policies['a']].hash, migrated[policies['b']].hash)
+        self.assertNotEqual(migrated[policies['a']].hash, migrated[policies['d']].hash)
+        # Old scans are kept until the scanner gets to them
+        self.assertEqual((migrated[policies['c']].risk_score, migrated[policies['c']].scanner_version), (40, 0))
+        self.assertEqual(migrated[policies['c']].document, _aws(_allow('s3:*')))
+
+
+
+class SearchTests(TestCase):
+    LOGS = 'arn:aws:s3:::logs/*'
+
+    @classmethod
+    def setUpTestData(cls):
+        account = _account()
+        entity = _entity(account, 'alice')
+        for name, document in [
+            ('pass-role', _aws(_allow('iam:PassRole'))),
+            ('iam-admin', _aws(_allow('iam:*'))),
+            ('delete-logs', _aws(_allow('s3:DeleteObject', cls.LOGS))),
+            ('any-object', _aws(_allow('s3:*Object'))),
+            ('secure-only', _aws(_deny('s3:GetObject', **{'aws:SecureTransport': 'false'}))),
+        ]:
+            _policy(entity, name, document)
+        cls.client_user = account.user
+
+    def _found(self, **filters):
+        documents = search_statements(**filters).values('document_id')
+        return set(IAMPolicy.objects.filter(policy_document__in=documents).values_list('name', flat=True))
+
+    def test_exact_value_finds_wildcards_that_grant_it(self):
+        self.assertEqual(self._found(action='IAM:PassRole'), {'pass-role', 'iam-admin'})
+        # A wildcard in the middle only matches through the fnmatch check
+        self.assertEqual(self._found(action='s3:PutObject'), {'any-object'})
+        self.assertEqual(self._found(action='s3:DeleteObject', resource='arn:aws:s3:::logs/2026/01.gz'), {'delete-logs', 'any-object'})
+        self.assertEqual(self._found(action='s3:DeleteObject', resource='arn:aws:s3:::public/index.html'), {'any-object'})
+
+    def test_wildcard_value_matches_the_text(self):
+        self.assertEqual(self._found(action='s3:Delete*'), {'delete-logs'})
+        self.assertEqual(self._found(action='s3:*Object'), {'delete-logs', 'any-object', 'secure-only'})
+        self.assertEqual(self._found(action='iam:Pass?ole'), {'pass-role'})
+        self.assertEqual(self._found(resource='arn:aws:s3:::*s/*'), {'delete-logs'})
+        self.assertEqual(self._found(resource='arn:aws:s3:::*s.*'), set())
+        # A bare * is the literal *
+        self.assertEqual(self._found(resource='*'), {'pass-role', 'iam-admin', 'any-object', 'secure-only'})
+
+    def test_effect_and_condition_key(self):
+        self.assertEqual(self._found(effect='Deny'), {'secure-only'})
+        self.assertEqual(self._found(action='s3:GetObject', condition_key='AWS:SecureTransport'), {'secure-only'})
+        self.assertEqual(self._found(action='s3:GetObject', effect='allow'), {'any-object'})
+
+    def test_pagination(self):
+        client = APIClient()
+        client.force_authenticate(self.client_user)
+        IAMPolicy.objects.filter(name='delete-logs').update(risk_score=90)
+
+        pages = [client.get('/api/policies/search/', {'action': 's3:*', 'limit': 2, 'offset': offset}).json() for offset in (0, 2)]
+        self.assertEqual([page['count'] for page in pages], [3, 3])
+        names = [[result['name'] for result in page['results']] for page in pages]
+        self.assertEqual(len(names[0]), 2)
+        self.assertEqual(len(names[1]), 1)
+        # Highest risk first, and no policy on two pages
+        self.assertEqual(names[0][0], 'delete-logs')
+        self.assertEqual(set(names[0]) | set(names[1]), {'delete-logs', 'any-object', 'secure-only'})
+        self.assertEqual(pages[0]['results'][0]['matches'], [
+            {'statement_index': 0, 'effect': 'allow', 'action': 's3:deleteobject', 'resource': self.LOGS, 'condition_key': ''},
+        ])
+
+        self.assertEqual(client.get('/api/policies/search/', {'action': 's3:*', 'limit': 'ten'}).status_code, 400)
+        self.assertEqual(client.get('/api/policies/search/').status_code, 400)
+
+
+
+class TenantScopingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.mine = _account()
+        cls.theirs = _account('aws', 'other@example.com')
+        cls.my_policy = _policy(_entity(cls.mine, 'alice'), 'read', _aws(_allow('s3:GetObject')))
+        cls.their_policy = _policy(_entity(cls.theirs, 'bob'), 'read', _aws(_allow('s3:GetObject')))
+
+    def test_policies_are_scoped_to_the_user(self):
+        client = APIClient()
+        client.force_authenticate(self.mine.user)
+        self.assertEqual([p['id'] for p in client.get('/api/policies/').json()], [self.my_policy.id])
+        self.assertEqual(client.get(f"/api/policies/{self.their_policy.id}/").status_code, 404)
+
+        # Scoped on the denormalized column, not through the entity
+        policies = IAMPolicy.objects.filter(id=self.my_policy.id)
+        self.assertEqual(str(policies.filter(user=self.mine.user).query).count('JOIN'), 0)
+
+        # Anonymous development requests still see everything
+        self.assertEqual({p['id'] for p in APIClient().get('/api/policies/').json()}, {self.my_policy.id, self.their_policy.id})
+
+    def test_who_can_is_scoped_to_the_user(self):
+        refresh_entities([self.my_policy.entity_id, self.their_policy.entity_id])
+        client = APIClient()
+        client.force_authenticate(self.theirs.user)
+        results = client.get('/api/permissions/who_can/', {'action': 's3:GetObject'}).json()['results']
+        self.assertEqual([r['id'] for r in results], [self.their_policy.entity_id])
+
+    def test_sync_writes_the_owner(self):
+        org = FakeOrg(OrgSpec(principals=5, policies=4, roles=2))
+        aws_provider.fetch(self.mine, FakeIAMClient(org))
+
+        entities = IAMEntity.objects.filter(cloud_account=self.mine)
+        self.assertFalse(entities.exclude(user=self.mine.user).exists())
+        policies = IAMPolicy.objects.filter(entity__in=entities)
+        self.assertGreater(policies.count(), 1)
+        self.assertFalse(policies.exclude(user=self.mine.user, cloud_account=self.mine).exists())
+
+    def test_drifted_copy_is_rewritten(self):
+        IAMPolicy.objects.filter(id=self.my_policy.id).update(user=self.theirs.user)
+
+        # The document didn't change, but the copied owner did: rewritten once, then skipped
+        counts = []
+        for _ in range(2):
+            with SyncRecorder().activate() as recorder:
+                self.assertFalse(run_security_scan(self.my_policy.entity, 'read', _aws(_allow('s3:GetObject')), 'aws'))
+            counts.append((recorder.rows_written, recorder.rows_skipped))
+        self.assertEqual(counts, [(1, 0), (0, 1)])
+        self.assertEqual(IAMPolicy.objects.get(id=self.my_policy.id).user_id, self.mine.user_id)
+
+
+
+class FindingsHistoryTests(TestCase):
+    def setUp(self):
+        self.now = timezone.now()
+        self.account = _account()
+        entity = _entity(self.account, 'alice')
+        self.policies = {}
+        for name, score in (('admin', 95), ('passrole', 75), ('read', 0)):
+            self.policies[name] = _policy(entity, name, _aws(_allow(f"s3:{name}")))
+            IAMPolicy.objects.filter(id=self.policies[name].id).update(risk_score=score, is_vulnerable=score > 50)
+
+    def _rollups(self, period='day'):
+        return {r.severity: r for r in FindingRollup.objects.filter(cloud_account=self.account, period=period)}
+
+    def test_roll_up_account(self):
+        FindingRecord.objects.create(cloud_account=self.account, platform='aws', policy_id=self.policies['admin'].id, entity_id=self.policies['admin'].entity_id,
+                                     document_hash=self.policies['admin'].policy_document_id, risk_score=95, severity='critical')
+        self.assertEqual(roll_up_account(self.account, self.now), 2 * len(SEVERITIES))
+
+        day = self._rollups()
+        self.assertEqual(set(day), set(SEVERITIES))
+        self.assertEqual((day['critical'].policies, day['critical'].vulnerable, day['critical'].risk_max, day['critical'].changes), (1, 1, 95, 1))
+        self.assertEqual((day['high'].policies, day['high'].risk_total, day['high'].changes), (1, 75, 0))
+        self.assertEqual(day['none'].policies, 1)
+        self.assertEqual(self._rollups('week')['critical'].bucket.weekday(), 0)
+
+        # A later sync the same day overwrites the rows, and a severity that emptied drops to zero
+        IAMPolicy.objects.filter(id=self.policies['admin'].id).update(risk_score=45, is_vulnerable=False)
+        roll_up_account(self.account, self.now)
+        self.assertEqual(FindingRollup.objects.filter(cloud_account=self.account).count(), 2 * len(SEVERITIES))
+        day = self._rollups()
+        self.assertEqual((day['critical'].policies, day['critical'].risk_max), (0, 0))
+        self.assertEqual(day['medium'].policies, 1)
+
+    def test_trend(self):
+        other = _account('azure', 'other@example.com')
+        IAMPolicy.objects.create(entity=_entity(other, 'bob'), cloud_account=other, user=other.user, name='owner',
+                                 policy_document=self.policies['admin'].policy_document, risk_score=85, is_vulnerable=True)
+        for account in (self.account, other):
+            roll_up_account(account, self.now)
+        since = timezone.localdate(self.now) - timedelta(days=1)
+
+        rows = {row['severity']: row for row in trend('day', since)}
+        self.assertEqual((rows['high']['policies'], rows['high']['risk_total'], rows['high']['avg_risk']), (2, 160, 80.0))
+        self.assertEqual(rows['critical']['risk_max'], 95)
+        self.assertEqual(rows['none']['avg_risk'], 0)
+
+        self.assertEqual([row['policies'] for row in trend('day', since, platform='azure', severity_name='high')], [1])
+        self.assertEqual([row['policies'] for row in trend('day', since, [self.account.id], severity_name='high')], [1])
+        self.assertEqual(list(trend('day', since + timedelta(days=2))), [])
+
+    @unittest.skipIf(connection.vendor == 'postgresql', 'PostgreSQL drops whole partitions instead')
+    def test_drop_expired(self):
+        policy = self.policies['admin']
+        for months_ago in (0, 12, 14):
+            FindingRecord.objects.create(cloud_account=self.account, platform='aws', policy_id=policy.id, entity_id=policy.entity_id,
+                                         document_hash=policy.policy_document_id, risk_score=95, severity='critical',
+                                         recorded_at=self.now - timedelta(days=31 * months_ago))
+        roll_up_account(self.account, self.now - timedelta(days=500))
+        roll_up_account(self.account, self.now)
+
+        removed = drop_expired(self.now)
+        self.assertEqual((removed['partitions_dropped'], removed['records_deleted'], removed['rollups_deleted']), ([], 1, len(SEVERITIES)))
+        self.assertEqual(FindingRecord.objects.count(), 2)
+        # Weekly rollups are kept however old
+        self.assertEqual(FindingRollup.objects.filter(period='week').count(), 2 * len(SEVERITIES))
+
+
+
+@override_settings(REPLICA_ROUTING={'ALIASES': ['replica1'], 'PIN_SECONDS': 15})
+class ReplicaTests(TestCase):
+    def test_router(self):
+        router = ReplicaRouter()
+        self.assertEqual(router.db_for_read(IAMPolicy), 'default')
+        with replica_reads():
+            self.assertEqual(router.db_for_read(IAMPolicy), 'replica1')
+            self.assertEqual(router.db_for_write(IAMPolicy), 'default')
+            with replica_reads(enabled=False):
+                self.assertEqual(router.db_for_read(IAMPolicy), 'default')
+        self.assertEqual(router.db_for_read(IAMPolicy), 'default')
+        self.assertEqual([router.allow_migrate(db, 'core') for db in ('default', 'replica1')], [True, False])
+
+        with override_settings(REPLICA_ROUTING={'ALIASES': []}), replica_reads():
+            self.assertEqual(router.db_for_read(IAMPolicy), 'default')
+
+    def test_writes_pin_the_client(self):
+        factory = RequestFactory()
+        for method, status, pinned in [('post', 201, True), ('delete', 204, True), ('get', 200, False), ('post', 400, False)]:
+            middleware = ReplicaPinMiddleware(lambda request: HttpResponse(status=status))
+            response = middleware(getattr(factory, method)('/api/policies/'))
+            self.assertEqual('db_pin' in response.cookies, pinned, (method, status))
+            if pinned:
+                self.assertEqual(response.cookies['db_pin']['max-age'], 15)
+
+        with override_settings(REPLICA_ROUTING={'ALIASES': []}):
+            self.assertNotIn('db_pin', ReplicaPinMiddleware(lambda request: HttpResponse())(factory.post('/api/policies/')).cookies)
+
+    @override_settings(REPLICA_ROUTING={'ALIASES': ['default']})
+    def test_pinned_clients_read_from_the_primary(self):
+        account = _account()
+        _policy(_entity(account, 'alice'), 'read', _aws(_allow('s3:GetObject')))
+        client = APIClient()
+        client.force_authenticate(account.user)
+        with mock.patch('core.replicas.random.choice', wraps=random.choice) as replica:
+            self.assertEqual(client.get('/api/policies/').status_code, 200)
+            self.assertTrue(replica.called)
+
+            replica.reset_mock()
+            client.cookies['db_pin'] = '1'
+            self.assertEqual(client.get('/api/policies/').status_code, 200)
+            replica.assert_not_called()
+
+
+
+class PipelineTests(TestCase):
+    ADMINS, DEVS = 'arn:aws:iam::111111111111:group/admins', 'arn:aws:iam::111111111111:group/devs'
+    ALICE, BOB = 'arn:aws:iam::111111111111:user/alice', 'arn:aws:iam::111111111111:user/bob'
+
+    def setUp(self):
+        self.account = _account()
+
+    def _run(self, records, **config):
+        # Batches of two records, handed over only when full or at the end of the crawl
+        config = {**get_pipeline_config(), 'BATCH_SIZE': 2, 'BATCH_WAIT': 60, 'SCAN_WORKERS': 0, **config}
+        recorder = SyncRecorder()
+        with recorder.activate():
+            changed = Pipeline(self.account, config).run(records)
+        return changed, recorder
+
+    def _org(self, alice_groups):
+        return [
+            Principal(self.ADMINS, 'admins', 'group'), Principal(self.DEVS, 'devs', 'group'),
+            Principal(self.ALICE, 'alice', 'user'), Policy(self.ALICE, 'read', _aws(_allow('s3:GetObject'))),
+            # alice is the last principal of the batch before, the groups two batches back
+            Membership(self.ALICE, alice_groups), Principal(self.BOB, 'bob', 'user'),
+            Membership(self.BOB, [self.ADMINS]),
+        ]
+
+    def _groups(self, arn):
+        return set(IAMEntity.objects.get(arn_or_id=arn).groups.values_list('name', flat=True))
+
+    def test_policies_spill_into_the_next_batch(self):
+        records = [
+            Principal(self.ALICE, 'alice', 'user'), Principal(self.BOB, 'bob', 'user'),
+            Policy(self.BOB, 'read', _aws(_allow('s3:GetObject'))), Policy(self.BOB, 'write', _aws(_allow('s3:PutObject'))),
+            Principal('arn:aws:iam::111111111111:user/carol', 'carol', 'user'),
+            Policy('arn:aws:iam::111111111111:user/carol', 'read', _aws(_allow('s3:GetObject'))),
+        ]
+        changed, recorder = self._run(records)
+
+        self.assertEqual(changed, 3)
+        self.assertEqual(set(IAMPolicy.objects.values_list('entity__name', 'name')), {('bob', 'read'), ('bob', 'write'), ('carol', 'read')})
+        self.assertEqual(recorder.stages['persist']['items'], 6)
+
+    def test_memberships_keep_groups_of_earlier_batches(self):
+        self._run(self._org([self.ADMINS, self.DEVS]))
+        self.assertEqual(self._groups(self.ALICE), {'admins', 'devs'})
+        self.assertEqual(self._groups(self.BOB), {'admins'})
+
+        _, recorder = self._run(self._org([self.DEVS]))
+        self.assertEqual(self._groups(self.ALICE), {'devs'})
+        self.assertEqual(recorder.rows_written, 1)
+        self.assertEqual(recorder.changed_entity_ids, {IAMEntity.objects.get(arn_or_id=self.ALICE).id})
+
+    def test_unchanged_rows_are_skipped(self):
+        first, recorder = self._run(self._org([self.ADMINS]))
+        self.assertEqual((first, recorder.rows_written, recorder.rows_skipped), (1, 7, 0))
+
+        again, recorder = self._run(self._org([self.ADMINS]))
+        # Four principals and the policy; unchanged memberships aren't counted either way
+        self.assertEqual((again, recorder.rows_written, recorder.rows_skipped), (0, 0, 5))
+        self.assertEqual(recorder.changed_entity_ids, set())
+
+    def test_dead_pool_scans_in_process(self):
+        future = Future()
+        future.set_exception(BrokenProcessPool())
+        pool = mock.Mock(**{'submit.return_value': future})
+        document = _aws(_allow('iam:*'))
+        with mock.patch('core.pipeline.scan_pool', return_value=pool), mock.patch('core.pipeline._reset_pool') as reset, \
+                mock.patch('core.pipeline.scan_documents', wraps=scan_documents) as scan:
+            changed, _ = self._run([Principal(self.ALICE, 'alice', 'user'), Policy(self.ALICE, 'admin', document)], SCAN_WORKERS=1)
+
+        self.assertEqual(changed, 1)
+        reset.assert_called_once_with()
+        scan.assert_called_once_with([(document, 'aws')])
+        stored = IAMPolicy.objects.get(name='admin').policy_document
+        self.assertEqual(stored.risk_score, scan_document(document, 'aws')[0])
+
+
+def _run_now(task, *args):
+    """Stands in for wait_interactive: runs the task in-process, as a worker that answers in time would."""
+    return task(*args)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+@mock.patch('core.tasks.refresh_escalation.delay')
+class PolicyEditorTests(TestCase):
+    def setUp(self):
+        account = _account()
+        self.policy = _policy(_entity(account, 'alice'), 'inline-1', _aws(_allow('s3:GetObject')))
+        self.client = APIClient()
+        self.client.force_authenticate(account.user)
+        self.url = f"/api/policies/{self.policy.id}/"
+
+    @mock.patch('core.tasks.set_policy_in_cloud', return_value=True)
+    @mock.patch('core.views.wait_interactive', side_effect=_run_now)
+    def test_update(self, wait, cloud, refresh_escalation):
+        document = _aws(_allow('s3:*'))
+        response = self.client.patch(self.url, {'document': document}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['document'], document)
+        self.assertEqual(latest_version(self.policy.id).version, 2)
+        refresh_escalation.assert_called_once()
+
+    @mock.patch('core.tasks.set_policy_in_cloud', return_value=False)
+    @mock.patch('core.views.wait_interactive', side_effect=_run_now)
+    def test_rejected_update_is_not_stored(self, wait, cloud, refresh_escalation):
+        response = self.client.patch(self.url, {'document': _aws(_allow('s3:*'))}, format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.policy.refresh_from_db()
+        self.assertEqual(self.policy.policy_document.document, _aws(_allow('s3:GetObject')))
+
+    @mock.patch('core.views.wait_interactive', side_effect=StillRunning('0f1e2d3c-0000-4000-8000-000000000000'))
+    def test_slow_write_answers_202(self, wait, refresh_escalation):
+        for response in (self.client.patch(self.url, {'document': _aws(_allow('s3:*'))}, format='json'), self.client.delete(self.url)):
+            self.assertEqual(response.status_code, 202)
+            self.assertEqual(response.json()['task_id'], '0f1e2d3c-0000-4000-8000-000000000000')
+            self.assertTrue(response.json()['status_url'].endswith('/api/policies/tasks/0f1e2d3c-0000-4000-8000-000000000000/'))
+
+        result = mock.Mock(state='SUCCESS', result=True, **{'ready.return_value': True, 'successful.return_value': True})
+        with mock.patch('core.views.AsyncResult', return_value=result):
+            status = self.client.get('/api/policies/tasks/0f1e2d3c-0000-4000-8000-000000000000/').json()
+        self.assertEqual(status, {'task_id': '0f1e2d3c-0000-4000-8000-000000000000', 'state': 'SUCCESS', 'accepted': True})
+
+    @mock.patch('core.views.wait_interactive', side_effect=StillRunning('0f1e2d3c-0000-4000-8000-000000000001'))
+    def test_task_of_another_user_is_not_found(self, wait, refresh_escalation):
+        self.assertEqual(self.client.delete(self.url).status_code, 202)
+
+        other = APIClient()
+        other.force_authenticate(_account('aws', 'bob@example.com').user)
+        with mock.patch('core.views.AsyncResult') as result:
+            self.assertEqual(other.get('/api/policies/tasks/0f1e2d3c-0000-4000-8000-000000000001/').status_code, 404)
+            # Ids no one was answered with aren't looked up either
+            self.assertEqual(self.client.get('/api/policies/tasks/0f1e2d3c-0000-4000-8000-0000000000ff/').status_code, 404)
+        result.assert_not_called()
+
+    @mock.patch('core.views.wait_interactive', side_effect=StillRunning('0f1e2d3c-0000-4000-8000-000000000000'))
+    def test_slow_write_keeps_other_fields(self, wait, refresh_escalation):
+        response = self.client.patch(self.url, {'name': 'renamed', 'document': _aws(_allow('s3:*'))}, format='json')
+
+        self.assertEqual(response.status_code, 202)
+        self.policy.refresh_from_db()
+        self.assertEqual(self.policy.name, 'renamed')
+        # The document waits for the cloud
+        self.assertEqual(self.policy.policy_document.document, _aws(_allow('s3:GetObject')))
+
+    @mock.patch('core.tasks.delete_policy_in_cloud', return_value=True)
+    @mock.patch('core.views.wait_interactive', side_effect=_run_now)
+    def test_destroy(self, wait, cloud, refresh_escalation):
+        self.assertEqual(self.client.delete(self.url).status_code, 204)
+        self.assertFalse(IAMPolicy.objects.filter(id=self.policy.id).exists())
+
+    def test_wait_interactive_raises_still_running(self, refresh_escalation):
+        result = mock.Mock(id='task-1', **{'get.side_effect': TaskTimeoutError})
+        with mock.patch.object(push_policy, 'apply_async', return_value=result) as apply_async:
+            with self.assertRaises(StillRunning) as raised:
+                wait_interactive(push_policy, self.policy.id, {})
+        self.assertEqual(raised.exception.task_id, 'task-1')
+        # The task outlives the wait: it only expires if no worker has started it by INTERACTIVE_EXPIRES
+        config = get_workload_config()
+        self.assertEqual(apply_async.call_args.kwargs['expires'], config['INTERACTIVE_EXPIRES'])
+        result.get.assert_called_once_with(timeout=config['INTERACTIVE_WAIT'])
+
+
+
+class ProviderTests(TestCase):
+    def setUp(self):
+        self.entity = _entity(_account(), 'alice')
+        self.policy = _policy(self.entity, 'Read', _aws(_allow('s3:GetObject')))
+        self.iam = mock.Mock(**{'list_attached_user_policies.return_value': {'AttachedPolicies': [
+            {'PolicyName': 'Read', 'PolicyArn': 'arn:aws:iam::111111111111:policy/team/Read'},
+        ]}})
+        patcher = mock.patch('core.providers.aws.client', return_value=self.iam)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_sdks_load_on_first_use(self):
+        # A fresh interpreter, as this one imported the providers long ago
+        script = (
+            "import sys, django; django.setup(); from core import providers, tasks, views; "
+            "sdks = lambda: sorted(m for ms in providers.SDK_MODULES.values() for m in ms if m in sys.modules); "
+            "print(sdks()); providers.get_provider('aws'); print(sdks(), providers.loaded_providers())"
+        )
+        output = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True, cwd=Path(__file__).resolve().parent.parent).stdout
+        self.assertEqual(output.splitlines(), ["[]", "['boto3', 'botocore'] ['aws']"])
+
+    def test_managed_policy_gets_a_new_version(self):
+        self.assertTrue(set_policy_in_cloud(self.policy, _aws(_allow('s3:*'))))
+        self.iam.create_policy_version.assert_called_once_with(
+            PolicyArn='arn:aws:iam::111111111111:policy/team/Read', PolicyDocument=json.dumps(_aws(_allow('s3:*'))), SetAsDefault=True,
+        )
+
+        self.assertTrue(delete_policy_in_cloud(self.policy))
+        # Detached only: a managed policy can be attached elsewhere
+        self.iam.detach_user_policy.assert_called_once_with(UserName='alice', PolicyArn='arn:aws:iam::111111111111:policy/team/Read')
+        self.iam.delete_policy.assert_not_called()
+
+    def test_inline_policy_is_replaced(self):
+        self.policy.policy_type = 'inline'
+        self.assertTrue(set_policy_in_cloud(self.policy, _aws(_allow('s3:*'))))
+        self.iam.put_user_policy.assert_called_once_with(UserName='alice', PolicyName='Read', PolicyDocument=json.dumps(_aws(_allow('s3:*'))))
+
+        self.assertTrue(delete_policy_in_cloud(self.policy))
+        self.iam.delete_user_policy.assert_called_once_with(UserName='alice', PolicyName='Read')
+
+    def test_azure_role_is_found_by_name(self):
+        account = CloudAccount.objects.create(user=self.entity.user, name='Test azure', platform='azure', extra_config={'subscription_id': 'sub-1'})
+        policy = _policy(_entity(account, 'bob'), 'Reader', {'actions': ['*/read']})
+        role = SimpleNamespace(name='abc-guid', assignable_scopes=['/subscriptions/sub-1'])
+        auth_client = mock.Mock(**{'role_definitions.list.return_value': [role]})
+
+        with mock.patch('core.providers.azure.client', return_value=auth_client):
+            self.assertTrue(set_policy_in_cloud(policy, {'actions': ['*/read', 'Microsoft.Compute/*']}))
+        auth_client.role_definitions.list.assert_called_once_with('/subscriptions/sub-1', filter="roleName eq 'Reader'")
+        update = auth_client.role_definitions.create_or_update.call_args.kwargs
+        self.assertEqual((update['scope'], update['role_definition_id']), ('/subscriptions/sub-1', 'abc-guid'))
+        self.assertEqual(update['role_definition']['permissions'], [{'actions': ['*/read', 'Microsoft.Compute/*']}])
+
+    def test_failed_write_is_logged(self):
+        self.iam.create_policy_version.side_effect = RuntimeError('LimitExceeded')
+        with self.assertLogs('core.providers.aws', 'WARNING') as logs:
+            self.assertFalse(set_policy_in_cloud(self.policy, _aws(_allow('s3:*'))))
+        self.assertIn('LimitExceeded', logs.output[0])
+
+        self.policy.name = 'Detached'
+        with self.assertLogs('core.providers.aws', 'WARNING'):
+            self.assertFalse(delete_policy_in_cloud(self.policy))
+
+
+AWS_SNAPSHOT = {
+    'UserDetailList': [{
+        'UserName': 'alice', 'Arn': 'arn:aws:iam::111111111111:user/alice', 'CreateDate': '2026-01-02T03:04:05Z',
+        'GroupList': ['admins', 'gone'],
+        'AttachedManagedPolicies': [
+            {'PolicyName': 'Read', 'PolicyArn': 'arn:aws:iam::111111111111:policy/Read'},
+            {'PolicyName': 'Filtered', 'PolicyArn': 'arn:aws:iam::aws:policy/Filtered'},
+        ],
+        # The raw API returns inline documents URL-encoded
+        'UserPolicyList': [{'PolicyName': 'inline', 'PolicyDocument': '%7B%22Version%22%3A%222012-10-17%22%2C%22Statement%22%3A%5B%5D%7D'}],
+    }],
+    'GroupDetailList': [{'GroupName': 'admins', 'Arn': 'arn:aws:iam::111111111111:group/admins', 'GroupPolicyList': [], 'AttachedManagedPolicies': []}],
+    'RoleDetailList': [{
+        'RoleName': 'deploy', 'Arn': 'arn:aws:iam::111111111111:role/deploy',
+        'AssumeRolePolicyDocument': _aws({'Effect': 'Allow', 'Principal': {'Service': 'ec2.amazonaws.com'}, 'Action': 'sts:AssumeRole'}),
+        'RolePolicyList': [], 'AttachedManagedPolicies': [],
+    }],
+    'Policies': [{
+        'PolicyName': 'Read', 'Arn': 'arn:aws:iam::111111111111:policy/Read',
+        'PolicyVersionList': [
+            {'VersionId': 'v1', 'IsDefaultVersion': False, 'Document': _aws(_allow('*'))},
+            {'VersionId': 'v2', 'IsDefaultVersion': True, 'Document': _aws(_allow('s3:GetObject'))},
+        ],
+    }],
+}
+
+AZURE_DEFINITIONS = [{
+    'id': '/subscriptions/sub-1/providers/Microsoft.Authorization/roleDefinitions/ABC', 'roleName': 'Reader',
+    'permissions': [{'actions': ['*/read']}],
+}]
+
+AZURE_ASSIGNMENTS = [
+    {'principalId': 'aaaaaaaa-0000', 'principalName': 'bob@example.com', 'roleDefinitionId': '/providers/Microsoft.Authorization/roleDefinitions/abc'},
+    {'principalId': 'bbbbbbbb-0000', 'roleDefinitionId': '/providers/Microsoft.Authorization/roleDefinitions/unknown'},
+]
+
+
+class SnapshotTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.dir = Path(directory.name)
+
+    def _dump(self, name, content):
+        path = self.dir / name
+        path.write_text(json.dumps(content))
+        return str(path)
+
+    def _aws_records(self):
+        with self.assertLogs('core.snapshots', 'WARNING'):
+            return list(Snapshot(self._dump('aws.json', AWS_SNAPSHOT)).records('aws'))
+
+    def test_aws_records(self):
+        alice, deploy = 'arn:aws:iam::111111111111:user/alice', 'arn:aws:iam::111111111111:role/deploy'
+        records = self._aws_records()
+        self.assertEqual(records[0], Principal('arn:aws:iam::111111111111:group/admins', 'admins', 'group'))
+        self.assertEqual(records[1].created_at, datetime.datetime(2026, 1, 2, 3, 4, 5, tzinfo=datetime.timezone.utc))
+        # The default version of the managed policy; the one missing from Policies is skipped
+        self.assertEqual(records[2:5], [
+            Policy(alice, 'Read', _aws(_allow('s3:GetObject'))),
+            Policy(alice, 'inline', {'Version': '2012-10-17', 'Statement': []}, 'inline'),
+            Membership(alice, ['arn:aws:iam::111111111111:group/admins']),
+        ])
+        self.assertEqual(records[5].arn, deploy)
+        self.assertEqual(records[5].trust_policy, AWS_SNAPSHOT['RoleDetailList'][0]['AssumeRolePolicyDocument'])
+        self.assertEqual(len(records), 6)
+
+    def test_without_ijson(self):
+        streamed = self._aws_records()
+        with mock.patch('core.snapshots.ijson', None):
+            self.assertEqual(self._aws_records(), streamed)
+
+    def test_azure_records(self):
+        expected = [Principal('aaaaaaaa-0000', 'bob@example.com', 'user'), Policy('aaaaaaaa-0000', 'Reader', {'actions': ['*/read']})]
+        combined = Snapshot(self._dump('azure.json', {'roleAssignments': AZURE_ASSIGNMENTS, 'roleDefinitions': AZURE_DEFINITIONS}))
+        separate = Snapshot(self._dump('assignments.json', AZURE_ASSIGNMENTS), self._dump('definitions.json', AZURE_DEFINITIONS))
+        for snapshot in (combined, separate):
+            # The assignment of a role that isn't in the dump is skipped
+            with self.assertLogs('core.snapshots', 'WARNING'):
+                self.assertEqual(list(snapshot.records('azure')), expected)
+
+        with self.assertRaises(SnapshotError):
+            list(Snapshot(self._dump('bare.json', AZURE_ASSIGNMENTS)).records('azure'))
+
+    def test_snapshot_sync_releases_slot_and_keeps_schedule(self):
+        account = _account('azure')
+        next_sync_at = account.next_sync_at = timezone.now() + timedelta(hours=1)
+        account.save()
+        dumps = {
+            'success': self._dump('azure.json', {'roleAssignments': AZURE_ASSIGNMENTS[:1], 'roleDefinitions': AZURE_DEFINITIONS}),
+            'failure': self._dump('bare.json', AZURE_ASSIGNMENTS),
+        }
+        for outcome, path in dumps.items():
+            with self.subTest(outcome):
+                sync_cloud_iam(account.id, {'path': path})
+                account.refresh_from_db()
+                self.assertEqual(account.last_sync_status, outcome == 'success')
+                self.assertIsNone(account.sync_started_at)
+                self.assertEqual((account.sync_interval, account.next_sync_at, account.consecutive_failures), (3600, next_sync_at, 0))
+        self.assertTrue(IAMEntity.objects.filter(cloud_account=account, arn_or_id='aaaaaaaa-0000').exists())
+
+    def test_save_upload_across_filesystems(self):
+        temporary = self.dir / 'upload.tmp'
+        temporary.write_bytes(b'[]')
+        upload = mock.Mock(temporary_file_path=lambda: str(temporary))
+        with override_settings(SNAPSHOT_INGESTION={'UPLOAD_DIR': str(self.dir / 'snapshots')}), \
+                mock.patch('os.rename', side_effect=OSError(errno.EXDEV, 'Invalid cross-device link')):
+            path = save_upload(upload, 1)
+        self.assertEqual(Path(path).read_bytes(), b'[]')
+        self.assertFalse(temporary.exists())
+
+
+class TargetTests(TestCase):
+    @override_settings(SYNC_PIPELINE={'SCAN_WORKERS': 0}, SYNC_TARGETS={'RATE': None})
+    def test_azure_principal_in_several_subscriptions(self):
+        account = _account('azure')
+        account.enumerate_targets = True
+        account.save()
+        org = FakeOrg(OrgSpec(principals=3, policies=4, policies_per_principal=2))
+        subscriptions = [SimpleNamespace(subscription_id=f"sub-{name}", display_name=name, state='Enabled') for name in 'ab']
+        listing = SimpleNamespace(subscriptions=SimpleNamespace(list=lambda: SimpleNamespace(by_page=lambda: iter([subscriptions]))))
+        clients = {'targets': listing, 'sub-a': FakeAuthorizationClient(org), 'sub-b': FakeAuthorizationClient(org)}
+
+        for _ in range(2):
+            sync_targets(account, clients)
+
+        # The same principals and role assignments in both subscriptions, kept apart and on their own target
+        entities = IAMEntity.objects.filter(cloud_account=account).select_related('target')
+        self.assertEqual(len(entities), 6)
+        for entity in entities:
+            self.assertEqual(entity.arn_or_id.split('/')[0], entity.target.target_id)
+        policies = IAMPolicy.objects.filter(cloud_account=account)
+        self.assertEqual(policies.count(), 2 * sum(len(attached) for attached in org.attachments))
+
+    @override_settings(SERVICE_ACCESS={'POLL_INITIAL': 0})
+    def test_service_access_per_member_account(self):
+        account = _account()
+        account.enumerate_targets = True
+        account.save()
+        org = FakeOrg(OrgSpec(principals=2))
+        clients = {}
+        for account_id in ('100000000000', '100000000001'):
+            target = CloudAccountTarget.objects.create(cloud_account=account, target_id=account_id)
+            clients[account_id] = FakeIAMClient(org, account_id)
+            for name in ('alice', 'bob'):
+                IAMEntity.objects.create(
+                    cloud_account=account, user=account.user, target=target, name=name, entity_type='user',
+                    arn_or_id=f"arn:aws:iam::{account_id}:user/{name}",
+                )
+
+        # IAM only knows the principals of its own account, so each member account is asked through its own client
+        with mock.patch('core.providers.aws.target_client', side_effect=lambda account, account_id: clients[account_id]) as target_client, \
+                mock.patch('core.providers.aws.client') as management_client:
+            analyze_service_access(account.id)
+        self.assertEqual(sorted(call.args[1] for call in target_client.call_args_list), sorted(clients))
+        management_client.assert_not_called()
+        self.assertEqual(
+            set(ServiceLastAccessed.objects.values_list('entity_id', flat=True)),
+            set(IAMEntity.objects.filter(cloud_account=account).values_list('id', flat=True)),
+        )
+
+
+
+class ServiceAccessTests(TestCase):
+    SERVICES = [{'ServiceNamespace': 's3', 'LastAuthenticated': None}]
+
+    def _iam(self, polls, failing=()):
+        """IAM whose job for each ARN answers its polls in order: a status, a (status, IsTruncated) page or an exception."""
+        def generate(Arn, Granularity):
+            if Arn in failing:
+                raise RuntimeError('Throttling')
+            return {'JobId': f"job:{Arn}"}
+
+        def get(JobId, Marker=None):
+            answer = polls[JobId.removeprefix('job:')].pop(0)
+            if isinstance(answer, Exception):
+                raise answer
+            status, truncated = answer if isinstance(answer, tuple) else (answer, False)
+            return {'JobStatus': status, 'ServicesLastAccessed': self.SERVICES, 'IsTruncated': truncated, 'Marker': 'next'}
+
+        return mock.Mock(**{'generate_service_last_accessed_details.side_effect': generate, 'get_service_last_accessed_details.side_effect': get})
+
+    def _collect(self, iam, arns, **config):
+        delays = []
+        return dict(collect(iam, arns, {**get_access_config(), 'POLL_INITIAL': 1, 'POLL_MAX': 3, **config}, sleep=delays.append)), delays
+
+    def test_backoff_while_nothing_finishes(self):
+        iam = self._iam({'a': ['IN_PROGRESS', 'IN_PROGRESS', 'IN_PROGRESS', 'COMPLETED'], 'b': ['COMPLETED']})
+        results, delays = self._collect(iam, ['a', 'b'])
+
+        self.assertEqual(results, {'a': self.SERVICES, 'b': self.SERVICES})
+        # Reset once 'b' finishes, then doubled up to POLL_MAX
+        self.assertEqual(delays, [1, 1, 2, 3])
+
+    def test_timeout(self):
+        iam = self._iam({'a': ['IN_PROGRESS'], 'b': []})
+        results, delays = self._collect(iam, ['a', 'b'], TIMEOUT=0, MAX_IN_FLIGHT=1)
+
+        # The job still running and the one never submitted are both given up on
+        self.assertEqual(results, {'a': None, 'b': None})
+        self.assertEqual(delays, [1])
+
+    def test_submit_failure(self):
+        iam = self._iam({'b': ['COMPLETED']}, failing={'a'})
+        with self.assertLogs('core.access', 'WARNING'):
+            results, _ = self._collect(iam, ['a', 'b'])
+        self.assertEqual(results, {'a': None, 'b': self.SERVICES})
+
+    def test_failed_page(self):
+        iam = self._iam({'a': [('COMPLETED', True), RuntimeError('Throttling')], 'b': [('COMPLETED', True), 'COMPLETED']})
+        with self.assertLogs('core.access', 'WARNING'):
+            results, _ = self._collect(iam, ['a', 'b'])
+        # A report with a missing page is no report
+        self.assertEqual(results, {'a': None, 'b': self.SERVICES * 2})
+
+
+def _forget_dictionaries():
+    """Drops this process's dictionaries and (this thread's) compressors, as a fresh worker would start."""
+    storage._dictionaries.clear()
+    storage._current[:] = [None, 0.0]
+    storage._local.__dict__.clear()
+
+
+@unittest.skipIf(storage.zstandard is None, 'zstandard is not installed')
+class StorageTests(TestCase):
+    def setUp(self):
+        _forget_dictionaries()
+        self.addCleanup(_forget_dictionaries)
+        rng = random.Random(1)
+        self.document = aws_policy_document(rng)
+
+    def test_round_trip(self):
+        small = {'Version': '2012-10-17'}
+        for mode in ('json', 'zstd'):
+            with self.subTest(mode), override_settings(DOCUMENT_STORAGE={'MODE': mode}):
+                stored = storage.encode(self.document)
+                self.assertEqual(stored[:4] == storage.ZSTD_MAGIC, mode == 'zstd')
+                self.assertEqual(storage.decode(stored), self.document)
+                # Values under MIN_SIZE are kept as JSON either way
+                self.assertEqual(storage.encode(small), b'{"Version":"2012-10-17"}')
+                self.assertEqual(storage.decode(storage.encode(small)), small)
+
+    def test_dictionary_round_trip(self):
+        plain = storage.encode(self.document)
+        rng = random.Random(2)
+        first = storage.train_dictionary([aws_policy_document(rng) for _ in range(500)])
+        stored = storage.encode(self.document)
+        self.assertEqual(storage.stored_dictionary(plain), 0)
+        self.assertEqual(storage.stored_dictionary(stored), first)
+        self.assertLess(len(stored), len(plain))
+
+        # Another process loads the dictionary from the database
+        _forget_dictionaries()
+        self.assertEqual(storage.decode(stored), self.document)
+
+        # Values written with an older dictionary stay readable
+        second = storage.train_dictionary([aws_policy_document(rng) for _ in range(500)])
+        self.assertNotEqual(second, first)
+        self.assertEqual(storage.stored_dictionary(storage.encode(self.document)), second)
+        self.assertEqual(storage.decode(stored), self.document)
+        self.assertEqual(storage.decode(plain), self.document)
+
+    def test_field_reads_lazily_and_writes_unread_values_as_stored(self):
+        stored = resolve_document(self.document, 'aws')
+        (raw,) = PolicyDocument.objects.filter(hash=stored.hash).values_list('document', flat=True)
+        self.assertIsInstance(raw, storage.Encoded)
+
+        document = PolicyDocument.objects.get(hash=stored.hash)
+        self.assertIsInstance(document.__dict__['document'], storage.Encoded)
+        with override_settings(DOCUMENT_STORAGE={'MODE': 'json'}):
+            document.save()
+        self.assertEqual(PolicyDocument.objects.filter(hash=stored.hash).values_list('document', flat=True).get(), raw)
+        self.assertEqual(PolicyDocument.objects.get(hash=stored.hash).document, self.document)
+
+    def test_json_contains(self):
+        document = _aws(_allow(['s3:GetObject', 's3:PutObject'], 'arn:aws:s3:::bucket/*'))
+        self.assertTrue(storage.json_contains(document, {'Statement': [{'Action': ['s3:PutObject']}]}))
+        self.assertTrue(storage.json_contains(['a', 'b'], 'a'))
+        self.assertFalse(storage.json_contains(document, {'Statement': [{'Effect': 'Deny'}]}))
+        self.assertFalse(storage.json_contains({'Enabled': 1}, {'Enabled': True}))
+
+    def test_contains(self):
+        account = _account()
+        policy = _policy(_entity(account, 'alice'), 'inline-1', _aws(_allow('s3:GetObject', 'arn:aws:s3:::bucket/*')))
+        _policy(_entity(account, 'bob'), 'inline-1', _aws(_allow('s3:GetObject')))
+        client = APIClient()
+        client.force_authenticate(account.user)
+        contains = json.dumps({'Statement': [{'Resource': 'arn:aws:s3:::bucket/*'}]})
+
+        # On its own or with a statement filter
+        for query in ({'contains': contains}, {'contains': contains, 'action': 's3:GetObject'}):
+            response = client.get('/api/policies/search/', query)
+            self.assertEqual([result['id'] for result in response.json()['results']], [policy.id])
+        self.assertEqual(client.get('/api/policies/search/', {'contains': '{'}).status_code, 400)
+
+
+
+class CredentialCacheTests(TestCase):
+    def setUp(self):
+        credentials.invalidate()
+
+    def _account(self, email):
+        account = _account(email=email)
+        account.access_key, account.secret_key, account.extra_config = 'AKIAEXAMPLE', 'secret', {'region': 'eu-west-1'}
+        account.save()
+        return account
+
+    def test_callers_keep_their_copy_when_the_entry_is_dropped(self):
+        account = self._account('a@example.com')
+        held = credentials.get_credentials(account)
+        other = credentials.get_credentials(account)
+        self.assertIsNot(held._secret_key, other._secret_key)
+
+        # Another thread invalidating (or the entry expiring) zeroizes only the cache's own entry
+        credentials.invalidate(account.pk)
+        self.assertEqual((held.access_key, held.secret_key, held.extra_config), ('AKIAEXAMPLE', 'secret', {'region': 'eu-west-1'}))
+
+    @override_settings(CREDENTIAL_CACHE={'MAX_ENTRIES': 1})
+    def test_eviction_leaves_callers_copy_intact(self):
+        first, second = self._account('a@example.com'), self._account('b@example.com')
+        held = credentials.get_credentials(first)
+        credentials.get_credentials(second)
+        self.assertNotIn(first.pk, credentials._cache)
+        self.assertEqual(held.secret_key, 'secret')
+
+
+@unittest.skipIf(renderers.orjson is None, 'orjson is not installed')
+class RendererTests(TestCase):
+    def test_same_output_as_drf(self):
+        now = timezone.now()
+        data = {
+            'aware': now, 'naive': datetime.datetime(2026, 1, 2, 3, 4, 5, 678901), 'date': now.date(), 'time': datetime.time(3, 4, 5),
+            'delta': timedelta(seconds=90), 'decimal': decimal.Decimal('1.50'), 'uuid': uuid.UUID(int=1),
+            'nested': [{'at': now, 'document': _aws(_allow('s3:GetObject'))}],
+        }
+        self.assertEqual(renderers.FastJSONRenderer().render(data), JSONRenderer().render(data))
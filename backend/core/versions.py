@@ -0,0 +1,124 @@
+"""
+Policy version history.
+
+Whenever a policy's document changes (sync or the policy editor) a new
+IAMPolicyVersion is appended. A version stores a structural diff against
+the one before it: the ordered statement hashes of the new document, the
+bodies of statements the previous version didn't have, and the hashes it
+dropped. The first version and every SNAPSHOT_EVERY-th one after it also
+hold a snapshot of every statement body, so rebuilding a document replays
+at most that many versions.
+
+The scanner result per statement lives on the PolicyDocument (see
+core/documents.py), so rescanning a changed policy only evaluates the
+statements that were added or modified.
+"""
+from .models import IAMPolicyVersion
+from .scanner import statement_hash
+
+SNAPSHOT_EVERY = 10
+
+# Where each platform keeps its list of independent statements
+STATEMENT_KEYS = {
+    'aws': 'Statement',
+    'azure': 'actions',
+}
+
+
+def split_document(document, platform):
+    """Returns (statement_key, statements, fields). Documents without a statement list are a single statement."""
+    key = STATEMENT_KEYS.get(platform)
+    if key and isinstance(document, dict) and isinstance(document.get(key), list):
+        return key, document[key], {k: v for k, v in document.items() if k != key}
+    return '', [document], None
+
+
+def join_document(statement_key, statements, fields):
+    if not statement_key:
+        return statements[0] if statements else None
+    return {**(fields or {}), statement_key: statements}
+
+
+def latest_version(policy_id):
+    return IAMPolicyVersion.objects.filter(policy_id=policy_id).order_by('-version').first()
+
+
+def _build_version(policy, number, document, platform, prior, **extra):
+    key, statements, fields = split_document(document, platform)
+    hashes = [statement_hash(stmt) for stmt in statements]
+    is_snapshot = prior is None or (number - 1) % SNAPSHOT_EVERY == 0 or prior.statement_key != key
+
+    prior_hashes = set(prior.statement_hashes) if prior else set()
+    current = set(hashes)
+    return IAMPolicyVersion(
+        policy=policy,
+        version=number,
+        statement_key=key,
+        fields=fields,
+        statement_hashes=hashes,
+        added={h: stmt for h, stmt in zip(hashes, statements) if h not in prior_hashes},
+        removed=[h for h in (prior.statement_hashes if prior else []) if h not in current],
+        snapshot=dict(zip(hashes, statements)) if is_snapshot else None,
+        **extra
+    )
+
+
+def record_version(policy, document, platform, risk_score, finding_details, source, latest, previous=None):
+    """
+    Appends a version for `document` after `latest` (the current newest
+    version, or None). When the policy has no history yet but had a
+    `previous` document (dict with document/risk_score/finding_details),
+    that one is stored first so it isn't lost.
+    """
+    created = []
+    if latest is None and previous is not None:
+        latest = _build_version(
+            policy, 1, previous['document'], platform, None,
+            source=source, risk_score=previous['risk_score'], finding_details=previous['finding_details'],
+        )
+        created.append(latest)
+
+    number = latest.version + 1 if latest else 1
+    created.append(_build_version(
+        policy, number, document, platform, latest,
+        source=source, risk_score=risk_score, finding_details=finding_details,
+    ))
+    IAMPolicyVersion.objects.bulk_create(created)
+    return created[-1]
+
+
+def _statements_at(version):
+    """(statements, fields) of a version, rebuilt from the nearest snapshot at or before it."""
+    chain = IAMPolicyVersion.objects.filter(policy_id=version.policy_id, version__lte=version.version)
+    start = chain.exclude(snapshot=None).order_by('-version').values_list('version', flat=True).first() or 1
+    bodies = {}
+    for snapshot, added in chain.filter(version__gte=start).order_by('version').values_list('snapshot', 'added'):
+        bodies.update(snapshot or {})
+        bodies.update(added)
+    return [bodies[h] for h in version.statement_hashes], version.fields or {}
+
+
+def document_at(version):
+    statements, fields = _statements_at(version)
+    return join_document(version.statement_key, statements, fields)
+
+
+def diff_versions(old, new):
+    """Statement-level diff between two versions of the same policy."""
+    old_statements, old_fields = _statements_at(old)
+    new_statements, new_fields = _statements_at(new)
+    old_by_hash = dict(zip(old.statement_hashes, old_statements))
+    new_by_hash = dict(zip(new.statement_hashes, new_statements))
+
+    return {
+        'from': old.version,
+        'to': new.version,
+        'added': [stmt for h, stmt in new_by_hash.items() if h not in old_by_hash],
+        'removed': [stmt for h, stmt in old_by_hash.items() if h not in new_by_hash],
+        'unchanged': sum(1 for h in new_by_hash if h in old_by_hash),
+        'fields_changed': {
+            k: [old_fields.get(k), new_fields.get(k)]
+            for k in sorted(set(old_fields) | set(new_fields)) if old_fields.get(k) != new_fields.get(k)
+        },
+        'risk_score': [old.risk_score, new.risk_score],
+    }
@@ -1,24 +1,45 @@
-import random
+import hmac
+import json
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count
+from django.http import HttpResponse
+from django.utils import timezone
 from django.shortcuts import render
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from .models import CloudAccount, IAMEntity, IAMPolicy
-from .tasks import sync_cloud_iam
+from .models import CloudAccount, CloudAccountTarget, IAMEntity, IAMPolicy, PolicyDocument, SyncRun, EffectivePermissionSet, EscalationPath, IAMPolicyVersion
+from celery.result import AsyncResult
+from rest_framework.reverse import reverse
+from .tasks import StillRunning, apply_policy_edit, dispatch_sync, push_policy, remove_policy, wait_interactive
+from .scheduler import sync_kinds
 from rest_framework import generics, permissions
 from django.contrib.auth import get_user_model
 from rest_framework.response import Response
 from rest_framework_simplejwt.tokens import RefreshToken
-from .serializers import CloudAccountSerializer, UserSerializer, IAMPolicySerializer
-from .scanner import SecurityScanner
-from .utils import set_policy_in_cloud, delete_policy_in_cloud
+from .serializers import CloudAccountSerializer, CloudAccountTargetSerializer, UserSerializer, IAMPolicySerializer, SyncRunSerializer, EffectivePermissionSetSerializer, EscalationPathSerializer, IAMPolicyVersionSerializer
+from .metrics import render_prometheus
+from .effective import who_can
+from .versions import diff_versions
+from .search import documents_containing, search_statements
+from .history import trend
+from .access import unused_services
+from .replicas import ReplicaReadMixin, replica_reads
+from .credentials import without_credentials
+from .snapshots import PLATFORMS as SNAPSHOT_PLATFORMS, save_upload
+
+TASK_OWNER_TTL = 24 * 3600  # Who asked for a 202 cloud write is kept as long as Celery keeps its result (result_expires)
 
 class CloudAccountViewSet(viewsets.ModelViewSet):
     serializer_class = CloudAccountSerializer
 
     def get_queryset(self):
-        # Security: Users should only see their own cloud accounts
-        return CloudAccount.objects.filter(user=self.request.user)
+        # Security: Users should only see their own cloud accounts.
+        # Credentials are write-only, so they are never loaded (or decrypted) here.
+        return without_credentials(CloudAccount.objects.filter(user=self.request.user))
 
     def perform_create(self, serializer):
         # Automatically link the account to the logged-in user
@@ -29,14 +50,65 @@ class CloudAccountViewSet(viewsets.ModelViewSet):
         """Custom endpoint to start a background scan: /api/accounts/{id}/trigger_sync/"""
         account = self.get_object()
         
-        # Trigger the Celery task (using .delay() so it doesn't block)
-        task = sync_cloud_iam.delay(account.id)
+        # Trigger the Celery task (async so it doesn't block), on the provider's incremental or full queue
+        task = dispatch_sync(account.id, account.platform, sync_kinds([account.id])[account.id])
         
         return Response({
             "status": "Sync started",
             "task_id": task.id
         }, status=status.HTTP_202_ACCEPTED)
 
+    @action(detail=True, methods=['post'])
+    def snapshot(self, request, pk=None):
+        """
+        Syncs an air-gapped account from an exported dump: /api/accounts/{id}/snapshot/
+        Multipart `file` (and for Azure optionally `definitions`); see core/snapshots.py for the formats.
+        """
+        account = self.get_object()
+        if account.platform not in SNAPSHOT_PLATFORMS:
+            return Response({"error": f"Snapshots are supported for {', '.join(SNAPSHOT_PLATFORMS)}"}, status=status.HTTP_400_BAD_REQUEST)
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({"error": "file is required"}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Stored where the sync workers can read it; the task deletes it when done
+        snapshot = {'path': save_upload(upload, account.id), 'remove': True}
+        if 'definitions' in request.FILES:
+            snapshot['definitions'] = save_upload(request.FILES['definitions'], account.id)
+        task = dispatch_sync(account.id, account.platform, 'full', snapshot=snapshot)
+
+        return Response({
+            "status": "Snapshot ingestion started",
+            "task_id": task.id
+        }, status=status.HTTP_202_ACCEPTED)
+
+    @action(detail=True, methods=['get', 'patch'])
+    def targets(self, request, pk=None):
+        """
+        Member accounts / subscriptions / projects of an account that enumerates targets: /api/accounts/{id}/targets/
+        PATCH {"target_ids": [...], "is_active": false} leaves them out of later syncs (or brings them back).
+        """
+        account = self.get_object()
+        targets = CloudAccountTarget.objects.filter(cloud_account=account)
+        if request.method == 'PATCH':
+            target_ids, is_active = request.data.get('target_ids'), request.data.get('is_active')
+            if not isinstance(target_ids, list) or not isinstance(is_active, bool):
+                return Response({"error": "target_ids (a list) and is_active (a boolean) are required"}, status=status.HTTP_400_BAD_REQUEST)
+            targets.filter(target_id__in=[str(target_id) for target_id in target_ids]).update(is_active=is_active)
+        return Response(CloudAccountTargetSerializer(targets, many=True).data)
+
+    @action(detail=True, methods=['get'])
+    def sync_runs(self, request, pk=None):
+        """Recent sync runs with timings and counters: /api/accounts/{id}/sync_runs/?limit=20"""
+        account = self.get_object()
+        try:
+            limit = min(int(request.query_params.get('limit', 20)), 200)
+        except ValueError:
+            return Response({"error": "limit must be an integer"}, status=status.HTTP_400_BAD_REQUEST)
+
+        runs = SyncRun.objects.filter(cloud_account=account)[:limit]
+        return Response(SyncRunSerializer(runs, many=True).data)
+
 class IAMEntityViewSet(viewsets.ReadOnlyModelViewSet):
     """View to list users/roles found in the cloud"""
     # ... logic to filter by cloud_account
@@ -67,17 +139,19 @@ class RegisterView(generics.CreateAPIView):
     
 
 
-class IAMPolicyViewSet(viewsets.ModelViewSet):
+class IAMPolicyViewSet(ReplicaReadMixin, viewsets.ModelViewSet):
     serializer_class = IAMPolicySerializer
     permission_classes = [permissions.AllowAny]
+    replica_actions = ('list', 'retrieve', 'versions', 'diff', 'search')
 
     def get_queryset(self):
-        # 2. TEMPORARY: Return all policies so you can see your seed data
-        # In production, swap this back to the self.request.user filter
-        return IAMPolicy.objects.all()
-
-    # def get_queryset(self):
-    #     return IAMPolicy.objects.filter(entity__cloud_account__user=self.request.user)
+        # select_related: the serializer reads entity.name and entity.cloud_account.platform per row
+        policies = without_credentials(IAMPolicy.objects.select_related('entity__cloud_account', 'policy_document'), 'entity__cloud_account')
+        # Signed-in users see their own policies (IAMPolicy.user is denormalized, so no join).
+        # Anonymous requests still see everything so the seed data shows up in development.
+        if self.request.user.is_authenticated:
+            policies = policies.filter(user=self.request.user)
+        return policies
 
 
     def update(self, request, *args, **kwargs):
@@ -89,37 +163,38 @@ class IAMPolicyViewSet(viewsets.ModelViewSet):
         if not new_doc:
             return Response({"error": "No document provided"}, status=status.HTTP_400_BAD_REQUEST)
 
+        # IMPORTANT: We pass the full request.data to the serializer, and validate it before writing to the cloud
+        serializer = self.get_serializer(instance, data=request.data, partial=True)
+        serializer.is_valid(raise_exception=True)
+
         # 1. DEVELOPMENT BYPASS: 
         # We simulate cloud success for our seeded dummy policies.
-        # In production, you would use: if set_policy_in_cloud(instance, new_doc):
+        # In production, you would use: if wait_interactive(push_policy, instance.id, new_doc):
         is_dev_seed = instance.entity.cloud_account.name.startswith("Production")
 
-        if is_dev_seed or set_policy_in_cloud(instance, new_doc):
+        try:
+            # The cloud write runs on the interactive queue, so syncs can't hold it up.
+            # Once accepted, push_policy re-scans the document and stores it locally.
+            accepted = is_dev_seed or wait_interactive(push_policy, instance.id, new_doc)
+        except StillRunning as pending:
+            # push_policy stores the document once the cloud accepts it; the other edited fields are kept now.
+            # update_fields, so a push_policy that finishes first doesn't get its document overwritten.
+            fields = {field: value for field, value in serializer.validated_data.items() if field != 'policy_document'}
+            if fields:
+                for field, value in fields.items():
+                    setattr(instance, field, value)
+                instance.save(update_fields=[*fields, 'updated_at'])
+            return self._still_running(request, pending.task_id, instance)
+
+        if accepted:
             try:
-                # 2. Re-scan logic
-                # If your SecurityScanner is crashing, we wrap it in a try/except
-                try:
-                    scanner = SecurityScanner(new_doc)
-                    platform = instance.entity.cloud_account.platform
-
-                    if platform == 'aws': score, findings = scanner.scan_aws()
-                    elif platform == 'azure': score, findings = scanner.scan_azure()
-                    else: score, findings = 0, []
-                except Exception as scanner_error:
-                    # Fallback so the save doesn't fail if the scanner has a bug
-                    print(f"Scanner Error: {scanner_error}")
-                    score, findings = random.randint(10, 90), ["Scan failed, using default assessment"]
-
-                # 3. Save to local Database
-                # IMPORTANT: We pass the full request.data to the serializer
-                serializer = self.get_serializer(instance, data=request.data, partial=True)
-                serializer.is_valid(raise_exception=True)
-
-                serializer.save(
-                    risk_score=score,
-                    finding_details={"issues": findings},
-                    is_vulnerable=score > 50
-                )
+                # 2. Re-scan and store (done by push_policy outside the bypass)
+                if is_dev_seed:
+                    apply_policy_edit(instance, new_doc)
+
+                # 3. Save the other edited fields to the local Database
+                instance.refresh_from_db()
+                serializer.save(policy_document=instance.policy_document)
                 return Response(serializer.data)
 
             except Exception as e:
@@ -130,7 +205,316 @@ class IAMPolicyViewSet(viewsets.ModelViewSet):
 
     def destroy(self, request, *args, **kwargs):
         instance = self.get_object()
-        if delete_policy_in_cloud(instance):
-            self.perform_destroy(instance)
+        try:
+            # remove_policy also deletes the local copy once the cloud has
+            deleted = wait_interactive(remove_policy, instance.id)
+        except StillRunning as pending:
+            return self._still_running(request, pending.task_id, instance)
+        if deleted:
             return Response(status=status.HTTP_204_NO_CONTENT)
-        return Response({"error": "Failed to delete from cloud"}, status=status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+        return Response({"error": "Failed to delete from cloud"}, status=status.HTTP_400_BAD_REQUEST)
+
+    def _still_running(self, request, task_id, policy):
+        """202 for a cloud write that outlived INTERACTIVE_WAIT; the client polls `status_url`."""
+        # Only whoever asked for the write can poll it (see `task`)
+        cache.set(f"policy-task:{task_id}", (request.user.pk, policy.id), TASK_OWNER_TTL)
+        return Response({
+            "task_id": task_id,
+            "status_url": reverse('iampolicy-task', args=[task_id], request=request),
+            "detail": "The cloud provider is still applying the change",
+        }, status=status.HTTP_202_ACCEPTED)
+
+    @action(detail=False, methods=['get'], url_path=r'tasks/(?P<task_id>[0-9a-f-]+)')
+    def task(self, request, task_id=None):
+        """State of a cloud write answered with 202: /api/policies/tasks/{task_id}/"""
+        owner = cache.get(f"policy-task:{task_id}")
+        if owner is None or owner[0] != request.user.pk:
+            return Response({"error": "Unknown task"}, status=status.HTTP_404_NOT_FOUND)
+        result = AsyncResult(task_id)
+        data = {'task_id': task_id, 'state': result.state}
+        if result.ready():
+            # False when the cloud provider rejected the write (or the task failed)
+            data['accepted'] = result.successful() and bool(result.result)
+        return Response(data)
+
+    @action(detail=True, methods=['get'])
+    def versions(self, request, pk=None):
+        """Version history of one policy, newest first: /api/policies/{id}/versions/"""
+        policy = self.get_object()
+        return Response(IAMPolicyVersionSerializer(policy.versions.defer('snapshot'), many=True).data)
+
+    @action(detail=True, methods=['get'])
+    def diff(self, request, pk=None):
+        """Statement-level diff: /api/policies/{id}/diff/?from=2&to=5 (defaults to the latest change)"""
+        policy = self.get_object()
+        versions = policy.versions.all()
+        latest = versions.first()
+        if latest is None:
+            return Response({"error": "This policy has no version history yet"}, status=status.HTTP_404_NOT_FOUND)
+        try:
+            to_number = int(request.query_params.get('to', latest.version))
+            from_number = int(request.query_params.get('from', to_number - 1))
+            new = versions.get(version=to_number)
+            old = versions.get(version=from_number)
+        except ValueError:
+            return Response({"error": "from and to must be version numbers"}, status=status.HTTP_400_BAD_REQUEST)
+        except IAMPolicyVersion.DoesNotExist:
+            return Response({"error": "Unknown version"}, status=status.HTTP_404_NOT_FOUND)
+        return Response(diff_versions(old, new))
+
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """
+        Policies by statement content (core/search.py):
+        /api/policies/search/?action=iam:PassRole&resource=*&effect=allow&condition_key=aws:SourceIp&account=3
+        `contains` takes a JSON fragment the document must contain, like jsonb's @>.
+        """
+        started = time.perf_counter()
+        filters = {key: request.query_params.get(key) for key in ('action', 'resource', 'effect', 'condition_key')}
+        contains = request.query_params.get('contains')
+        if not any(filters.values()) and not contains:
+            return Response({"error": "Give at least one of action, resource, effect, condition_key or contains"}, status=status.HTTP_400_BAD_REQUEST)
+        if filters['effect'] and filters['effect'].lower() not in ('allow', 'deny'):
+            return Response({"error": "effect must be allow or deny"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = min(int(request.query_params.get('limit', 100)), 1000)
+            offset = max(int(request.query_params.get('offset', 0)), 0)
+        except ValueError:
+            return Response({"error": "limit and offset must be integers"}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Only the document hash is returned, so don't load the documents themselves
+        policies = self.get_queryset().select_related(None).select_related('entity__cloud_account')
+        account = request.query_params.get('account')
+        if account and account.isdigit():
+            policies = policies.filter(cloud_account_id=account)
+
+        statements = None
+        if any(filters.values()):
+            statements = search_statements(**filters)
+            policies = policies.filter(policy_document__in=statements.values('document_id'))
+        if contains:
+            try:
+                pattern = json.loads(contains)
+            except ValueError:
+                return Response({"error": "contains must be JSON"}, status=status.HTTP_400_BAD_REQUEST)
+            # Matched against DocumentContent, not the compressed documents (core/search.py)
+            candidates = PolicyDocument.objects.filter(hash__in=policies.values('policy_document_id'))
+            policies = policies.filter(policy_document__in=documents_containing(pattern, candidates))
+
+        policies = policies.order_by('-risk_score', 'id')
+        page = list(policies[offset:offset + limit])
+
+        # The statements that matched, so the caller can see why each policy is in the results
+        matches = {}
+        if statements is not None and page:
+            rows = statements.filter(document_id__in={p.policy_document_id for p in page}).order_by('statement_index', 'id')
+            for row in rows.values('document_id', 'statement_index', 'effect', 'action', 'resource', 'condition_key'):
+                matches.setdefault(row.pop('document_id'), []).append(row)
+
+        return Response({
+            "count": policies.count(),
+            "results": [{
+                "id": p.id,
+                "name": p.name,
+                "policy_type": p.policy_type,
+                "entity_id": p.entity_id,
+                "entity_name": p.entity.name,
+                "account_id": p.cloud_account_id,
+                "platform": p.entity.cloud_account.platform,
+                "risk_score": p.risk_score,
+                "is_vulnerable": p.is_vulnerable,
+                "document_hash": p.policy_document_id,
+                "matches": matches.get(p.policy_document_id, []),
+            } for p in page],
+            "took_ms": round((time.perf_counter() - started) * 1000, 1),
+        })
+
+
+
+def _account_scope(request):
+    """Cloud account ids the caller may query, or None for everything (anonymous dev mode, like IAMPolicyViewSet)."""
+    if not request.user.is_authenticated:
+        return None
+    return list(CloudAccount.objects.filter(user=request.user).values_list('id', flat=True))
+
+
+class EffectivePermissionViewSet(ReplicaReadMixin, viewsets.ViewSet):
+    """Effective (combined, deny-aware) permissions backed by the precomputed index in core/effective.py"""
+    permission_classes = [permissions.AllowAny]
+    replica_actions = ('retrieve', 'who_can')
+
+    def retrieve(self, request, pk=None):
+        """One entity's effective permissions: /api/permissions/{entity_id}/"""
+        scope = _account_scope(request)
+        sets = EffectivePermissionSet.objects.select_related('entity')
+        if scope is not None:
+            sets = sets.filter(entity__cloud_account_id__in=scope)
+        try:
+            permission_set = sets.get(entity_id=pk)
+        except (EffectivePermissionSet.DoesNotExist, ValueError):
+            return Response({"error": "No effective permissions computed for this entity"}, status=status.HTTP_404_NOT_FOUND)
+        return Response(EffectivePermissionSetSerializer(permission_set).data)
+
+    @action(detail=False, methods=['get'])
+    def who_can(self, request):
+        """Which principals can do X on Y: /api/permissions/who_can/?action=s3:DeleteBucket&resource=*"""
+        started = time.perf_counter()
+        action_name = request.query_params.get('action')
+        if not action_name:
+            return Response({"error": "The 'action' parameter is required"}, status=status.HTTP_400_BAD_REQUEST)
+        resource = request.query_params.get('resource', '*')
+        include_conditional = request.query_params.get('include_conditional', 'true').lower() != 'false'
+        try:
+            limit = min(int(request.query_params.get('limit', 100)), 1000)
+            offset = max(int(request.query_params.get('offset', 0)), 0)
+        except ValueError:
+            return Response({"error": "limit and offset must be integers"}, status=status.HTTP_400_BAD_REQUEST)
+
+        matches = who_can(action_name, resource, _account_scope(request), include_conditional)
+        page_ids = sorted(matches)[offset:offset + limit]
+        entities = IAMEntity.objects.filter(id__in=page_ids).select_related('cloud_account').order_by('id')
+
+        return Response({
+            "action": action_name,
+            "resource": resource,
+            "count": len(matches),
+            "results": [{
+                "id": e.id,
+                "name": e.name,
+                "arn_or_id": e.arn_or_id,
+                "entity_type": e.entity_type,
+                "account_id": e.cloud_account_id,
+                "platform": e.cloud_account.platform,
+                "conditional": matches[e.id],
+            } for e in entities],
+            "took_ms": round((time.perf_counter() - started) * 1000, 1),
+        })
+
+
+class EscalationPathViewSet(ReplicaReadMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    Cached privilege-escalation paths (core/escalation.py).
+    /api/escalation/?account=3&max_hops=2 lists who can reach admin, closest first;
+    /api/escalation/{entity_id}/ is the shortest path for one entity.
+    """
+    serializer_class = EscalationPathSerializer
+    permission_classes = [permissions.AllowAny]
+
+    def get_queryset(self):
+        paths = EscalationPath.objects.select_related('entity').order_by('hops', 'entity_id')
+        scope = _account_scope(self.request)
+        if scope is not None:
+            paths = paths.filter(cloud_account_id__in=scope)
+        account = self.request.query_params.get('account')
+        if account and account.isdigit():
+            paths = paths.filter(cloud_account_id=account)
+        max_hops = self.request.query_params.get('max_hops')
+        if max_hops and max_hops.isdigit():
+            paths = paths.filter(hops__lte=max_hops)
+        return paths
+
+    def list(self, request, *args, **kwargs):
+        try:
+            limit = min(int(request.query_params.get('limit', 100)), 1000)
+            offset = max(int(request.query_params.get('offset', 0)), 0)
+        except ValueError:
+            return Response({"error": "limit and offset must be integers"}, status=status.HTTP_400_BAD_REQUEST)
+        paths = self.get_queryset()
+        return Response({
+            "count": paths.count(),
+            "results": self.get_serializer(paths[offset:offset + limit], many=True).data,
+        })
+
+    def retrieve(self, request, pk=None):
+        try:
+            path = self.get_queryset().get(entity_id=pk)
+        except (EscalationPath.DoesNotExist, ValueError):
+            return Response({"error": "No escalation path to admin for this entity"}, status=status.HTTP_404_NOT_FOUND)
+        return Response(self.get_serializer(path).data)
+
+
+class FindingTrendViewSet(ReplicaReadMixin, viewsets.ViewSet):
+    """
+    Risk over time from the pre-aggregated rollups (core/history.py):
+    /api/trends/?period=week&days=180&account=3&platform=aws&severity=critical
+    """
+    permission_classes = [permissions.AllowAny]
+
+    def list(self, request):
+        period = request.query_params.get('period', 'day')
+        if period not in ('day', 'week'):
+            return Response({"error": "period must be day or week"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            days = min(int(request.query_params.get('days', 90)), 800)
+        except ValueError:
+            return Response({"error": "days must be an integer"}, status=status.HTTP_400_BAD_REQUEST)
+
+        scope = _account_scope(request)
+        account = request.query_params.get('account')
+        if account and account.isdigit():
+            scope = [int(account)] if scope is None or int(account) in scope else []
+
+        since = timezone.localdate() - timedelta(days=days)
+        return Response({
+            "period": period,
+            "since": since,
+            "results": list(trend(period, since, scope, request.query_params.get('platform'), request.query_params.get('severity'))),
+        })
+
+
+class UnusedPermissionViewSet(ReplicaReadMixin, viewsets.ViewSet):
+    """
+    Principals with granted but unused AWS services (core/access.py), most unused first:
+    /api/unused/?days=90&account=3
+    """
+    permission_classes = [permissions.AllowAny]
+
+    def list(self, request):
+        try:
+            days = int(request.query_params.get('days', 90))
+            limit = min(int(request.query_params.get('limit', 100)), 1000)
+            offset = max(int(request.query_params.get('offset', 0)), 0)
+        except ValueError:
+            return Response({"error": "days, limit and offset must be integers"}, status=status.HTTP_400_BAD_REQUEST)
+
+        scope = _account_scope(request)
+        account = request.query_params.get('account')
+        if account and account.isdigit():
+            scope = [int(account)] if scope is None or int(account) in scope else []
+
+        rows = unused_services(days, scope)
+        per_entity = rows.values('entity_id').annotate(unused=Count('id')).order_by('-unused', 'entity_id')
+        page = list(per_entity[offset:offset + limit])
+        entities = IAMEntity.objects.in_bulk([row['entity_id'] for row in page])
+
+        services = {}
+        for row in rows.filter(entity_id__in=list(entities)).order_by('service_namespace').values('entity_id', 'service_namespace', 'last_authenticated'):
+            services.setdefault(row.pop('entity_id'), []).append(row)
+
+        return Response({
+            "days": days,
+            "count": per_entity.count(),
+            "results": [{
+                "id": row['entity_id'],
+                "name": entities[row['entity_id']].name,
+                "arn_or_id": entities[row['entity_id']].arn_or_id,
+                "entity_type": entities[row['entity_id']].entity_type,
+                "account_id": entities[row['entity_id']].cloud_account_id,
+                "last_used": entities[row['entity_id']].last_used,
+                "unused": row['unused'],
+                "services": services.get(row['entity_id'], []),
+            } for row in page],
+        })
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint for sync metrics: /metrics, for staff or with the METRICS_TOKEN bearer token"""
+    token = settings.METRICS_TOKEN
+    supplied = request.headers.get('Authorization', '').encode()
+    if not (request.user.is_staff or token and hmac.compare_digest(supplied, f"Bearer {token}".encode())):
+        response = HttpResponse(status=401)
+        response['WWW-Authenticate'] = 'Bearer'
+        return response
+    with replica_reads():
+        body = render_prometheus()
+    return HttpResponse(body, content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,118 @@
+"""
+Celery workload classes.
+
+Tasks are split into workloads, each with its own queues, so that a long
+full sync of one account can't hold up another tenant's policy edit:
+
+- interactive: cloud writes from the policy editor; the API waits a few
+  seconds for them, then answers 202 and the client polls the task
+- sync-incremental / sync-full: account syncs, with one queue per provider
+  for each (sync.<platform>.incremental, sync.<platform>.full). A sync is
+  full when the account has no successful sync yet or its last one ran
+  longer than LONG_SYNC_SECONDS (see `core.scheduler.sync_kinds`)
+- rescan: documents stored by an older scanner version
+- analytics: service-access analysis, findings-history maintenance and
+  escalation-path updates after a policy edit
+- default: the beat dispatcher and anything not routed
+
+`route_task` (CELERY_TASK_ROUTES) sends each task to its workload's queue
+and `WorkloadAnnotations` (CELERY_TASK_ANNOTATIONS) gives it the workload's
+time limits and acks_late. Concurrency and prefetch are worker options, so
+a worker is started for one workload:
+
+    CELERY_WORKER_PROFILE=sync-full celery -A iam_backend worker
+
+It consumes only that workload's queues, with the workload's concurrency
+and prefetch. Command-line options still win, e.g. `-Q sync.aws.full` for a
+worker that only loads the AWS SDK.
+
+Celery loads this module for routing, so it doesn't import models.
+"""
+from django.conf import settings
+
+from .providers import PROVIDERS
+
+DEFAULTS = {
+    'INTERACTIVE_WAIT': 5,          # Seconds the API waits for a cloud write before answering 202
+    'INTERACTIVE_EXPIRES': 300,     # A cloud write no worker has started by then is dropped
+    'LONG_SYNC_SECONDS': 300,       # A last successful sync longer than this goes to the full-sync queue
+    'WORKLOADS': {
+        # Short tasks: prefetching a few is fine; don't repeat cloud writes after a worker crash
+        'interactive': {'concurrency': 8, 'prefetch_multiplier': 4, 'acks_late': False, 'soft_time_limit': 25, 'time_limit': 30},
+        # Long tasks: reserve one at a time and only acknowledge once done, so a lost worker's sync is redelivered
+        'sync-incremental': {'concurrency': 8, 'prefetch_multiplier': 1, 'acks_late': True, 'soft_time_limit': 840, 'time_limit': 900},
+        'sync-full': {'concurrency': 2, 'prefetch_multiplier': 1, 'acks_late': True, 'soft_time_limit': 5100, 'time_limit': 5400},
+        'rescan': {'concurrency': 2, 'prefetch_multiplier': 1, 'acks_late': True, 'soft_time_limit': 1700, 'time_limit': 1800},
+        'analytics': {'concurrency': 2, 'prefetch_multiplier': 1, 'acks_late': True, 'soft_time_limit': 3300, 'time_limit': 3600},
+        'default': {'concurrency': 2, 'prefetch_multiplier': 4, 'acks_late': False, 'soft_time_limit': 240, 'time_limit': 300},
+    },
+}
+
+# Workload of each task. Syncs are dispatched with an explicit queue by
+# `core.tasks.dispatch_sync`; the entry here only supplies their time limits.
+TASK_WORKLOADS = {
+    'core.tasks.push_policy': 'interactive',
+    'core.tasks.remove_policy': 'interactive',
+    'core.tasks.sync_cloud_iam': 'sync-full',
+    'core.tasks.rescan_documents': 'rescan',
+    'core.tasks.analyze_service_access': 'analytics',
+    'core.tasks.maintain_findings_history': 'analytics',
+    'core.tasks.refresh_escalation': 'analytics',
+}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'TASK_WORKLOADS', {})}
+
+
+def workload(name, config=None):
+    """Settings of one workload, with overrides from settings.TASK_WORKLOADS['WORKLOADS'] applied."""
+    config = config or get_config()
+    return {**DEFAULTS['WORKLOADS'][name], **config['WORKLOADS'].get(name, {})}
+
+
+def sync_queue(platform, kind='incremental'):
+    return f"sync.{platform}.{kind}"
+
+
+def workload_queues(name):
+    if name.startswith('sync-'):
+        return [sync_queue(platform, name[len('sync-'):]) for platform in PROVIDERS]
+    if name == 'default':
+        return [getattr(settings, 'CELERY_TASK_DEFAULT_QUEUE', 'celery')]
+    return [name]
+
+
+def time_limits(name, config=None):
+    """apply_async options that put a single call under a workload's time limits."""
+    spec = workload(name, config)
+    return {'soft_time_limit': spec['soft_time_limit'], 'time_limit': spec['time_limit']}
+
+
+def route_task(name, args, kwargs, options, task=None, **kw):
+    """CELERY_TASK_ROUTES entry: a queue given to apply_async wins over this."""
+    name = TASK_WORKLOADS.get(name)
+    if name is None or name.startswith('sync-'):
+        return None
+    return {'queue': workload_queues(name)[0]}
+
+
+class WorkloadAnnotations:
+    """CELERY_TASK_ANNOTATIONS entry: each task gets its workload's time limits and acks_late."""
+
+    def annotate(self, task):
+        name = TASK_WORKLOADS.get(task.name)
+        if name is None:
+            return None
+        spec = workload(name)
+        return {key: spec[key] for key in ('acks_late', 'soft_time_limit', 'time_limit')}
+
+
+def configure_worker(conf, instance, profile):
+    """Applies a worker profile (CELERY_WORKER_PROFILE) before the worker reads its options."""
+    if profile not in DEFAULTS['WORKLOADS']:
+        raise ValueError(f"Unknown worker profile {profile!r}; expected one of {', '.join(DEFAULTS['WORKLOADS'])}")
+    spec = workload(profile)
+    conf.worker_concurrency = spec['concurrency']
+    conf.worker_prefetch_multiplier = spec['prefetch_multiplier']
+    instance.app.amqp.queues.select(workload_queues(profile))
@@ -1,5 +1,6 @@
 import os
 from celery import Celery
+from celery.signals import celeryd_init, task_postrun, task_prerun
 
 # Set default Django settings module
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'iam_backend.settings')
@@ -10,4 +11,23 @@ app = Celery('iam_backend')
 app.config_from_object('django.conf:settings', namespace='CELERY')
 
 # Auto-discover tasks in your installed apps
-app.autodiscover_tasks()
\ No newline at end of file
+app.autodiscover_tasks()
+
+# Worker profiles: CELERY_WORKER_PROFILE=sync-full celery -A iam_backend worker
+@celeryd_init.connect
+def configure_worker_profile(conf=None, instance=None, **kwargs):
+    profile = os.environ.get('CELERY_WORKER_PROFILE')
+    if profile:
+        from core.workloads import configure_worker
+        configure_worker(conf, instance, profile)
+
+
+# Persistent connections: drop ones past CONN_MAX_AGE or broken, like Django does around requests.
+# Eager tasks run inside the caller's connection (and maybe its transaction), so they are left alone.
+@task_prerun.connect
+@task_postrun.connect
+def close_old_connections(task=None, **kwargs):
+    if task is not None and getattr(task.request, 'is_eager', False):
+        return
+    from django.db import close_old_connections
+    close_old_connections()
@@ -10,8 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/6.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 from datetime import timedelta
+from corsheaders.defaults import default_headers
+from kombu import Queue
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -52,6 +55,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'core.compression.CompressionMiddleware', # brotli/gzip by Accept-Encoding (see API_COMPRESSION)
+    'core.profiling.RequestProfilingMiddleware', # No-op unless API_PROFILING is enabled
     'corsheaders.middleware.CorsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -59,6 +64,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.replicas.ReplicaPinMiddleware', # Read-your-writes: reads go to the primary for a while after a write
 ]
 
 ROOT_URLCONF = 'iam_backend.urls'
@@ -84,15 +90,51 @@ WSGI_APPLICATION = 'iam_backend.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
 
-DATABASES = {
-    'default': {
+# Connections are kept open for DB_CONN_MAX_AGE seconds and health-checked before reuse, in the
+# web and the Celery workers (see iam_backend/celery.py). DB_POOL=1 uses psycopg's connection pool
+# instead (needs `psycopg[pool]`; Django requires CONN_MAX_AGE=0 with it).
+# DB_REPLICAS is a comma-separated list of host[:port][/name] read replicas, e.g.
+# "localhost:5432/sentinel_replica" to try it with a second local database (see core/replicas.py).
+def _database(host, port, name):
+    database = {
         'ENGINE': 'django.db.backends.postgresql',
-        'NAME': 'sentinel_db',
-        'USER': 'sentinel_user',
-        'PASSWORD': 'sentinel_password',  # Use environment variables here later!
-        'HOST': 'localhost',
-        'PORT': '5432',
+        'NAME': name,
+        'USER': os.environ.get('DB_USER', 'sentinel_user'),
+        'PASSWORD': os.environ.get('DB_PASSWORD', 'sentinel_password'),
+        'HOST': host,
+        'PORT': port,
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': True,
     }
+    if os.environ.get('DB_POOL') == '1':
+        from psycopg_pool import ConnectionPool
+        database['CONN_MAX_AGE'] = 0
+        database['OPTIONS'] = {'pool': {
+            'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', 2)),
+            'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', 10)),
+            'timeout': 10,
+            'check': ConnectionPool.check_connection,  # Health check when a connection is handed out
+        }}
+    return database
+
+
+DB_NAME = os.environ.get('DB_NAME', 'sentinel_db')
+DATABASES = {
+    'default': _database(os.environ.get('DB_HOST', 'localhost'), os.environ.get('DB_PORT', '5432'), DB_NAME),
+}
+for _index, _replica in enumerate(filter(None, os.environ.get('DB_REPLICAS', '').split(',')), start=1):
+    _address, _, _name = _replica.strip().partition('/')
+    _host, _, _port = _address.partition(':')
+    DATABASES[f'replica{_index}'] = {
+        **_database(_host, _port or '5432', _name or DB_NAME),
+        'TEST': {'MIRROR': 'default'},  # Tests see the primary's data through the replica alias
+    }
+
+DATABASE_ROUTERS = ['core.replicas.ReplicaRouter']
+
+# Read-replica routing (see core/replicas.py for the defaults)
+REPLICA_ROUTING = {
+    'PIN_SECONDS': 15,
 }
 
 
@@ -139,6 +181,8 @@ CORS_ALLOWED_ORIGINS = [
 
 CORS_ALLOW_CREDENTIALS = True
 
+CORS_ALLOW_HEADERS = (*default_headers, 'x-profile')
+
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
@@ -147,8 +191,34 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.AllowAny', # IsAuthenticated
     ),
+    # orjson-backed when installed, DRF's stdlib JSON otherwise (see core/renderers.py)
+    'DEFAULT_RENDERER_CLASSES': (
+        'core.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'core.renderers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
 }
 
+# Response compression (see core/compression.py for the defaults); brotli needs `pip install brotli`
+API_COMPRESSION = {
+    'MIN_SIZE': 1024,
+    'BROTLI_QUALITY': 5,
+}
+
+# Request profiling: send "X-Profile: 1" to get Server-Timing headers (see core/profiling.py)
+API_PROFILING = {
+    'ENABLED': DEBUG,
+    'CPROFILE_DIR': None,  # e.g. BASE_DIR / 'profiles' to sample slow requests with cProfile
+    'SLOW_REQUEST_MS': 500,
+}
+
+# /metrics is readable by staff sessions and by scrapers sending "Authorization: Bearer <METRICS_TOKEN>"
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
@@ -163,7 +233,115 @@ CELERY_RESULT_BACKEND = 'redis://localhost:6379/0'
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
+# Shared by every web worker: the owners of cloud writes answered with 202 (IAMPolicyViewSet.task)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': 'redis://localhost:6379/1',
+    }
+}
 CELERY_TIMEZONE = 'CET'
+# Celery closes Django's connections around every task; only recycle them every 1000 tasks and let
+# CONN_MAX_AGE and the health checks decide otherwise (close_old_connections in iam_backend/celery.py)
+CELERY_DB_REUSE_MAX = 1000
+# Lets follow-up work (e.g. the service-access analysis) be queued at a lower priority than syncs.
+# With Redis, 0 is the highest priority and 9 the lowest.
+CELERY_BROKER_TRANSPORT_OPTIONS = {
+    'priority_steps': list(range(10)),
+    'sep': ':',
+    'queue_order_strategy': 'priority',
+    # acks_late tasks are redelivered if not acknowledged within this; keep it above the longest time limit
+    'visibility_timeout': 7200,
+}
+
+# One queue per workload class (see core/workloads.py), and per cloud provider for syncs.
+# A worker without -Q consumes all of them; CELERY_WORKER_PROFILE=<workload> runs one workload.
+CELERY_TASK_DEFAULT_QUEUE = 'celery'
+CELERY_TASK_QUEUES = [
+    Queue('celery'),
+    Queue('interactive'),
+    Queue('sync.aws.incremental'),
+    Queue('sync.azure.incremental'),
+    Queue('sync.gcp.incremental'),
+    Queue('sync.aws.full'),
+    Queue('sync.azure.full'),
+    Queue('sync.gcp.full'),
+    Queue('rescan'),
+    Queue('analytics'),
+]
+CELERY_TASK_ROUTES = ['core.workloads.route_task']
+CELERY_TASK_ANNOTATIONS = ['core.workloads.WorkloadAnnotations']
+
+# Workload classes: time limits, acks_late, and the concurrency/prefetch of their workers
+TASK_WORKLOADS = {
+    'INTERACTIVE_WAIT': 5,
+    'LONG_SYNC_SECONDS': 300,
+    'WORKLOADS': {
+        'sync-full': {'concurrency': 2},
+    },
+}
+
+# Celery beat: the adaptive scheduler decides which accounts are due each tick
+CELERY_BEAT_SCHEDULE = {
+    'schedule-cloud-syncs': {
+        'task': 'core.tasks.schedule_syncs',
+        'schedule': 60.0,
+    },
+    'maintain-findings-history': {
+        'task': 'core.tasks.maintain_findings_history',
+        'schedule': 3600.0,
+    },
+    'rescan-documents': {
+        'task': 'core.tasks.rescan_documents',
+        'schedule': 3600.0,
+    },
+}
+
+# Adaptive sync scheduler (see core/scheduler.py for the defaults)
+SYNC_SCHEDULER = {
+    'TICK_SECONDS': 60,  # Keep in sync with the beat schedule above
+    'MIN_INTERVAL': 900,
+    'MAX_INTERVAL': 86400,
+    'MAX_IN_FLIGHT_PER_PROVIDER': {'aws': 10, 'azure': 10, 'gcp': 10},
+    'MAX_IN_FLIGHT_PER_TENANT': 3,
+}
+
+# Sync pipeline stages (see core/pipeline.py for the defaults)
+SYNC_PIPELINE = {
+    'QUEUE_SIZE': 1000,
+    'BATCH_SIZE': 200,
+    'SCAN_WORKERS': 2,  # Per Celery worker process; 0 scans in the worker itself
+}
+
+# Accounts that enumerate their member accounts / subscriptions / projects (see core/targets.py)
+SYNC_TARGETS = {
+    'WORKERS': 8,  # Targets crawled at once per sync
+    'RATE': 100,   # API requests per second shared by all of an account's targets
+}
+
+# Snapshot ingestion for air-gapped accounts (see core/snapshots.py); `pip install ijson` to stream large dumps
+SNAPSHOT_INGESTION = {
+    'UPLOAD_DIR': BASE_DIR / 'snapshots',  # Must be readable by the sync-full workers
+}
+
+# Compressed policy document storage (see core/storage.py); `pip install zstandard`, then
+# `manage.py compress_documents --train` once documents are stored
+DOCUMENT_STORAGE = {
+    'MODE': 'zstd',  # 'json' stores new values uncompressed; existing ones stay readable
+    'LEVEL': 3,
+}
+
+# Unused-permission analysis (see core/access.py for the defaults)
+SERVICE_ACCESS = {
+    'UNUSED_DAYS': 90,
+    'MAX_IN_FLIGHT': 50,
+}
+
+# Findings history retention (see core/history.py for the defaults)
+FINDINGS_HISTORY = {
+    'RETENTION_MONTHS': 13,
+    'DAILY_ROLLUP_DAYS': 400,
+}
 
 
 
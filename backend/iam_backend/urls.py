@@ -1,8 +1,8 @@
 from django.contrib import admin
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from core.views import CloudAccountViewSet, IAMPolicyViewSet
-from core.views import RegisterView
+from core.views import CloudAccountViewSet, IAMPolicyViewSet, EffectivePermissionViewSet, EscalationPathViewSet, FindingTrendViewSet, UnusedPermissionViewSet
+from core.views import RegisterView, metrics_view
 from rest_framework_simplejwt.views import (
     TokenObtainPairView,
     TokenRefreshView,
@@ -11,6 +11,10 @@ from rest_framework_simplejwt.views import (
 router = DefaultRouter()
 router.register(r'accounts', CloudAccountViewSet, basename='cloudaccount')
 router.register(r'policies', IAMPolicyViewSet, basename='iampolicy')
+router.register(r'permissions', EffectivePermissionViewSet, basename='permissions')
+router.register(r'escalation', EscalationPathViewSet, basename='escalation')
+router.register(r'trends', FindingTrendViewSet, basename='trends')
+router.register(r'unused', UnusedPermissionViewSet, basename='unused')
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -20,4 +24,5 @@ urlpatterns = [
     path('api/auth/register/', RegisterView.as_view(), name='auth_register'),
     path('api/auth/login/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('api/auth/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('metrics', metrics_view, name='metrics'),
 ]
\ No newline at end of file
@@ -11,10 +11,36 @@ const getAuthToken = () => {
   return localStorage.getItem('access');
 };
 
+// The backend answers 202 when the cloud provider is slow; the write goes on
+// in the background and its state is polled from `status_url`
+const POLL_INTERVAL_MS = 1000;
+const POLL_TIMEOUT_MS = 60000;
+
+const waitForTask = async (statusUrl: string): Promise<boolean> => {
+  const token = getAuthToken();
+  const deadline = Date.now() + POLL_TIMEOUT_MS;
+  while (Date.now() < deadline) {
+    await new Promise(resolve => setTimeout(resolve, POLL_INTERVAL_MS));
+    const response = await fetch(statusUrl, {
+      credentials: 'include',
+      headers: { 'Authorization': `Bearer ${token}` },
+    });
+    if (!response.ok) {
+      throw new Error('Failed to check the cloud provider\'s progress');
+    }
+    const task = await response.json();
+    if (task.accepted !== undefined) {
+      return task.accepted;
+    }
+  }
+  throw new Error('The cloud provider is still applying the change; check back after the next sync');
+};
+
 // 1. GET all policies for the current user
 export const getPolicies = async (): Promise<IAMPolicy[]> => {
   const token = getAuthToken();
   const response = await fetch(`${API_URL}/policies/`, {
+    credentials: 'include', // Sends the backend's read-your-writes cookie after an edit
     headers: {
       'Content-Type': 'application/json',
       'Authorization': `Bearer ${token}`,
@@ -33,6 +59,7 @@ export const updatePolicy = async (id: number | string, updatedDoc: object): Pro
   const token = getAuthToken();
   const response = await fetch(`${API_URL}/policies/${id}/`, {
     method: 'PATCH', // Using PATCH to only update the document
+    credentials: 'include',
     headers: {
       'Content-Type': 'application/json',
       'Authorization': `Bearer ${token}`,
@@ -46,6 +73,22 @@ export const updatePolicy = async (id: number | string, updatedDoc: object): Pro
     throw new Error(errorData.error || 'Failed to update policy');
   }
 
+  if (response.status === 202) {
+    const { status_url } = await response.json();
+    if (!(await waitForTask(status_url))) {
+      throw new Error('Cloud provider rejected the policy update (Check ARN/Permissions)');
+    }
+    // The background write stored the document; read the updated policy back
+    const updated = await fetch(`${API_URL}/policies/${id}/`, {
+      credentials: 'include',
+      headers: { 'Authorization': `Bearer ${token}` },
+    });
+    if (!updated.ok) {
+      throw new Error('Failed to fetch the updated policy');
+    }
+    return updated.json();
+  }
+
   return response.json();
 };
 
@@ -54,6 +97,7 @@ export const deletePolicy = async (id: number | string): Promise<void> => {
   const token = getAuthToken();
   const response = await fetch(`${API_URL}/policies/${id}/`, {
     method: 'DELETE',
+    credentials: 'include',
     headers: {
       'Authorization': `Bearer ${token}`,
     },
@@ -64,5 +108,12 @@ export const deletePolicy = async (id: number | string): Promise<void> => {
     throw new Error(errorData.error || 'Failed to delete policy');
   }
 
+  if (response.status === 202) {
+    const { status_url } = await response.json();
+    if (!(await waitForTask(status_url))) {
+      throw new Error('Failed to delete from cloud');
+    }
+  }
+
   // No content is returned on a successful delete (204)
 };